@@ -13,6 +13,7 @@ __licence__ = 'LGPL'
 __url__ = 'www.cellcognition.org'
 
 from os.path import join
+from functools import partial
 from collections import OrderedDict
 import numpy as np
 
@@ -22,6 +23,7 @@ from cecog.analyzer.channel import SecondaryChannel
 from cecog.analyzer.channel import TertiaryChannel
 from cecog.analyzer.channel import MergedChannel
 from cecog.analyzer.object import ObjectHolder
+from cecog.analyzer.scheduler import Stage, StageScheduler
 
 from cecog.logging import LoggerObject
 from cecog.util.util import makedirs
@@ -31,7 +33,7 @@ from cecog.colors import hex2rgb
 class CellAnalyzer(LoggerObject):
 
     def __init__(self, timeholder, position, create_images, binning_factor,
-                 detect_objects):
+                 detect_objects, nthreads=1):
 
         super(CellAnalyzer, self).__init__()
 
@@ -43,6 +45,7 @@ class CellAnalyzer(LoggerObject):
 
         self._iT = None
         self._channel_registry = OrderedDict()
+        self.scheduler = StageScheduler(nthreads)
 
     def initTimepoint(self, iT):
         self._channel_registry.clear()
@@ -79,38 +82,90 @@ class CellAnalyzer(LoggerObject):
                 channels[name] =  channel
         return channels
 
+    def _required_channels(self, channel):
+        """Names of the channels whose segmentation is required by the
+        segmentation plugins of a channel (plugin REQUIRES)."""
+        managers = dict((c.plugin_mgr.name, c.NAME)
+                        for c in self._channel_registry.itervalues()
+                        if c.plugin_mgr is not None)
+        if channel.plugin_mgr is None:
+            return []
+        return [managers[m] for m in channel.plugin_mgr.required_managers()
+                if m in managers and managers[m] != channel.NAME]
+
+    def _segmentation_stage(self, channel):
+        """Return the function and the required stages of the segmentation
+        of a channel."""
+        registry = self._channel_registry
+        cnames = registry.keys()
+        primary_channel = registry.get(PrimaryChannel.NAME)
+        secondary_channel = registry.get(SecondaryChannel.NAME)
+
+        apply_segmentation = self.timeholder.apply_segmentation
+        requires = ["segment:%s" %name
+                    for name in self._required_channels(channel)]
+
+        if channel.NAME == PrimaryChannel.NAME:
+            func = partial(apply_segmentation, channel)
+        elif channel.NAME == SecondaryChannel.NAME:
+            func = partial(apply_segmentation, channel, primary_channel)
+        elif channel.NAME == TertiaryChannel.NAME:
+            if SecondaryChannel.NAME not in cnames:
+                raise RuntimeError(("Tertiary channel requiers a "
+                                    "secondary channel"))
+            func = partial(apply_segmentation, channel,
+                           primary_channel, secondary_channel)
+        elif channel.NAME == MergedChannel.NAME:
+            def func():
+                channel.meta_image = primary_channel.meta_image
+                apply_segmentation(channel, registry)
+            # the merged channel shares the image and containers of the
+            # primary channel
+            requires = ["prepare:%s" %PrimaryChannel.NAME,
+                        "segment:%s" %PrimaryChannel.NAME]
+        else:
+            raise ValueError(
+                "Channel with name '%s' not supported." % channel.NAME)
+
+        return func, requires
+
+    def stages(self, extract_features=True):
+        """Processing stages of the channels of a frame. Image preparation
+        of different channels is independent, segmentation depends on the
+        segmentation of the channels required by the plugins and feature
+        extraction on the segmentation (the merged channel on the features
+        of its sub channels)."""
+        stages = []
+        for channel in sorted(self._channel_registry.values()):
+            name = channel.NAME
+            stages.append(Stage("prepare:%s" %name,
+                                partial(self.timeholder.prepare_raw_image,
+                                        channel)))
+            if not self.detect_objects:
+                continue
+
+            func, requires = self._segmentation_stage(channel)
+            stages.append(Stage("segment:%s" %name, func,
+                                ["prepare:%s" %name] + requires))
+
+            if extract_features:
+                requires = ["segment:%s" %name]
+                if channel.is_virtual():
+                    requires.extend("features:%s" %cname
+                                    for cname in channel.merge_regions)
+                stages.append(Stage("features:%s" %name,
+                                    partial(self.timeholder.apply_features,
+                                            channel), requires))
+        return stages
+
     def process(self, apply=True, extract_features=True):
-        """Perform the segmentation and feature extraction."""
-        channels = sorted(self._channel_registry.values())
-        primary_channel = None
-
-        cnames = [c.NAME for c in channels]
-        for channel in channels:
-            self.timeholder.prepare_raw_image(channel)
-            if self.detect_objects:
-                if channel.NAME == PrimaryChannel.NAME:
-                    self.timeholder.apply_segmentation(channel)
-                    primary_channel = channel
-                elif channel.NAME == SecondaryChannel.NAME:
-                    self.timeholder.apply_segmentation(channel, primary_channel)
-                    secondary_channel = channel
-                elif channel.NAME == TertiaryChannel.NAME:
-                    if SecondaryChannel.NAME not in cnames:
-                        raise RuntimeError(("Tertiary channel requiers a "
-                                            "secondary channel"))
-                    self.timeholder.apply_segmentation(channel,
-                                                       primary_channel,
-                                                       secondary_channel)
-                elif channel.NAME == MergedChannel.NAME:
-                    channel.meta_image = primary_channel.meta_image
-                    self.timeholder.apply_segmentation(
-                        channel, self._channel_registry)
-                else:
-                    raise ValueError(
-                        "Channel with name '%s' not supported." % channel.NAME)
-
-                if extract_features:
-                    self.timeholder.apply_features(channel)
+        """Perform the segmentation and feature extraction. Independent
+        stages of different channels run concurrently if nthreads > 1."""
+
+        self.scheduler.run(self.stages(extract_features))
+        self.logger.info("Stages [P %s, T %05d]: %s"
+                         %(self.P, self._iT, ", ".join(
+                    ["%s %.3fs" %st for st in self.scheduler.timings.items()])))
 
         if apply:
             # want apply also the pseudo channels
@@ -14,15 +14,16 @@ __date__ = '$Date$'
 __revision__ = '$Rev$'
 __source__ = '$URL$'
 
-__all__ = ["PrimaryChannel", "SecondaryChannel", "TertiaryChannel"
-           "MergedChannel"]
+__all__ = ["PrimaryChannel", "SecondaryChannel", "TertiaryChannel",
+           "MergedChannel", "RestoredChannel"]
 
-from os.path import join, isdir
+from os.path import join, isdir, getmtime
 import glob
 import copy
 import types
+import threading
 import numpy
-
+from collections import OrderedDict
 
 from cecog import ccore
 from cecog.colors import Colors
@@ -33,6 +34,12 @@ from cecog.logging import LoggerObject
 from cecog.plugin.metamanager import MetaPluginManager
 from cecog.util.ctuple import COrderedDict
 
+# flat field gain images per process, see Channel._flatfield_gain
+FLATFIELD_CACHE_SIZE = 8
+_flatfield_gains = OrderedDict()
+_flatfield_paths = {}
+_flatfield_lock = threading.Lock()
+
 
 class ChannelCore(LoggerObject):
 
@@ -276,7 +283,7 @@ class Channel(ChannelCore):
             self._regions[region_name] = object_holder
 
 
-    def _load_flatfield_correction_image(self, plate):
+    def _flatfield_correction_path(self, plate):
         if not isdir(str(self.strBackgroundImagePath)):
             raise IOError("No z-slice correction image directory set")
 
@@ -291,9 +298,14 @@ class Channel(ChannelCore):
         elif len(path) == 0:
             raise IOError("No z-slice flat field corr. images found. in %s\n"
                           "Directory must contain only one file per plate\n" % self.strBackgroundImagePath)
+        return path[0]
+
+    def _load_flatfield_correction_image(self, plate, path=None):
+        if path is None:
+            path = self._flatfield_correction_path(plate)
         try:
             # ccore need str not unicode
-            bg_image = ccore.readImageFloat(str(path[0]))
+            bg_image = ccore.readImageFloat(str(path))
         except Exception, e:
             # catching all errors, even files that are no images
             raise IOError(("Z-slice flat field correction image could not be "
@@ -302,24 +314,70 @@ class Channel(ChannelCore):
 
         return bg_image
 
+    def _flatfield_gain(self, plate):
+        """Return the gain image of the flat field correction, i.e. the mean
+        of the (cropped) background image divided by the background image.
+
+        Gain images are cached per process, keyed by the path of the
+        background image, plate, crop window and mtime of the file.
+        """
+        crop = MetaImage.get_crop_coordinates()
+        if crop is not None:
+            crop = tuple(crop)
+
+        # channels are processed by several threads (CellAnalyzer.process)
+        with _flatfield_lock:
+            pkey = (self.strBackgroundImagePath, plate)
+            path = _flatfield_paths.get(pkey)
+            try:
+                mtime = getmtime(path)
+            except (OSError, TypeError):
+                path = _flatfield_paths[pkey] = \
+                    self._flatfield_correction_path(plate)
+                mtime = getmtime(path)
+
+            key = (path, plate, crop, mtime)
+            try:
+                gain = _flatfield_gains.pop(key)
+            except KeyError:
+                gain = self._compute_flatfield_gain(plate, path, crop)
+                while len(_flatfield_gains) >= FLATFIELD_CACHE_SIZE:
+                    _flatfield_gains.popitem(last=False)
+            # most recently used at the end
+            _flatfield_gains[key] = gain
+        return gain
+
+    def _compute_flatfield_gain(self, plate, path, crop):
+        self.logger.debug("* loading flat field correction image %s" %path)
+        imgBackground = self._load_flatfield_correction_image(plate, path)
+
+        if crop is not None:
+            self.logger.debug("* applying cropping to background image")
+            imgBackground = ccore.subImage(imgBackground,
+                                           ccore.Diff2D(crop[0], crop[1]),
+                                           ccore.Diff2D(crop[2], crop[3]))
+
+        background = imgBackground.toArray(True).astype(numpy.float32)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            gain = numpy.float32(background.mean(dtype=numpy.float64))/background
+        return gain
+
     def normalize_image(self, plate_id=None):
 
         img_in = self.meta_image.image
         if self.bFlatfieldCorrection:
             self.logger.debug("* using flat field correction with image from %s"
                               % self.strBackgroundImagePath)
-            imgBackground = self._load_flatfield_correction_image(plate_id)
-
-            crop_coordinated = MetaImage.get_crop_coordinates()
-            if crop_coordinated is not None:
-                self.logger.debug("* applying cropping to background image")
-                imgBackground = ccore.subImage(imgBackground,
-                                               ccore.Diff2D(crop_coordinated[0],
-                                                            crop_coordinated[1]),
-                                               ccore.Diff2D(crop_coordinated[2],
-                                                            crop_coordinated[3]))
-
-            img_in = ccore.flatfieldCorrection(img_in, imgBackground, 0.0, True)
+            gain = self._flatfield_gain(plate_id)
+
+            image = img_in.toArray()
+            if image.shape != gain.shape:
+                raise IOError(("Size of the flat field correction image %s "
+                               "does not match the image size %s"
+                               %(gain.shape, image.shape)))
+
+            corrected = numpy.multiply(image, gain, dtype=numpy.float32)
+            img_in = ccore.numpy_to_image(corrected, True)
             img_out = ccore.linearTransform2(img_in, self.fNormalizeMin,
                                              self.fNormalizeMax, 0, 255, 0, 255)
         else:
@@ -488,3 +546,34 @@ class MergedChannel(ChannelCore):
 
     def apply_binning(self, *args, **kw):
         pass
+
+
+class RestoredChannel(object):
+    """Objects of a frame that were read back from a cellh5 file of a previous
+    run. No images, segmentation or features, only the object holders of the
+    regions."""
+
+    def __init__(self, name):
+        super(RestoredChannel, self).__init__()
+        self.NAME = name
+        self.PREFIX = name.lower()
+        self._regions = {}
+
+    @classmethod
+    def is_virtual(cls):
+        return False
+
+    def add_region(self, name, holder):
+        self._regions[name] = holder
+
+    def region_names(self):
+        return self._regions.keys()
+
+    def get_region(self, name):
+        return self._regions[name]
+
+    def has_region(self, name):
+        return self._regions.has_key(name)
+
+    def purge(self, features=None):
+        pass
@@ -15,6 +15,10 @@ __url__ = 'www.cellcognition.org'
 
 __all__ = ("EventSelection", )
 
+import sys
+import math
+import heapq
+import multiprocessing
 import numpy as np
 from collections import defaultdict
 
@@ -22,19 +26,29 @@ from cecog.logging import LoggerObject
 from cecog.analyzer.tracker import Tracker
 
 
-# TODO: Recursion limit has to be set higher than 1000,
-#       due to the current implementation of _forward_visitor(),
-#       which calls for 'full' tracks itself recursively for each
-#       node_id. In case of long time_lapse movies this might be
-#       more than 1000 (default python rec limit)
-import sys
-sys.setrecursionlimit(10000)
+# smaller graphs are not worth starting worker processes
+PARALLEL_MIN_NODES = 20000
+
+# (selection, compact graph, labels) of the running find_events, the
+# worker processes inherit it by fork
+_worker_args = None
+
+
+def _find_events_worker(start_ids):
+    selection, graph, labels = _worker_args
+    return selection._find_events(start_ids, graph, labels)
+
 
 class EventSelectionCore(LoggerObject):
     """Parent for all transition based event selection classes."""
+
+    # class label of unclassified samples in label arrays
+    NO_LABEL = np.iinfo(np.int64).min
+
     def __init__(self, graph, transitions, forward_range, backward_range,
                  forward_labels, backward_labels, forward_check, backward_check,
-                 max_in_degree, max_out_degree, allow_one_daughter_cell):
+                 max_in_degree, max_out_degree, allow_one_daughter_cell,
+                 processes=1):
         super(EventSelectionCore, self).__init__()
 
         self.graph = graph
@@ -48,6 +62,10 @@ class EventSelectionCore(LoggerObject):
         self.max_in_degree = max_in_degree
         self.max_out_degree = max_out_degree
         self.allow_one_daughter_cell = allow_one_daughter_cell
+        # number of worker processes, 1 for the sequential search (default)
+        # and None for one per cpu. Workers are forked, i.e. parallel search
+        # is opt-in for processes without other threads (e.g. no GUI).
+        self.processes = processes
         self.visitor_data = dict()
 
     def iterevents(self):
@@ -63,10 +81,10 @@ class EventSelectionCore(LoggerObject):
 
     def start_nodes(self):
         """Return all start nodes i.e. nodes without incoming edges."""
-        start_nodes = [node_id for node_id in self.graph.node_list()
-                       if self.graph.in_degree(node_id) == 0]
-        start_nodes.sort(key=lambda x: Tracker.split_nodeid(x)[0])
-        return start_nodes
+        nodes = np.array(self.graph.node_list(), dtype=np.int64)
+        nodes = nodes[self.graph.in_degrees(nodes) == 0]
+        frames = Tracker.split_nodeids(nodes)[0]
+        return nodes[np.argsort(frames, kind='mergesort')].tolist()
 
     def _is_transition(self, sample, sample2):
         """Test for label transitions."""
@@ -75,12 +93,24 @@ class EventSelectionCore(LoggerObject):
                 return True
         return False
 
+    def _class_labels(self, nodeids):
+        """Return the class labels of a sequence of nodes as int array."""
+        labels = [self.graph.node_data(nodeid).iLabel for nodeid in nodeids]
+        return np.array([self.NO_LABEL if l is None else l for l in labels],
+                        dtype=np.int64)
+
+    def _transitions(self, labels, successors):
+        """Vectorized _is_transition for arrays of class labels."""
+        trans = np.asarray(self.transitions, dtype=np.int64).reshape((-1, 2))
+        return ((labels[:, np.newaxis] == trans[:, 0]) &
+                (successors[:, np.newaxis] == trans[:, 1])).any(axis=1)
+
     def data_matrix(self):
         """Returns a matrix where the rows represent a sample and the column
         the corresponding feature vector.
         """
         data = []
-        nodes = np.array(self.graph.node_list(), dtype=str)
+        nodes = np.array(self.graph.node_list(), dtype=np.int64)
         for node in nodes:
             obj = self.graph.node_data(node)
             data.append(obj.aFeatures)
@@ -116,123 +146,277 @@ class EventSelectionCore(LoggerObject):
 
         start_ids = self.start_nodes()
         self.logger.debug("tracking: start nodes %d %s" % (len(start_ids), start_ids))
-        visited_nodes = defaultdict(lambda: False)
 
-        # linearaize full tracks
-        for start_id in start_ids:
-            self.logger.debug("root ID %s" %start_id)
+        graph = self.graph.compact()
+        labels = self._class_labels(graph.nodeids.tolist())
+
+        nprocs = self._nprocesses(len(graph))
+        if nprocs == 1:
+            self._find_events(start_ids, graph, labels)
+            return
+
+        # tracks of different connected components do not share any node,
+        # i.e. the components are processed independently
+        global _worker_args
+        _worker_args = (self, graph, labels)
+        try:
+            pool = multiprocessing.Pool(nprocs)
             try:
-                self.visitor_data[start_id] = {'_current_branch': 0, '_full_tracks' : [[]]}
-                self._linearize(start_id, self.visitor_data[start_id], visited_nodes)
-            except RuntimeError as e:
-                if e.message.startswith('maximum recursion'):
-                    raise RuntimeError(('linearization failed: maximum '
-                                        'recursion reached in _linearize()'))
-                else:
-                    raise
+                results = pool.map(_find_events_worker,
+                                   self._component_groups(start_ids, graph, 4*nprocs),
+                                   chunksize=1)
+            finally:
+                pool.terminate()
+                pool.join()
+        finally:
+            _worker_args = None
+
+        # merge in the order of the start nodes, as in the sequential case
+        results = dict(r for result in results for r in result)
+        for start_id in start_ids:
+            self.visitor_data[start_id] = results[start_id]
+
+    def _find_events(self, start_ids, graph, labels):
+        """Linearize the tracks of the start nodes and find the events,
+        returns a list of (start_id, results) pairs."""
+
+        # linearize the full tracks of all start nodes in one pass, nodes
+        # are visited by one track only
+        self._linearize_all(start_ids)
 
         # find events in these full tracks
         for start_id in start_ids:
             self.logger.debug("root ID %s" % start_id)
+            self._extract_events_from_linearized_tracks(
+                self.visitor_data[start_id], graph, labels)
+        return [(start_id, self.visitor_data[start_id]) for start_id in start_ids]
+
+    def _nprocesses(self, nnodes):
+        """Number of processes to use for a graph of nnodes."""
+        if self.processes == 1 or nnodes < PARALLEL_MIN_NODES:
+            return 1
+        # the workers inherit the graph by fork, which is not available on
+        # windows and in the (daemonic) workers of a multi-position analysis
+        if sys.platform.startswith('win') or \
+                multiprocessing.current_process().daemon:
+            return 1
+        return self.processes or multiprocessing.cpu_count()
+
+    def _component_groups(self, start_ids, graph, ngroups):
+        """Split the start nodes into at most ngroups lists of similar size,
+        start nodes of the same connected component end up in the same list.
+        The lists keep the order of start_ids."""
+        ncomps, comps = graph.components()
+        sizes = np.bincount(comps, minlength=ncomps)
+
+        # largest components first, each into the smallest group
+        heap = [(0, i) for i in xrange(min(ngroups, ncomps))]
+        group_of = np.empty((ncomps, ), dtype=np.int64)
+        for comp in np.argsort(-sizes, kind='mergesort').tolist():
+            size, group = heapq.heappop(heap)
+            group_of[comp] = group
+            heapq.heappush(heap, (size + sizes.item(comp), group))
+
+        start_ids = np.array(start_ids, dtype=np.int64)
+        groups = group_of[comps[graph.indices(start_ids)]]
+        return [start_ids[groups == i].tolist() for i in xrange(len(heap))]
+
+    def _linearize_all(self, start_ids):
+        """Linearize the tracks of all start nodes, sharing the visited
+        nodes between them."""
+        visited_nodes = defaultdict(lambda: False)
+        for start_id in start_ids:
+            self.logger.debug("root ID %s" %start_id)
+            self.visitor_data[start_id] = {'_current_branch': 0, '_full_tracks' : [[]]}
+            self._linearize(start_id, self.visitor_data[start_id], visited_nodes)
+
+    def _linearize(self, nodeid, results, visited_nodes):
+        """Record the full trajectory in a liniearized fashion.
+
+        Depth first traversal with an explicit stack, an entry holds the
+        branch index of a node, the branch length after the node was
+        appended and the iterator over the out-arcs of the node.
+        """
+        tracks = results['_full_tracks']
+        stack = []
+
+        def enter(nodeid):
+            # append node to the current branch
+            base = results['_current_branch']
+            tracks[base].append(nodeid)
+            stack.append((base, len(tracks[base]),
+                          enumerate(self.graph.out_arcs(nodeid))))
+
+        enter(nodeid)
+        while stack:
+            base, depth, arcs = stack[-1]
             try:
-                self._extract_events_from_linearized_tracks(self.visitor_data[start_id])
-            except RuntimeError as e:
-                if e.message.startswith('maximum recursion'):
-                    raise RuntimeError(('linearization failed: maximum '
-                                        'recursion reached in _linearize()'))
-                else:
-                    raise
-
-
-    def _linearize(self, nodeid, results, visited_nodes, level=0):
-        """Record the full trajectory in a liniearized fashion."""
-
-        # get current branch index
-        base = results['_current_branch']
-        # append current node to it
-        results['_full_tracks'][base].append(nodeid)
-        # get current track legnth
-        depth = len(results['_full_tracks'][base])
-        # iterate over all successors
-        for i, out_edgeid in enumerate(self.graph.out_arcs(nodeid)):
+                i, out_edgeid = arcs.next()
+            except StopIteration:
+                stack.pop()
+                continue
+
             tailid = self.graph.tail(out_edgeid)
             # check if node has been visited by other track already
-            if  not visited_nodes[tailid]:
+            if not visited_nodes[tailid]:
                 visited_nodes[tailid] = True
                 # make a copy of the list for the new branch(es)
                 if i > 0:
-                    results['_full_tracks'].append(results['_full_tracks'][base][:depth])
+                    tracks.append(tracks[base][:depth])
                     results['_current_branch'] += 1
-                # recurse
-                self._linearize(tailid, results, visited_nodes, level=level+1)
+                enter(tailid)
 
+    def _extract_events_from_linearized_tracks(self, tracks, graph=None,
+                                               labels=None):
+        """Find events in the linearized tracks of one start node.
+
+        graph is the CompactGraph of self.graph and labels the class labels
+        of its nodes. Transitions are searched on label arrays of each
+        branch, the backward and forward checks run on windows of the branch
+        and only fall back to the graph if a track leaves the branch.
+        """
+        if graph is None:
+            graph = self.graph.compact()
+            labels = self._class_labels(graph.nodeids.tolist())
 
-    def _extract_events_from_linearized_tracks(self, tracks):
         for each_branch in tracks['_full_tracks']:
+            if not each_branch:
+                continue
+            pos = graph.indices(each_branch)
+            outdeg = graph.out_deg[pos]
+            indeg = graph.in_deg[pos]
+            blabels = labels[pos]
+
+            # the successor of a node is the next node of the branch, the
+            # successor of the last node is not part of the branch
+            successors = np.empty_like(blabels)
+            successors[:-1] = blabels[1:]
+            successors[-1] = self.NO_LABEL
+            if outdeg[-1] == 1:
+                tailid = self.graph.tail(self.graph.out_arcs(each_branch[-1])[0])
+                successors[-1] = labels[graph.index(tailid)]
+
+            candidates = (outdeg == 1) & (indeg <= 1) & \
+                self._transitions(blabels, successors)
+
             t_idx = 0
-            while t_idx < len(each_branch):
+            for idx in np.flatnonzero(candidates).tolist():
+                if idx < t_idx:
+                    continue
+                t_idx = idx
                 nodeid = each_branch[t_idx]
-                degrees = (self.graph.out_degree(nodeid), self.graph.in_degree(nodeid))
-                if degrees in ((1, 1), (1, 0)):
-
-                    sample = self.graph.node_data(nodeid)
-                    successor = self.graph.node_data(self.graph.tail(self.graph.out_arcs(nodeid)[0]))
-
-                    if self._is_transition(sample, successor):
-                        is_candidate = True
-                        self.logger.debug("  found %6s" %nodeid)
-
-                        if is_candidate:
-                            backward_nodes = []
-                            is_candidate = self._backward_check(nodeid, backward_nodes)
-                            self.logger.debug("    %s - backwards %s    %s"
-                                              %(nodeid, {True: 'ok', False: 'failed'}[is_candidate],
-                                                backward_nodes))
-
-                        if is_candidate:
-                            forward_nodes = []
-                            tailid = self.graph.tail(self.graph.out_arcs(nodeid)[0])
-                            is_candidate = self._forward_check(tailid, forward_nodes)
-                            self.logger.debug("    %s - forwards %s    %s"
-                                                  %(tailid, {True: 'ok', False: 'failed'}[is_candidate], forward_nodes))
-
-                        if is_candidate:
-                            track_length = self.track_length
-                            backward_nodes.reverse()
-                            startid = backward_nodes[0]
-
-                            # searching for split events and linearize split tracks
-                            splits = self._split_nodes(forward_nodes)
-                            if len(splits) > 0:
-                                # take only the first split event
-                                first_split = splits[0]
-                                tracks_ = []
-                                for split in forward_nodes[first_split]:
-                                    track_nodes = backward_nodes + forward_nodes[:first_split] + split
-                                    if len(track_nodes) == track_length:
-                                        tracks_.append(track_nodes)
-
-                                for i, track in enumerate(tracks_):
-                                    new_start_id = '%s_%d' % (startid, i+1)
-                                    tracks[new_start_id] = {'splitId': forward_nodes[first_split-1],
-                                                             'eventId': nodeid,
-                                                             'maxLength': track_length,
-                                                             'tracks': [track],
-                                                             # keep value at which index the two daugther
-                                                             # tracks differ due to a split event
-                                                             'splitIdx' : first_split + len(backward_nodes)}
-                                    t_idx += track_length-1
-
-                            else:
-                                track_nodes = backward_nodes + forward_nodes
-                                tracks[startid] = {'splitId': None,
-                                                    'eventId': nodeid,
-                                                    'maxLength': track_length,
-                                                    'tracks': [track_nodes]}
-                                t_idx += track_length - 1
-                            self.logger.debug("  %s - valid candidate" %startid)
+                self.logger.debug("  found %6s" %nodeid)
+
+                backward_nodes = []
+                is_candidate = self._backward_window(
+                    each_branch, t_idx, indeg, outdeg, blabels, backward_nodes)
+                self.logger.debug("    %s - backwards %s    %s"
+                                  %(nodeid, {True: 'ok', False: 'failed'}[is_candidate],
+                                    backward_nodes))
+
+                if is_candidate:
+                    forward_nodes = []
+                    tailid = self.graph.tail(self.graph.out_arcs(nodeid)[0])
+                    is_candidate = self._forward_window(
+                        each_branch, t_idx, indeg, outdeg, blabels, forward_nodes)
+                    self.logger.debug("    %s - forwards %s    %s"
+                                      %(tailid, {True: 'ok', False: 'failed'}[is_candidate], forward_nodes))
+
+                if is_candidate:
+                    track_length = self.track_length
+                    backward_nodes.reverse()
+                    startid = backward_nodes[0]
+
+                    # searching for split events and linearize split tracks
+                    splits = self._split_nodes(forward_nodes)
+                    if len(splits) > 0:
+                        # take only the first split event
+                        first_split = splits[0]
+                        tracks_ = []
+                        for split in forward_nodes[first_split]:
+                            track_nodes = backward_nodes + forward_nodes[:first_split] + split
+                            if len(track_nodes) == track_length:
+                                tracks_.append(track_nodes)
+
+                        for i, track in enumerate(tracks_):
+                            new_start_id = (startid, i+1)
+                            tracks[new_start_id] = {'splitId': forward_nodes[first_split-1],
+                                                     'eventId': nodeid,
+                                                     'maxLength': track_length,
+                                                     'tracks': [track],
+                                                     # keep value at which index the two daugther
+                                                     # tracks differ due to a split event
+                                                     'splitIdx' : first_split + len(backward_nodes)}
+                            t_idx += track_length-1
+
+                    else:
+                        track_nodes = backward_nodes + forward_nodes
+                        tracks[startid] = {'splitId': None,
+                                            'eventId': nodeid,
+                                            'maxLength': track_length,
+                                            'tracks': [track_nodes]}
+                        t_idx += track_length - 1
+                    self.logger.debug("  %s - valid candidate" %startid)
                 t_idx += 1
 
+    def _backward_window(self, branch, idx, indeg, outdeg, labels, nodeids):
+        """_backward_check of the node branch[idx] on the arrays of the
+        branch. A backward track never leaves the branch, since the branch
+        starts with the first node of the track."""
+        stop_range = bool(self.backward_range_min)
+        nlevels = idx + 1
+        if not stop_range and self.backward_range > 0:
+            nlevels = min(nlevels, int(math.ceil(self.backward_range)))
+        levels = np.arange(1, nlevels+1)
+        rows = idx + 1 - levels
+        ind = indeg[rows]
+        outd = outdeg[rows]
+
+        done = ((self.backward_range == -1) & (ind == 0)) | \
+            (stop_range & (levels >= self.backward_range) & (ind == 0)) | \
+            ((not stop_range) & (levels >= self.backward_range))
+        failed = (outd != 1) | (ind != 1) | \
+            ((levels > 1) & (levels-1 <= self.backward_check) &
+             ~np.in1d(labels[rows], self.backward_labels))
+
+        # the first node of a branch has no predecessor, i.e. it fails
+        # if it does not end the track
+        last = int(np.argmax(done | failed))
+        nodeids.extend(branch[idx-last:idx+1][::-1])
+        return bool(done[last])
+
+    def _forward_window(self, branch, idx, indeg, outdeg, labels, nodeids):
+        """_forward_check of the successor of branch[idx] on the arrays of
+        the branch. Falls back to _forward_check if the track splits or
+        continues beyond the branch."""
+        stop_range = bool(self.forward_range_min)
+        end = len(branch)
+        if not stop_range and self.forward_range > 0:
+            end = min(end, idx + 1 + int(math.ceil(self.forward_range)))
+        rows = np.arange(idx+1, end)
+        levels = rows - idx
+        ind = indeg[rows]
+        outd = outdeg[rows]
+
+        done = ((self.forward_range == -1) & (outd == 0)) | \
+            (stop_range & (levels >= self.forward_range) & (outd == 0)) | \
+            ((not stop_range) & (levels >= self.forward_range))
+        failed = (ind > self.max_in_degree) | (outd > self.max_out_degree) | \
+            (outd == 0) | ((levels <= self.forward_check) &
+                           ~np.in1d(labels[rows], self.forward_labels))
+        split = (outd > 1) & (outd <= self.max_out_degree)
+
+        stop = done | failed | split
+        if stop.any():
+            last = int(np.argmax(stop))
+            if done[last] or failed[last]:
+                nodeids.extend(branch[idx+1:idx+last+2])
+                return bool(done[last])
+
+        nodeid = branch[idx]
+        tailid = self.graph.tail(self.graph.out_arcs(nodeid)[0])
+        return self._forward_check(tailid, nodeids)
+
     def _forward_check(self, *args, **kw):
         raise NotImplementedError
 
@@ -246,83 +430,95 @@ class EventSelection(EventSelectionCore):
                  forward_labels, backward_labels,
                  export_features=False, max_in_degree=1, max_out_degree=1,
                  backward_check=False, forward_check=False, backward_range_min=-1,
-                 forward_range_min=-1, allow_one_daughter_cell=True):
+                 forward_range_min=-1, allow_one_daughter_cell=True,
+                 processes=1):
         super(EventSelection, self).__init__( \
             graph, transitions, forward_range, backward_range, forward_labels,
             backward_labels, forward_check, backward_check, max_in_degree,
-            max_out_degree, allow_one_daughter_cell)
+            max_out_degree, allow_one_daughter_cell, processes)
 
         self.backward_range_min = backward_range_min
         self.forward_range_min = forward_range_min
         self.export_features = export_features
 
     def _backward_check(self, nodeid, nodeids, level=1):
-        nodeids.append(nodeid)
-        if ((self.backward_range == -1 and self.graph.in_degree(nodeid) == 0) or
-            (self.backward_range_min and level >= self.backward_range and  \
-                 self.graph.in_degree(nodeid) == 0) or
-            (not self.backward_range_min  and level >= self.backward_range)):
-            return True
-
-        # check for splits
-        if self.graph.out_degree(nodeid) != 1:
-            return False
-        if self.graph.in_degree(nodeid) != 1:
-            return False
-
-        sample = self.graph.node_data(nodeid)
-        if level > 1 and level-1 <= self.backward_check and not \
-                sample.iLabel in self.backward_labels:
-            return False
-
-        edgeid = self.graph.in_arcs(nodeid)[0]
-        headid = self.graph.head(edgeid)
-        return self._backward_check(headid, nodeids, level=level+1)
+        while True:
+            nodeids.append(nodeid)
+            if ((self.backward_range == -1 and self.graph.in_degree(nodeid) == 0) or
+                (self.backward_range_min and level >= self.backward_range and  \
+                     self.graph.in_degree(nodeid) == 0) or
+                (not self.backward_range_min  and level >= self.backward_range)):
+                return True
+
+            # check for splits
+            if self.graph.out_degree(nodeid) != 1:
+                return False
+            if self.graph.in_degree(nodeid) != 1:
+                return False
+
+            sample = self.graph.node_data(nodeid)
+            if level > 1 and level-1 <= self.backward_check and not \
+                    sample.iLabel in self.backward_labels:
+                return False
+
+            edgeid = self.graph.in_arcs(nodeid)[0]
+            nodeid = self.graph.head(edgeid)
+            level += 1
+
+    def _forward_walk(self, nodeid, nodeids, level, found_splitid):
+        """Follow the track from nodeid until the check is decided or a split
+        is found. Returns (result, level), result is None at a split, the
+        split node is the last one in nodeids."""
+        while True:
+            nodeids.append(nodeid)
+            if ((self.forward_range == -1 and self.graph.out_degree(nodeid) == 0) or
+                (self.forward_range_min and level >= self.forward_range and \
+                     self.graph.out_degree(nodeid) == 0) or
+                (not self.forward_range_min and level >= self.forward_range)):
+                return True, level
+
+            # check for splits
+            if self.graph.in_degree(nodeid) > self.max_in_degree:
+                return False, level
+            if self.graph.out_degree(nodeid) > self.max_out_degree or \
+            self.graph.out_degree(nodeid) == 0:
+                return False, level
+
+            sample = self.graph.node_data(nodeid)
+            if level <= self.forward_check and not sample.iLabel in self.forward_labels:
+                return False, level
+
+            if (found_splitid is None and
+                self.graph.out_degree(nodeid) > 1 and
+                self.graph.out_degree(nodeid) <= self.max_out_degree):
+                return None, level
+
+            out_edgeid = self.graph.out_arcs(nodeid)[0]
+            nodeid = self.graph.tail(out_edgeid)
+            level += 1
 
     def _forward_check(self, nodeid, nodeids, level=1, found_splitid=None):
-        nodeids.append(nodeid)
-        if ((self.forward_range == -1 and self.graph.out_degree(nodeid) == 0) or
-            (self.forward_range_min and level >= self.forward_range and \
-                 self.graph.out_degree(nodeid) == 0) or
-            (not self.forward_range_min and level >= self.forward_range)):
-            return True
-
-        # check for splits
-        if self.graph.in_degree(nodeid) > self.max_in_degree:
-            return False
-        if self.graph.out_degree(nodeid) > self.max_out_degree or \
-        self.graph.out_degree(nodeid) == 0:
-            return False
-
-        sample = self.graph.node_data(nodeid)
-        if level <= self.forward_check and not sample.iLabel in self.forward_labels:
-            return False
-
-        if (found_splitid is None and
-            self.graph.out_degree(nodeid) > 1 and
-            self.graph.out_degree(nodeid) <= self.max_out_degree):
-            self.logger.info("     FOUND SPLIT! %s" %nodeid)
-            found_splitid = nodeid
-            new_nodeids = []
-            if self.allow_one_daughter_cell:
-                result = False
-            else:
-                result = True
-            for edgeid in self.graph.out_arcs(nodeid):
-                new_nodeids.append([])
-                tailid = self.graph.tail(edgeid)
-                if self.allow_one_daughter_cell:
-                    result |= self._forward_check(tailid, new_nodeids[-1],
-                                                  level=level+1,
-                                                  found_splitid=found_splitid)
-                else:
-                    result &= self._forward_check(tailid, new_nodeids[-1],
-                                                  level=level+1,
-                                                  found_splitid=found_splitid)
-            nodeids.append(new_nodeids)
+        result, level = self._forward_walk(nodeid, nodeids, level, found_splitid)
+        if result is not None:
             return result
+
+        # only the first split is followed, the daughter tracks end up as
+        # a list of lists in nodeids
+        found_splitid = nodeids[-1]
+        self.logger.info("     FOUND SPLIT! %s" %found_splitid)
+        new_nodeids = []
+        if self.allow_one_daughter_cell:
+            result = False
         else:
-            out_edgeid = self.graph.out_arcs(nodeid)[0]
-            tailid = self.graph.tail(out_edgeid)
-            return self._forward_check(tailid, nodeids,
-                                       level=level+1, found_splitid=found_splitid)
+            result = True
+        for edgeid in self.graph.out_arcs(found_splitid):
+            new_nodeids.append([])
+            tailid = self.graph.tail(edgeid)
+            daughter, _ = self._forward_walk(tailid, new_nodeids[-1], level+1,
+                                             found_splitid)
+            if self.allow_one_daughter_cell:
+                result |= daughter
+            else:
+                result &= daughter
+        nodeids.append(new_nodeids)
+        return result
@@ -14,7 +14,7 @@ __date__ = '$Date$'
 __revision__ = '$Rev$'
 __source__ = '$URL$'
 
-__all__ = ["Region", "ImageObject", "ObjectHolder"]
+__all__ = ["Region", "ImageObject", "ObjectStub", "ObjectHolder", "ObjectIndex"]
 
 import copy
 import numpy as np
@@ -82,6 +82,19 @@ class ImageObject(object):
         else:
             return True
 
+class ObjectStub(object):
+    """Light-weight copy of an ImageObject that keeps only the attributes
+    tracking and event selection need (object label, class label and
+    center)."""
+
+    __slots__ = ['iId', 'iLabel', 'oCenterAbs']
+
+    def __init__(self, obj):
+        self.iId = obj.iId
+        self.iLabel = obj.iLabel
+        self.oCenterAbs = obj.oCenterAbs
+
+
 class ObjectHolder(OrderedDict):
     """Container class for image objects. Provides object access by label (key),
     feature access by name and the possibility to concatenate features
@@ -147,3 +160,103 @@ class ObjectHolder(OrderedDict):
             else:
                 # including the crack_contour
                 self[label] = copy.deepcopy(sample)
+
+
+class ObjectIndex(object):
+    """Maps (frame index, object label) pairs to the row of the object in
+    the object table of a position.
+
+    Each frame stores a label-to-row array, i.e. memory is proportional to
+    the largest label per frame. The arrays are appended to one growable
+    flat table, a frame is addressed by its offset in the table. Adding a
+    frame is amortized O(largest label) and arrays of frame indices and
+    labels are resolved at once without rebuilding the table.
+    """
+
+    NO_ROW = -1
+
+    def __init__(self):
+        self._table = np.empty((0, ), dtype=np.int64)
+        self._size = 0
+        # offset and largest label by frame index, -1 for missing frames
+        self._offsets = np.zeros((0, ), dtype=np.int64)
+        self._max_labels = np.empty((0, ), dtype=np.int64)
+        self._counts = dict()
+
+    def __len__(self):
+        return sum(self._counts.itervalues())
+
+    def __contains__(self, coord):
+        try:
+            self.index(*coord)
+        except KeyError:
+            return False
+        return True
+
+    @staticmethod
+    def _grow(array, size, fill):
+        """Return array with at least size elements, the capacity is at
+        least doubled."""
+        if size <= array.size:
+            return array
+        grown = np.empty((max(size, 2*array.size), ), dtype=array.dtype)
+        grown[:array.size] = array
+        grown[array.size:] = fill
+        return grown
+
+    def add(self, frame_idx, labels, offset):
+        """Assign the rows offset, offset+1, ... to the labels of a frame.
+        Labels of a frame that was added before are replaced."""
+        frame_idx = int(frame_idx)
+        labels = np.asarray(labels, dtype=int)
+        size = labels.max()+1 if labels.size else 0
+
+        self._offsets = self._grow(self._offsets, frame_idx+1, 0)
+        self._max_labels = self._grow(self._max_labels, frame_idx+1, -1)
+
+        # a replaced frame leaves its old rows unused
+        start = self._size
+        self._table = self._grow(self._table, start+size, self.NO_ROW)
+        rows = self._table[start:start+size]
+        rows.fill(self.NO_ROW)
+        rows[labels] = np.arange(offset, offset+labels.size)
+        self._size = start + size
+
+        self._offsets[frame_idx] = start
+        self._max_labels[frame_idx] = size - 1
+        self._counts[frame_idx] = int((rows != self.NO_ROW).sum())
+
+    def index(self, frame_idx, label):
+        """Return the row of a single object, raises KeyError."""
+        if 0 <= frame_idx < self._offsets.size and \
+                0 <= label <= self._max_labels[frame_idx]:
+            row = self._table[self._offsets[frame_idx] + label]
+        else:
+            row = self.NO_ROW
+        if row == self.NO_ROW:
+            raise KeyError((frame_idx, label))
+        return int(row)
+
+    def lookup(self, frame_idx, labels):
+        """Return the rows of objects given by arrays of frame indices and
+        labels. Raises KeyError if any of the objects is unknown."""
+        frame_idx = np.asarray(frame_idx, dtype=np.int64)
+        labels = np.asarray(labels, dtype=np.int64)
+        frame_idx, labels = np.broadcast_arrays(frame_idx, labels)
+
+        nr_frames = self._offsets.size
+        valid = (frame_idx >= 0) & (frame_idx < nr_frames) & (labels >= 0)
+        fidx = np.where(valid, frame_idx, 0)
+        if nr_frames > 0:
+            valid &= labels <= self._max_labels[fidx]
+        rows = np.empty(labels.shape, dtype=np.int64)
+        rows.fill(self.NO_ROW)
+        if valid.any():
+            rows[valid] = \
+                self._table[self._offsets[fidx[valid]] + labels[valid]]
+
+        missing = rows == self.NO_ROW
+        if missing.any():
+            i = np.flatnonzero(missing.ravel())[0]
+            raise KeyError((int(frame_idx.ravel()[i]), int(labels.ravel()[i])))
+        return rows
@@ -174,6 +174,16 @@ class PlateAnalyzer(Analyzer):
             MetaImage.disable_cropping()
             self.logger.info("cropping disabled")
 
+    def _remove_unfinished(self, datafile):
+        """Remove the file of an unfinished position. If finished positions
+        are skipped, the file is kept and the next run resumes at the first
+        frame that was not committed."""
+        if self.settings('General', 'skip_finished'):
+            self.logger.info("Kept file %s to resume" %datafile)
+        elif isfile(datafile):
+            os.remove(datafile)
+            self.logger.error("Removed file %s" %datafile)
+
     def __call__(self):
 
         # skip plate if exists
@@ -210,10 +220,9 @@ class PlateAnalyzer(Analyzer):
 
             except StopProcessing:
                 if analyzer.isAborted():
-                    os.remove(datafile)
+                    self._remove_unfinished(datafile)
             except Exception as e:
-                os.remove(datafile)
-                self.logger.error("Removed file %s" %datafile)
+                self._remove_unfinished(datafile)
                 traceback.print_exc()
                 raise
             finally:
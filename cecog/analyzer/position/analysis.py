@@ -26,7 +26,8 @@ from cecog.io.imagecontainer import Coordinate
 from cecog.plugin.metamanager import MetaPluginManager
 from cecog.units.time import TimeConverter
 
-from cecog.analyzer.tracker import Tracker
+from cecog.analyzer.tracker import Tracker, LapTracker
+from cecog.traits.analyzer.tracking import TRACKING_METHODS
 from cecog.analyzer.timeholder import TimeHolder
 from cecog.analyzer.analyzer import CellAnalyzer
 from cecog.analyzer.eventselection import EventSelection
@@ -244,7 +245,11 @@ class PositionCore(LoggerObject):
                   "hdf5_include_label_images": self.settings.get2('hdf5_include_label_images'),
                   "hdf5_include_features": self.settings.get2('hdf5_include_features'),
                   "hdf5_include_crack": self.settings.get2('hdf5_include_crack'),
-                  "hdf5_include_classification": self.settings.get2('hdf5_include_classification')}
+                  "hdf5_crack_format": self.settings.get2('hdf5_crack_format'),
+                  "hdf5_include_classification": self.settings.get2('hdf5_include_classification'),
+                  "hdf5_write_behind": self.settings.get2('hdf5_write_behind'),
+                  "hdf5_filters": self._hdf_filters(),
+                  "hdf5_resume": self._resume}
 
         # Processing overwrites Output
         if not self.settings.get('Processing', 'tracking'):
@@ -252,6 +257,23 @@ class PositionCore(LoggerObject):
             h5opts["hdf5_include_events"] = False
         return h5opts
 
+    @property
+    def _resume(self):
+        """Continue a partially written position if finished positions are
+        skipped. Objects of merged channels can not be restored."""
+        return bool(self.settings.get('General', 'skip_finished')) and \
+            self.MERGED_CHANNEL not in self.processing_channels
+
+    def _hdf_filters(self):
+        """Compression filters for each dataset class of the cellh5 file."""
+        filters = dict()
+        for kind in TimeHolder.FILTER_CLASSES:
+            filters[kind] = dict(
+                compression=self.settings.get('Output', 'hdf5_compression_%s' %kind),
+                level=self.settings.get('Output', 'hdf5_compression_level_%s' %kind),
+                shuffle=self.settings.get('Output', 'hdf5_shuffle_%s' %kind))
+        return filters
+
     # FIXME the following functions do moreless the same!
     def _resolve_name(self, channel, name):
         _channel_lkp = {self.PRIMARY_CHANNEL: 'primary',
@@ -477,17 +499,87 @@ class PositionAnalyzer(PositionCore):
         self.logger.info("Save Event data")
         self.timeholder.serialize_events(self._tes)
 
-    def save_classification(self):
-        """Save classlabels of each object to the hdf file."""
+    def save_classification(self, frame):
+        """Save classlabels of each object of a frame to the hdf file."""
         # function works for supervised and unuspervised case
-        for channels in self.timeholder.itervalues():
-            for chname, classifier in self.classifiers.iteritems():
-                holder = channels[chname].get_region(classifier.regions)
-                # if classifier.feature_names is None:
-                #     # special for unsupervised case
-                #     classifier.feature_names = holder.feature_names
-                self.timeholder.save_classlabels(channels[chname],
-                                                 holder, classifier)
+        channels = self.timeholder[frame]
+        for chname, classifier in self.classifiers.iteritems():
+            holder = channels[chname].get_region(classifier.regions)
+            # if classifier.feature_names is None:
+            #     # special for unsupervised case
+            #     classifier.feature_names = holder.feature_names
+            self.timeholder.save_classlabels(channels[chname],
+                                             holder, classifier)
+
+    @property
+    def _frame_status(self):
+        """Status bits of the data that is written for each frame."""
+        status = TimeHolder.FRAME_FEATURES
+        if self.classifiers and self.settings('Output', 'hdf5_include_classification'):
+            status |= TimeHolder.FRAME_CLASSIFICATION
+        if self.settings('Processing', 'tracking'):
+            status |= TimeHolder.FRAME_TRACKING
+        return status
+
+    @property
+    def _streaming(self):
+        """Streaming tracking writes the edges frame by frame and keeps only
+        the frames within reach of the tracker in memory."""
+        return self.settings('Processing', 'tracking') and \
+            self.settings('Tracking', 'tracking_streaming')
+
+    def _track_frame(self, frame):
+        region = self.settings('Tracking', 'region')
+        samples = self.timeholder[frame][PrimaryChannel.NAME].get_region(region)
+        nedges = self._tracker.graph.next_edge_id
+        self._tracker.track_next_frame(frame, samples)
+        if self._streaming:
+            self.timeholder.append_tracking(
+                *self._tracker.graph.edges_from(nedges))
+
+    def _event_samples(self, frame):
+        """Samples of the event channel if they differ from the tracked ones,
+        the graph is not cloned in streaming mode."""
+        if not self.settings('Processing', 'eventselection'):
+            return None
+
+        evchannel = self.settings('EventSelection', 'eventchannel')
+        region = self.classifiers[evchannel].regions
+        if evchannel != PrimaryChannel.NAME or \
+                region != self.settings('Tracking', 'region'):
+            return self.timeholder[frame][evchannel].get_region(region)
+        return None
+
+    def _release_frames(self, frame=None):
+        """Release the frames that can not be linked to frame anymore, all
+        frames if frame is None."""
+        if not self._streaming:
+            return
+
+        for f in self.timeholder.keys():
+            if frame is None or f < frame - self._tracker.max_frame_gap:
+                self._tracker.release_frame(f, self._event_samples(f))
+                self.timeholder.release_frame(f)
+
+    def _restore(self):
+        """Restore the frames committed by a previous run, objects are read
+        from the cellh5 file and the tracker is rebuilt."""
+        # a frame can be restored if it has all data this run would write
+        frames = self.timeholder.resume(self._frame_status)
+        if frames:
+            self.logger.info("Resuming position %s, %d of %d frames restored"
+                             %(self.position, len(frames), len(self._frames)))
+
+        for frame in frames:
+            self.timeholder.initTimePoint(frame)
+            self.timeholder.restore_frame(frame)
+            if self.settings('Processing', 'tracking'):
+                self._track_frame(frame)
+            self._release_frames(frame)
+            self.statusUpdate(text='%s, %s, T %d restored'
+                              %(self.plate_id, self.position, frame),
+                              increment=True)
+        return frames
 
     def __call__(self):
 
@@ -510,7 +602,10 @@ class PositionAnalyzer(PositionCore):
             tropts = (self.settings('Tracking', 'tracking_maxobjectdistance'),
                       self.settings('Tracking', 'tracking_maxsplitobjects'),
                       self.settings('Tracking', 'tracking_maxtrackinggap'))
-            self._tracker = Tracker(*tropts)
+            if self.settings('Tracking', 'tracking_method') == TRACKING_METHODS[1]:
+                self._tracker = LapTracker(*tropts)
+            else:
+                self._tracker = Tracker(*tropts)
 
         stopwatch = StopWatch(start=True)
         ca = CellAnalyzer(timeholder=self.timeholder,
@@ -518,11 +613,14 @@ class PositionAnalyzer(PositionCore):
                           create_images = True,
                           binning_factor = 1,
                           detect_objects = self.settings('Processing',
-                                                         'objectdetection'))
+                                                         'objectdetection'),
+                          nthreads = self.settings('Processing',
+                                                   'channel_threads'))
 
         self.export_features = self.define_exp_features()
-        self._analyze(ca)
-
+        restored = self._restore()
+        self._analyze(ca, [f for f in self._frames if f not in restored])
+        self._release_frames()
 
         # invoke event selection
         if self.settings('Processing', 'eventselection') and \
@@ -531,7 +629,10 @@ class PositionAnalyzer(PositionCore):
             evchannel = self.settings('EventSelection', 'eventchannel')
             region = self.classifiers[evchannel].regions
 
-            if  evchannel != PrimaryChannel.NAME or region != self.settings("Tracking", "region"):
+            if self._streaming:
+                # released frames hold the samples of the event channel
+                graph = self._tracker.graph
+            elif  evchannel != PrimaryChannel.NAME or region != self.settings("Tracking", "region"):
                 graph = self._tracker.clone_graph(self.timeholder, evchannel, region)
             else:
                 graph = self._tracker.graph
@@ -545,15 +646,16 @@ class PositionAnalyzer(PositionCore):
         # save all the data of the position, no aborts from here on
         # want all processed data saved
         if self.settings('Processing', 'tracking'):
-            self.statusUpdate(text="Saving Tracking Data to cellh5...")
-            self.save_tracks()
+            # streaming tracking has written the edges already
+            if not self._streaming:
+                self.statusUpdate(text="Saving Tracking Data to cellh5...")
+                self.save_tracks()
 
             if self.settings('Output', 'hdf5_include_events') and \
                self.settings('Processing', "eventselection"):
                 self.statusUpdate(text="Saving Event Data to cellh5...")
                 self.save_events()
 
-        self.save_classification()
         self.timeholder.purge()
 
         try:
@@ -576,13 +678,16 @@ class PositionAnalyzer(PositionCore):
         # close and remove handlers from logging object
         self.close()
 
-    def _analyze(self, cellanalyzer):
+    def _analyze(self, cellanalyzer, frames):
 
         thread = QThread.currentThread()
 
+        if not frames:
+            return
+
         stopwatch = StopWatch(start=True)
         crd = Coordinate(self.plate_id, self.position,
-                         self._frames, list(set(self.ch_mapping.values())))
+                         frames, list(set(self.ch_mapping.values())))
 
         for frame, channels in self._imagecontainer( \
             crd, interrupt_channel=True, interrupt_zslice=True):
@@ -607,9 +712,7 @@ class PositionAnalyzer(PositionCore):
 
             if self.settings('Processing', 'tracking'):
                 apc = AppPreferences()
-                region = self.settings('Tracking', 'region')
-                samples = self.timeholder[frame][PrimaryChannel.NAME].get_region(region)
-                self._tracker.track_next_frame(frame, samples)
+                self._track_frame(frame)
 
                 if apc.display_tracks:
                     size = cellanalyzer.getImageSize(PrimaryChannel.NAME)
@@ -626,6 +729,8 @@ class PositionAnalyzer(PositionCore):
                 for channel, clf in self.classifiers.iteritems():
                     cellanalyzer.classify_objects(clf, channel)
 
+            self.save_classification(frame)
+
             self.logger.debug(" - Frame %d, Classification (ms): %3d" \
                              % (frame, stopwatch.interval()*1000))
 
@@ -639,6 +744,8 @@ class PositionAnalyzer(PositionCore):
             self.setImage(imgs, msg, 50)
 
             cellanalyzer.purge(features=self.export_features)
+            self.timeholder.commit_frame(self._frame_status)
+            self._release_frames(frame)
             self.logger.debug(" - Frame %d, duration (ms): %3d" \
                               %(frame, stopwatch.interim()*1000))
 
@@ -0,0 +1,142 @@
+"""
+scheduler.py
+
+Runs the processing stages of a frame (e.g. raw image preparation,
+segmentation and feature extraction of the channels) in the order of their
+dependencies. Stages that do not depend on each other run concurrently in a
+thread pool; the heavy lifting is done in ccore functions that release the
+GIL.
+"""
+
+__copyright__ = ('The CellCognition Project'
+                 'Copyright (c) 2006 - 2016'
+                 'Gerlich Lab, IMBA Vienna, Austria'
+                 'see AUTHORS.txt for contributions')
+__licence__ = 'LGPL'
+__url__ = 'www.cellcognition.org'
+
+__all__ = ('Stage', 'StageScheduler')
+
+
+import sys
+import Queue
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+from cecog.util.stopwatch import StopWatch
+
+
+class Stage(object):
+    """A named unit of work, func() is called once all stages listed in
+    requires have finished."""
+
+    def __init__(self, name, func, requires=()):
+        super(Stage, self).__init__()
+        self.name = name
+        self.func = func
+        self.requires = tuple(requires)
+
+    def __repr__(self):
+        return "Stage(%r, requires=%r)" %(self.name, self.requires)
+
+
+class StageScheduler(object):
+    """Execute a dependency graph of Stages with up to nthreads threads.
+
+    With one thread the stages run on the calling thread, in the given order
+    as far as the dependencies allow. The wall time of each stage of the last
+    run is kept in timings. If a stage fails, no further stages are started
+    and the first error is raised on the calling thread once the running
+    stages have finished.
+    """
+
+    WAIT_TIMEOUT = 24*3600
+
+    def __init__(self, nthreads=1):
+        super(StageScheduler, self).__init__()
+        self.nthreads = max(1, int(nthreads))
+        self.timings = OrderedDict()
+
+    @staticmethod
+    def sort(stages):
+        """Return the stages in an order that satisfies the dependencies,
+        the given order is kept as far as possible."""
+        names = set(s.name for s in stages)
+        if len(names) != len(stages):
+            raise ValueError("Stage names are not unique")
+
+        for stage in stages:
+            unknown = set(stage.requires) - names
+            if unknown:
+                raise ValueError("%s requires unknown stage(s) %s"
+                                 %(stage.name, ", ".join(sorted(unknown))))
+
+        done = set()
+        ordered = []
+        pending = list(stages)
+        while pending:
+            for stage in pending:
+                if done.issuperset(stage.requires):
+                    break
+            else:
+                raise ValueError("Cyclic dependencies between stages %s"
+                                 %", ".join(s.name for s in pending))
+            pending.remove(stage)
+            ordered.append(stage)
+            done.add(stage.name)
+        return ordered
+
+    def _execute(self, stage, results=None):
+        stopwatch = StopWatch(start=True)
+        try:
+            stage.func()
+            error = None
+        except:
+            if results is None:
+                raise
+            error = sys.exc_info()
+        finally:
+            self.timings[stage.name] = stopwatch.stop()
+
+        if results is not None:
+            results.put((stage.name, error))
+
+    def run(self, stages):
+        self.timings.clear()
+        stages = self.sort(stages)
+
+        if self.nthreads == 1 or len(stages) < 2:
+            for stage in stages:
+                self._execute(stage)
+            return
+
+        pool = ThreadPool(min(self.nthreads, len(stages)))
+        results = Queue.Queue()
+        pending = list(stages)
+        done = set()
+        nrunning = 0
+        error = None
+
+        try:
+            while pending or nrunning:
+                if error is None:
+                    ready = [s for s in pending if done.issuperset(s.requires)]
+                    for stage in ready:
+                        pending.remove(stage)
+                        pool.apply_async(self._execute, (stage, results))
+                        nrunning += 1
+                elif not nrunning:
+                    break
+
+                # a timeout keeps the wait interruptible (KeyboardInterrupt)
+                name, exc_info = results.get(True, self.WAIT_TIMEOUT)
+                nrunning -= 1
+                done.add(name)
+                if exc_info is not None and error is None:
+                    error = exc_info
+        finally:
+            pool.close()
+            pool.join()
+
+        if error is not None:
+            raise error[0], error[1], error[2]
@@ -18,10 +18,14 @@ __source__ = '$URL$'
 
 
 import zlib
+import math
 import base64
 import logging
+import threading
+import functools
 from os.path import  exists
 from collections import OrderedDict
+from contextlib import contextmanager
 
 import h5py
 import numpy
@@ -33,23 +37,68 @@ from cecog.colors import Colors
 from cecog.util.stopwatch import StopWatch
 from cecog.io.imagecontainer import Coordinate
 from cecog.io.imagecontainer import MetaImage
-from cecog.analyzer.channel import PrimaryChannel
+from cecog.io.writebehind import WriteBehindWriter
+from cecog.io.hdf import readCrackContours
+from cecog.analyzer.channel import PrimaryChannel, RestoredChannel
 from cecog.plugin.metamanager import MetaPluginManager
 from cecog.analyzer.tracker import Tracker
 from cecog.analyzer.object import ImageObject, ObjectHolder, Orientation, Region
+from cecog.analyzer.object import ObjectIndex
 
 from cecog.features import FeatureGroups
 
 
+# object tables are preallocated for the estimated number of objects
+# times OBJECT_TABLE_HEADROOM and grow at least by OBJECT_TABLE_GROWTH
+OBJECT_TABLE_HEADROOM = 1.2
+OBJECT_TABLE_GROWTH = 1.5
+# chunks that span two frames are compressed twice, hence small chunks
+# (see scripts/bench_object_tables.py)
+OBJECT_CHUNK_MIN_ROWS = 64
+OBJECT_CHUNK_NBYTES = 2**14
+# rows per chunk of the tracking table if it is appended frame by frame
+TRACKING_CHUNK_ROWS = 2048
+
+
 def chunk_size(shape):
     """Helper function to compute chunk size for image data cubes."""
-    c = shape[0]
+    # channels and regions are written one after the other, separate chunks
+    # avoid decompressing and compressing a chunk for each of them
+    c = 1
     t = 1
     z = 1
     y = shape[3] / 4
     x = shape[4] / 4
     return (c, t, z, y, x)
 
+def object_chunk_rows(nr_objects, row_nbytes):
+    """Helper function to compute the number of rows per chunk for object
+    tables. Objects are written and read frame by frame, a chunk holds
+    roughly the objects of one frame, but not more than OBJECT_CHUNK_NBYTES."""
+    rows = 2**int(math.ceil(math.log(max(nr_objects, 1), 2)))
+    max_rows = max(OBJECT_CHUNK_NBYTES//max(row_nbytes, 1), 1)
+    return int(max(min(rows, max_rows), min(OBJECT_CHUNK_MIN_ROWS, max_rows)))
+
+def object_table_rows(nr_rows, frames_done, nr_frames, nr_allocated=0):
+    """Helper function to compute the number of rows to allocate for an
+    object table. The table is extrapolated from the mean number of objects
+    of the frames done to all frames of the position, plus some headroom,
+    a table that is too small grows by at least OBJECT_TABLE_GROWTH."""
+    estimate = OBJECT_TABLE_HEADROOM*nr_rows/float(frames_done)*nr_frames
+    return max(nr_rows, int(math.ceil(estimate)),
+               int(OBJECT_TABLE_GROWTH*nr_allocated))
+
+def hdf5_filter_options(compression='gzip', level=None, shuffle=False):
+    """Helper function to translate compression filter, level and shuffle
+    into keyword arguments of h5py's create_dataset. A compression
+    of None or 'none' disables all filters, the level applies to gzip only."""
+    if compression in (None, 'none'):
+        return dict(compression=None)
+    options = dict(compression=compression, shuffle=bool(shuffle))
+    if compression == 'gzip' and level is not None:
+        options['compression_opts'] = int(level)
+    return options
+
 def max_shape(shape):
     """Helper function to compute chunk size for image data cubes."""
     c = 8 # 8 is kind of arbitrary, but better than None to help h5py to reserve the space
@@ -60,6 +109,17 @@ def max_shape(shape):
     return (c, t, z, y, x)
 
 
+def synchronized(method):
+    """Hold the lock of the TimeHolder while method runs. Channels of a
+    frame are processed by several threads (see CellAnalyzer.process), the
+    hdf5 output and the bookkeeping is done by one thread at a time."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kw):
+        with self._lock:
+            return method(self, *args, **kw)
+    return wrapper
+
+
 class TimeHolder(OrderedDict):
 
     # label for unlabled objects
@@ -106,19 +166,74 @@ class TimeHolder(OrderedDict):
                      ('edge_idx1', 'uint32'),
                      ('edge_idx2', 'uint32'),])
 
+    HDF5_DTYPE_PREDICTION = numpy.dtype([('label_idx', 'int32')])
+
+    HDF5_DTYPE_CONTOUR_INDEX = \
+        numpy.dtype([('start', 'int64'),
+                     ('stop', 'int64'),])
+
+    # crack contours either as base64(zlib(csv)) strings or as binary
+    # coordinate table plus start/stop index per object
+    CRACK_FORMAT_STRING = 'string'
+    CRACK_FORMAT_BINARY = 'binary'
+
+    # per frame status bits of the data kinds written, a frame is committed
+    # once all its data (objects, features, classification) is written
+    HDF5_NAME_FRAME_STATUS = "frame_status"
+    FRAME_FEATURES = 0x01
+    FRAME_CLASSIFICATION = 0x02
+    FRAME_TRACKING = 0x04
+    FRAME_RAW_IMAGES = 0x08
+    FRAME_LABEL_IMAGES = 0x10
+    FRAME_COMMITTED = 0x80
+
+    # dataset classes with individual compression filters
+    FILTER_RAW_IMAGES = 'raw_images'
+    FILTER_LABEL_IMAGES = 'label_images'
+    FILTER_FEATURES = 'features'
+    FILTER_CONTOURS = 'contours'
+    FILTER_CLASSES = (FILTER_RAW_IMAGES, FILTER_LABEL_IMAGES,
+                      FILTER_FEATURES, FILTER_CONTOURS)
+
+    HDF5_DTYPE_OBJECT_INDEX = \
+        numpy.dtype([('time_idx', 'int32'),
+                     ('obj_label_id', 'int32'),])
+
+    HDF5_DTYPE_CROSS_RELATION = \
+        numpy.dtype([('idx1', 'int32'),
+                     ('idx2', 'int32'),])
+
+    HDF5_DTYPE_BOUNDING_BOX = \
+        numpy.dtype([('left', 'int32'),
+                     ('right', 'int32'),
+                     ('top', 'int32'),
+                     ('bottom', 'int32'),])
+
+    HDF5_DTYPE_CENTER = \
+        numpy.dtype([('x', 'int32'),
+                     ('y', 'int32'),])
+
+    HDF5_DTYPE_ORIENTATION = \
+        numpy.dtype([('angle', 'float'),
+                     ('eccentricity', 'float'),])
+
     def __init__(self, P, channel_regions, filename_hdf5, meta_data, settings,
                  analysis_frames, plate_id, well, site,
                  hdf5_create=True,
                  hdf5_reuse=False,
                  hdf5_compression='gzip',
+                 hdf5_filters=None,
                  hdf5_include_raw_images=True,
                  hdf5_include_label_images=True,
                  hdf5_include_features=True,
                  hdf5_include_classification=True,
                  hdf5_include_crack=True,
+                 hdf5_crack_format=CRACK_FORMAT_STRING,
                  hdf5_include_tracking=True,
                  hdf5_include_events=True,
-                 hdf5_include_annotation=True):
+                 hdf5_include_annotation=True,
+                 hdf5_write_behind=False,
+                 hdf5_resume=False):
         super(TimeHolder, self).__init__()
 
         self.P = P
@@ -138,11 +253,18 @@ class TimeHolder(OrderedDict):
         self._hdf5_include_features = hdf5_include_features
         self._hdf5_include_classification = hdf5_include_classification
         self._hdf5_include_crack = hdf5_include_crack
+        self._hdf5_crack_format = hdf5_crack_format
         self._hdf5_include_tracking = hdf5_include_tracking
         self._hdf5_include_events = hdf5_include_events
         self._hdf5_include_annotation = hdf5_include_annotation
         self._hdf5_compression = hdf5_compression
+        self._hdf5_filter_options = dict()
+        if hdf5_filters is not None:
+            for kind, filters in hdf5_filters.iteritems():
+                self._hdf5_filter_options[kind] = hdf5_filter_options(**filters)
         self._hdf5_reuse = hdf5_reuse
+        self._writer = None
+        self._lock = threading.Lock()
 
         self._hdf5_features_complete = False
         self.hdf5_filename = filename_hdf5
@@ -153,8 +275,17 @@ class TimeHolder(OrderedDict):
         all_frames = meta_data.get_frames_of_position(self.P)
         self._frames_to_idx = dict([(f, i) for i, f in enumerate(all_frames)])
         self._idx_to_frames = dict([(i ,f) for i, f in enumerate(all_frames)])
-        self._object_coord_to_id = {}
-        self._object_coord_to_idx = {}
+        # rows of the objects in the object tables per channel prefix
+        self._object_index = dict()
+        # used rows, frames written and allocated tables for object tables
+        self._object_rows = dict()
+        self._object_frames = dict()
+        self._object_tables = dict()
+        self._contour_points = dict()
+        # row ranges of the committed frames of a resumed file
+        self._resume_slices = dict()
+        # in memory copy of the frame status dataset
+        self._frame_status = numpy.zeros((len(all_frames), ), dtype='uint8')
 
         channels = sorted(list(meta_data.channels))
         self._region_names = []
@@ -199,7 +330,12 @@ class TimeHolder(OrderedDict):
 
         self._regions_to_idx2 = OrderedDict([(n,i) for i, n in enumerate(region_names2)])
 
-        if self._hdf5_create:
+        self._hdf5_resumed = False
+        if self._hdf5_create and hdf5_resume and \
+                self.hdf5_filename is not None and exists(self.hdf5_filename):
+            self._hdf5_resumed = self._hdf5_open_for_resume()
+
+        if self._hdf5_create and not self._hdf5_resumed:
             label_image_cpy = None
             label_image_str = None
             label_image_valid = None
@@ -220,18 +356,20 @@ class TimeHolder(OrderedDict):
                     # check if label images are there and if reuse is enabled
                     if 'region' in self._grp_site[self.HDF5_GRP_IMAGE]:
                         label_image_cpy = self._grp_site[self.HDF5_GRP_IMAGE]['region'].value
-                        label_image_valid = self._grp_site[self.HDF5_GRP_IMAGE]['region'].attrs['valid']
+                        label_image_valid = self._hdf5_image_valid('region', self.FRAME_LABEL_IMAGES)
                         label_image_str = self._grp_site[self.HDF5_GRP_IMAGE].name + '/region'
 
                     if 'channel' in self._grp_site[self.HDF5_GRP_IMAGE]:
                         raw_image_cpy = self._grp_site[self.HDF5_GRP_IMAGE]['channel'].value
-                        raw_image_valid = self._grp_site[self.HDF5_GRP_IMAGE]['channel'].attrs['valid']
+                        raw_image_valid = self._hdf5_image_valid('channel', self.FRAME_RAW_IMAGES)
                         raw_image_str = self._grp_site[self.HDF5_GRP_IMAGE].name + '/channel'
 
                     for region in self._grp_site[self.HDF5_GRP_FEATURE]:
                         region_grp = self._grp_site[self.HDF5_GRP_FEATURE][region]
                         object_grp = self._grp_site[self.HDF5_OTYPE_OBJECT][region]
                         for obj_feat in ["object_features", "crack_contour",
+                                         "crack_contour_index",
+                                         "crack_contour_coordinates",
                                          "center", "bounding_box", "orientation"]:
                             if obj_feat in region_grp:
                                 key_data = region_grp.name + "/" + obj_feat
@@ -273,6 +411,31 @@ class TimeHolder(OrderedDict):
 
             self._hdf5_write_global_definition()
 
+        if self._hdf5_create and hdf5_write_behind:
+            self._writer = WriteBehindWriter()
+
+    def _hdf5_open_for_resume(self):
+        """Open a partially written file of a previous run. Returns False if
+        the file does not contain a frame status for this site."""
+        try:
+            f = h5py.File(self.hdf5_filename, 'r+')
+        except IOError:
+            return False
+
+        site = '/data/%s/%s/%s' %(self.plate_id, self.well, self.site)
+        if site not in f or self.HDF5_GRP_DEFINITION not in f or \
+                self.HDF5_NAME_FRAME_STATUS not in f[site]:
+            f.close()
+            return False
+
+        self._hdf5_file = f
+        self._grp_site = f[site]
+        self._grp_def = f[self.HDF5_GRP_DEFINITION]
+        self._frame_status = self._grp_site[self.HDF5_NAME_FRAME_STATUS][()]
+        self.cellh5_file = CH5File(self._hdf5_file)
+        self._logger.info('Resuming cellh5 file %s' %self.hdf5_filename)
+        return True
+
     def _hdf5_prepare_reuse(self):
         self.cellh5_file = CH5File(self.hdf5_filename, 'r')
         self._hdf5_file = self.cellh5_file.get_file_handle()
@@ -349,7 +512,7 @@ class TimeHolder(OrderedDict):
             var = self._grp_site[self.HDF5_GRP_IMAGE].create_dataset(self.HDF5_GRP_TIME,
                                         (nr_frames,), dtype,
                                         chunks=(nr_frames,),
-                                        compression=self._hdf5_compression)
+                                        **self._hdf5_filters(self.FILTER_FEATURES))
             for frame in all_frames:
                 idx = self._frames_to_idx[frame]
                 coord = Coordinate(position=self.P, time=frame)
@@ -464,8 +627,8 @@ class TimeHolder(OrderedDict):
                                            chunks=chunk_size(label_image_cpy.shape),
                                            data=label_image_cpy,
                                            maxshape=max_shape(label_image_cpy.shape),
-                                           compression=self._hdf5_compression)
-            self._hdf5_file[label_image_str].attrs['valid'] = label_image_valid
+                                           **self._hdf5_filters(self.FILTER_LABEL_IMAGES))
+            self._frame_status[numpy.asarray(label_image_valid) > 0] |= self.FRAME_LABEL_IMAGES
 
             if self._hdf5_file[label_image_str].shape[0] != len(self._regions_to_idx):
                 self._hdf5_file[label_image_str].resize(len(self._regions_to_idx), axis=0)
@@ -478,39 +641,280 @@ class TimeHolder(OrderedDict):
                                            chunks=chunk_size(raw_image_cpy.shape),
                                            data=raw_image_cpy,
                                            maxshape=max_shape(raw_image_cpy.shape),
-                                           compression=self._hdf5_compression)
-            self._hdf5_file[raw_image_str].attrs['valid'] = raw_image_valid
+                                           **self._hdf5_filters(self.FILTER_RAW_IMAGES))
+            self._frame_status[numpy.asarray(raw_image_valid) > 0] |= self.FRAME_RAW_IMAGES
 
             if self._hdf5_file[raw_image_str].shape[0] != len(self._regions_to_idx):
                 self._hdf5_file[raw_image_str].resize(len(self._regions_to_idx), axis=0)
 
         if feature_dict is not None:
             if object_dict is not None:
+                filters = self._hdf5_filters(self.FILTER_FEATURES)
                 for (key_desc, key_data), (value_desc, value_data) in feature_dict.items():
-                    self._hdf5_file.create_dataset(key_desc, data=value_desc, compression=self._hdf5_compression)
+                    self._hdf5_file.create_dataset(key_desc, data=value_desc, **filters)
                     if not value_data.dtype == numpy.dtype('O'):
-                        d = self._hdf5_file.create_dataset(key_data, data=value_data, compression=self._hdf5_compression)
+                        d = self._hdf5_file.create_dataset(key_data, data=value_data, **filters)
                         d.attrs["reused"] = True
                     else:
-                        d = self._hdf5_file.create_dataset(key_data, data=value_data, compression=self._hdf5_compression, dtype=h5py.new_vlen(str))
+                        d = self._hdf5_file.create_dataset(key_data, data=value_data, dtype=h5py.new_vlen(str),
+                                                           **self._hdf5_filters(self.FILTER_CONTOURS))
                         d.attrs["reused"] = True
 
                 for (key_desc, key_data), (value_desc, value_data) in object_dict.items():
-                    d = self._hdf5_file.create_dataset(key_desc, data=value_desc, compression=self._hdf5_compression)
+                    d = self._hdf5_file.create_dataset(key_desc, data=value_desc, **filters)
                     d.attrs["reused"] = True
-                    d = self._hdf5_file.create_dataset(key_data, data=value_data, compression=self._hdf5_compression)
+                    d = self._hdf5_file.create_dataset(key_data, data=value_data, **filters)
                     d.attrs["reused"] = True
 
 
 
 
+        if self._frame_status.any():
+            self._hdf5_frame_status()[:] = self._frame_status
+
         self.cellh5_file = CH5File(self._hdf5_file)
 
     def close_all(self):
+        # pending writes must be done before the file is closed,
+        # errors of the writer thread are raised here
         try:
-            self.cellh5_file.close()
-        except:
-            pass
+            if self._writer is not None:
+                self._writer.close()
+            if self._object_tables:
+                self._trim_object_tables()
+            if self._hdf5_create:
+                self._hdf5_write_valid_attrs()
+        finally:
+            self._writer = None
+            try:
+                self.cellh5_file.close()
+            except:
+                pass
+
+    def _hdf5_filters(self, kind):
+        """Return the create_dataset keyword arguments for the compression
+        filters of a dataset class (see FILTER_CLASSES)."""
+        try:
+            return self._hdf5_filter_options[kind].copy()
+        except KeyError:
+            return dict(compression=self._hdf5_compression)
+
+    def _hdf5_write(self, dset, key, data):
+        """Write data to dset[key], either directly or by the write-behind
+        thread."""
+        if self._writer is None:
+            dset[key] = data
+        else:
+            self._writer.write(dset, key, data)
+
+    def _hdf5_frame_status(self):
+        """Return the frame status dataset of the site, a bitmask of the data
+        kinds written per frame."""
+        if self.HDF5_NAME_FRAME_STATUS in self._grp_site:
+            return self._grp_site[self.HDF5_NAME_FRAME_STATUS]
+        return self._grp_site.create_dataset(
+            self.HDF5_NAME_FRAME_STATUS, (self._frame_status.size, ), 'uint8')
+
+    def _hdf5_set_frame_status(self, frame_idx, status):
+        """Add status bits to a frame, one element is written."""
+        self._frame_status[frame_idx] |= status
+        self._hdf5_write(self._hdf5_frame_status(), frame_idx,
+                         self._frame_status[frame_idx])
+
+    def _is_frame_valid(self, frame_idx, status):
+        return bool(self._frame_status[frame_idx] & status)
+
+    def _hdf5_image_valid(self, name, status):
+        """Return the valid frames of the image data cube name as float
+        array. Files of interrupted runs have no 'valid' attributes (see
+        _hdf5_write_valid_attrs), the frame status is used if it exists."""
+        if self.HDF5_NAME_FRAME_STATUS in self._grp_site:
+            frame_status = self._grp_site[self.HDF5_NAME_FRAME_STATUS][()]
+            return (frame_status & status).astype(bool).astype(float)
+        return self._grp_site[self.HDF5_GRP_IMAGE][name].attrs['valid']
+
+    def _hdf5_write_valid_attrs(self):
+        """Compatibility for readers of the 'valid' attributes of the image
+        data cubes, written once at the end."""
+        grp = self._grp_site[self.HDF5_GRP_IMAGE]
+        for name, status in (('channel', self.FRAME_RAW_IMAGES),
+                             ('region', self.FRAME_LABEL_IMAGES)):
+            if name in grp:
+                grp[name].attrs['valid'] = \
+                    (self._frame_status & status).astype(bool).astype(float)
+
+    def commit_frame(self, status=0):
+        """Mark the current frame as completely written. Pending writes are
+        done and the file is flushed, before the frame counts as committed."""
+        if not self._hdf5_create:
+            return
+
+        if self._writer is not None:
+            self._writer.flush()
+        self._hdf5_set_frame_status(self._frames_to_idx[self._iCurrentT],
+                                    status | self.FRAME_COMMITTED)
+        # the status is queued as well, it must be written before the flush
+        if self._writer is not None:
+            self._writer.flush()
+        self._hdf5_file.flush()
+
+    def resume(self, status=0):
+        """Return the leading frames that were committed by a previous run with
+        at least the given status bits. Object data of all later frames is
+        removed from the file and the object index is rebuilt, i.e. the
+        analysis continues with the next frame."""
+        if not self._hdf5_resumed:
+            return []
+
+        frame_status = self._grp_site[self.HDF5_NAME_FRAME_STATUS][()]
+        required = status | self.FRAME_COMMITTED
+        frames = list()
+        for frame in sorted(self._analysis_frames):
+            frame_idx = self._frames_to_idx[frame]
+            if frame_status[frame_idx] & required != required:
+                break
+            frames.append(frame)
+
+        ncommitted = numpy.count_nonzero(frame_status & self.FRAME_COMMITTED)
+        if ncommitted and not frames:
+            self._logger.warning(
+                ("%d committed frame(s) in %s, but none has the required "
+                 "status 0x%x (e.g. the output settings have changed). All "
+                 "frames are processed again.")
+                %(ncommitted, self.hdf5_filename, required))
+
+        frame_status[[self._frames_to_idx[f] for f in self._analysis_frames
+                      if f not in frames]] = 0
+        self._grp_site[self.HDF5_NAME_FRAME_STATUS][:] = frame_status
+        self._frame_status = frame_status
+        self._hdf5_truncate_objects(
+            numpy.array([self._frames_to_idx[f] for f in frames], dtype=int))
+        return frames
+
+    def _hdf5_truncate_objects(self, frame_indices):
+        """Shrink the object tables to the rows of the given frames and rebuild
+        the object index. Tracking and event data are removed, the tracking
+        of the restored frames is redone."""
+        grp_objects = self._grp_site[self.HDF5_GRP_OBJECT]
+        grp_features = self._grp_site[self.HDF5_GRP_FEATURE]
+
+        for name in ('tracking', 'event'):
+            if name in grp_objects:
+                del grp_objects[name]
+
+        prim_obj_name = self._convert_region_name(
+            self._region_infos[0][0], self._region_infos[0][2], prefix='')
+
+        for prefix, _, region_name in self._region_infos:
+            obj_name = self._convert_region_name(prefix, region_name, prefix='')
+            if obj_name not in grp_objects:
+                continue
+
+            time_idx = grp_objects[obj_name]['time_idx']
+            committed = numpy.in1d(time_idx, frame_indices)
+            if committed.all():
+                nr_rows = committed.size
+            else:
+                nr_rows = numpy.flatnonzero(~committed)[0]
+            time_idx = time_idx[:nr_rows]
+
+            tables = [grp_objects[obj_name]]
+            rel_name = '%s___to___%s' %(prim_obj_name, obj_name)
+            if rel_name in grp_objects:
+                tables.append(grp_objects[rel_name])
+            if obj_name in grp_features:
+                grp = grp_features[obj_name]
+                tables.extend([grp[n] for n in grp if isinstance(grp[n], h5py.Dataset)
+                               and n != 'crack_contour_coordinates'])
+                if 'object_classification' in grp:
+                    grp_cls = grp['object_classification']
+                    tables.extend([grp_cls[n] for n in ('prediction', 'probability')
+                                   if n in grp_cls])
+                if 'crack_contour_coordinates' in grp:
+                    nr_points = grp['crack_contour_index'][nr_rows-1]['stop'] \
+                        if nr_rows else 0
+                    grp['crack_contour_coordinates'].resize(nr_points, axis=0)
+                    self._contour_points[obj_name] = nr_points
+
+            for dset in tables:
+                if dset.shape[0] > nr_rows:
+                    dset.resize(nr_rows, axis=0)
+                if dset.name.endswith('/object_classification/prediction') or \
+                        dset.name.endswith('/object_classification/probability'):
+                    continue
+                self._object_tables[dset.name] = nr_rows
+
+            self._object_rows[obj_name] = nr_rows
+            self._object_frames[obj_name] = len(frame_indices)
+
+            starts = numpy.searchsorted(time_idx, frame_indices, 'left')
+            stops = numpy.searchsorted(time_idx, frame_indices, 'right')
+            labels = grp_objects[obj_name]['obj_label_id'][:nr_rows]
+            index = self._object_index.setdefault(prefix, ObjectIndex())
+            slices = self._resume_slices.setdefault(obj_name, dict())
+            for frame_idx, start, stop in zip(frame_indices, starts, stops):
+                index.add(frame_idx, labels[start:stop], start)
+                slices[frame_idx] = slice(start, stop)
+
+    def restore_frame(self, frame):
+        """Rebuild the objects of a committed frame from the file, i.e. what
+        tracking and event selection need (center, bounding box, orientation
+        and class label)."""
+        frame_idx = self._frames_to_idx[frame]
+        grp_objects = self._grp_site[self.HDF5_GRP_OBJECT]
+        grp_features = self._grp_site[self.HDF5_GRP_FEATURE]
+        channels = self.setdefault(frame, OrderedDict())
+
+        for prefix, _, region_name in self._region_infos:
+            obj_name = self._convert_region_name(prefix, region_name, prefix='')
+            holder = ObjectHolder(region_name)
+            rows = self._resume_slices.get(obj_name, {}).get(frame_idx)
+
+            if rows is not None and rows.stop > rows.start:
+                grp = grp_features[obj_name]
+                labels = grp_objects[obj_name]['obj_label_id'][rows]
+                bbox = grp['bounding_box'][rows]
+                center = grp['center'][rows]
+                orientation = grp['orientation'][rows]
+                classes = self._restore_classes(obj_name, rows)
+
+                for i, label in enumerate(labels):
+                    obj = ImageObject(iId=int(label))
+                    bb = bbox[i]
+                    obj.oRoi = Region(tplCoords=(bb['left'], bb['top'],
+                                                 bb['right'], bb['bottom']))
+                    obj.oCenterAbs = (int(center[i]['x']), int(center[i]['y']))
+                    obj.orientation = Orientation(orientation[i]['angle'],
+                                                  orientation[i]['eccentricity'])
+                    if classes is not None and classes[i] is not None:
+                        obj.iLabel, obj.strClassName, obj.strHexColor = classes[i]
+                    obj.aFeatures = numpy.array([])
+                    holder[int(label)] = obj
+
+            channel = channels.setdefault(
+                prefix.title(), RestoredChannel(prefix.title()))
+            channel.add_region(region_name, holder)
+        return channels
+
+    def _restore_classes(self, obj_name, rows):
+        """Return (label, class name, color) per object or None, if the region
+        has no classification."""
+        try:
+            grp = self._grp_site[self.HDF5_GRP_FEATURE][obj_name]['object_classification']
+            class_labels = self._grp_def[self.HDF5_GRP_FEATURE][obj_name] \
+                ['object_classification']['class_labels'][()]
+            prediction = grp['prediction'][rows]['label_idx']
+        except KeyError:
+            return None
+
+        classes = list()
+        for label_idx in prediction:
+            if label_idx == self.UNPREDICTED_LABEL:
+                classes.append(None)
+            else:
+                label, name, color = class_labels[label_idx]
+                classes.append((int(label), name, color))
+        return classes
 
     def initTimePoint(self, iT):
         # HDF5 feature definition is complete after first frame
@@ -524,6 +928,11 @@ class TimeHolder(OrderedDict):
     def getCurrentChannels(self):
         return self[self._iCurrentT]
 
+    def release_frame(self, frame):
+        """Remove the channels and objects of a frame from memory, the data
+        of the cellh5 file is not affected."""
+        self.pop(frame, None)
+
     def purge(self):
         """Clear features from memory"""
         for channels in self.itervalues():
@@ -546,15 +955,26 @@ class TimeHolder(OrderedDict):
             self[iT] = OrderedDict()
         self[iT][channel.NAME] = channel
 
+    @contextmanager
+    def _unlocked(self):
+        """Release the lock in a synchronized method, e.g. while an image is
+        processed."""
+        self._lock.release()
+        try:
+            yield
+        finally:
+            self._lock.acquire()
+
     def hdf_channel_frame_valid(self):
         try:
             frame_idx = self._frames_to_idx[self._iCurrentT]
-            if self._grp_site[self.HDF5_GRP_IMAGE]['channel'].attrs['valid'][frame_idx]:
+            if self._is_frame_valid(frame_idx, self.FRAME_RAW_IMAGES):
                 return True
         except:
             pass
         return False
 
+    @synchronized
     def apply_segmentation(self, channel, *args):
         stop_watch = StopWatch(start=True)
 
@@ -569,7 +989,7 @@ class TimeHolder(OrderedDict):
             for region_name in self.reginfo.names[channel_name]:
                 if 'region' in self._grp_site[self.HDF5_GRP_IMAGE]:
                     dset_label_image = self._grp_site[self.HDF5_GRP_IMAGE]['region']
-                    frame_valid = dset_label_image.attrs['valid'][frame_idx]
+                    frame_valid = self._is_frame_valid(frame_idx, self.FRAME_LABEL_IMAGES)
                     if frame_valid:
                         region_idx = self._regions_to_idx2[(channel.NAME, region_name)]
                         if not (region_idx < dset_label_image.shape[0]):
@@ -599,7 +1019,8 @@ class TimeHolder(OrderedDict):
             # this is not ideal if the data is to be browsed.
 
                 # compute segmentation (not loading from file)
-            channel.apply_segmentation(*args)
+            with self._unlocked():
+                channel.apply_segmentation(*args)
 
             self._logger.info('Label images %s computed in %s.'
                           %(desc, stop_watch.interim()))
@@ -625,8 +1046,7 @@ class TimeHolder(OrderedDict):
                                            (nr_labels, t, z, h, w),
                                            'uint16',
                                            chunks=chunk_size((nr_labels, t, z, h, w)),
-                                           compression=self._hdf5_compression)
-                    var_labels.attrs['valid'] = numpy.zeros(t)
+                                           **self._hdf5_filters(self.FILTER_LABEL_IMAGES))
 
                 frame_idx = self._frames_to_idx[self._iCurrentT]
                 for region_name in self.reginfo.names[channel_name]:
@@ -634,14 +1054,14 @@ class TimeHolder(OrderedDict):
                         continue
                     idx = self._regions_to_idx2[(channel.NAME, region_name)]
                     container = channel.containers[region_name]
-                    array = container.img_labels.toArray(copy=False)
-                    var_labels[idx, frame_idx, 0] = numpy.require(array, 'uint16')
-                    ### Workaround... h5py attributes do not support transparent list types...
-                    tmp = var_labels.attrs['valid']
-                    tmp[frame_idx] = 1
-                    var_labels.attrs['valid'] = tmp
+                    # the write-behind thread needs its own copy of the buffer
+                    array = container.img_labels.toArray(copy=self._writer is not None)
+                    self._hdf5_write(var_labels, (idx, frame_idx, 0),
+                                     numpy.require(array, 'uint16'))
+                self._hdf5_set_frame_status(frame_idx, self.FRAME_LABEL_IMAGES)
         return
 
+    @synchronized
     def prepare_raw_image(self, channel):
         if channel.is_virtual():
             # no raw image in a merged channel
@@ -655,7 +1075,7 @@ class TimeHolder(OrderedDict):
             if 'channel' in self._grp_site[self.HDF5_GRP_IMAGE]:
                 frame_idx = self._frames_to_idx[self._iCurrentT]
                 dset_raw_image = self._grp_site[self.HDF5_GRP_IMAGE]['channel']
-                frame_valid = dset_raw_image.attrs['valid'][frame_idx]
+                frame_valid = self._is_frame_valid(frame_idx, self.FRAME_RAW_IMAGES)
                 if frame_valid:
                     # Double check if image_data contains data
                     coordinate = Coordinate(position=self.P, time=self._iCurrentT,
@@ -678,9 +1098,10 @@ class TimeHolder(OrderedDict):
             self._logger.info('Raw image %s loaded from hdf5 file in %s.'
                               % (desc, stop_watch.interim()))
         else:
-            channel.apply_zselection()
-            channel.normalize_image(self.plate_id)
-            channel.apply_registration()
+            with self._unlocked():
+                channel.apply_zselection()
+                channel.normalize_image(self.plate_id)
+                channel.apply_registration()
             self._logger.info('Raw image %s prepared in %s.' % (desc, stop_watch.interim()))
 
             if self._hdf5_create and self._hdf5_include_raw_images:
@@ -704,17 +1125,14 @@ class TimeHolder(OrderedDict):
                                            (ncolors, t, z, h, w),
                                            'uint8',
                                            chunks=chunk_size((ncolors, t, z, h, w)),
-                                           compression=self._hdf5_compression)
-                    var_images.attrs['valid'] = numpy.zeros(t)
+                                           **self._hdf5_filters(self.FILTER_RAW_IMAGES))
 
                 frame_idx = self._frames_to_idx[self._iCurrentT]
                 channel_idx = self._channels_to_idx[channel.PREFIX]
                 img = channel.meta_image.image
-                array = img.toArray(copy=False)
-                var_images[channel_idx, frame_idx, 0] = array
-                tmp = var_images.attrs['valid']
-                tmp[frame_idx] = 1
-                var_images.attrs['valid'] = tmp
+                array = img.toArray(copy=self._writer is not None)
+                self._hdf5_write(var_images, (channel_idx, frame_idx, 0), array)
+                self._hdf5_set_frame_status(frame_idx, self.FRAME_RAW_IMAGES)
                 self._logger.info('Raw image %s written to hdf5 file.' % desc)
 
     def _get_feature_group(self):
@@ -745,7 +1163,9 @@ class TimeHolder(OrderedDict):
                 eccentricity_idx = None
 
             try:
-                crack_contours = cur_pos.get_crack_contour(current_object_idx, combined_region_name, bb_corrected=False)
+                crack_contours = readCrackContours(
+                    self._grp_site[self.HDF5_GRP_FEATURE][combined_region_name],
+                    current_object_idx)
             except:
                 crack_contours = None
 
@@ -755,7 +1175,7 @@ class TimeHolder(OrderedDict):
                     # build a new ImageObject
                     obj = ImageObject(c_obj)
                     obj.iId = obj_id
-                    if len(crack_contours) > 0:
+                    if crack_contours is not None and len(crack_contours) > 0:
                         obj.crack_contour = crack_contours[j]
                     else:
                         # Fallback if cracks are not safed in cellh5
@@ -850,6 +1270,7 @@ class TimeHolder(OrderedDict):
         dset_tmp[:] = assign_table
         dset_tmp.attrs["feature_groups"] = numpy.array([("group_%02d" % i, FeatureGroups.values()[i].group_name) for i in range(n_feature_groups)], dtype='|S64')
 
+    @synchronized
     def apply_features(self, channel):
         stop_watch = StopWatch(start=True)
         channel_name = channel.NAME.lower()
@@ -858,7 +1279,8 @@ class TimeHolder(OrderedDict):
             self._apply_features_from_hdf5(channel)
             how = "loaded"
         else:
-            channel.apply_features()
+            with self._unlocked():
+                channel.apply_features()
             how = "computed"
         desc = '[P %s, T %05d, C %s]' % (self.P, self._iCurrentT,
                                          channel.strChannelId)
@@ -901,6 +1323,13 @@ class TimeHolder(OrderedDict):
                 if 'crack_contour' not in global_def_group:
                     dset_tmp = global_def_group.create_dataset('crack_contour', (1,), [('name', '|S512')])
                     dset_tmp[:] = ('contour_polygon',)
+                if self._hdf5_crack_format == self.CRACK_FORMAT_BINARY:
+                    if 'crack_contour_index' not in global_def_group:
+                        dset_tmp = global_def_group.create_dataset('crack_contour_index', (2,), [('name', '|S16')])
+                        dset_tmp[:] = ['start', 'stop']
+                    if 'crack_contour_coordinates' not in global_def_group:
+                        dset_tmp = global_def_group.create_dataset('crack_contour_coordinates', (2,), [('name', '|S16')])
+                        dset_tmp[:] = ['x', 'y']
 
 
                 ### write bounding-box, center, etc per object
@@ -908,197 +1337,312 @@ class TimeHolder(OrderedDict):
                 grp_region_features = grp_feature.require_group(combined_region_name)
 
                 # create object mapping tables
-                if combined_region_name not in grp_cur_pos[self.HDF5_GRP_OBJECT]:
-                    dtype = numpy.dtype([('time_idx', 'int32'),
-                                         ('obj_label_id', 'int32'),
-                                         ])
-
-                    dset_idx_relation = grp_cur_pos[self.HDF5_GRP_OBJECT].create_dataset(combined_region_name,
-                                                          (nr_objects,),
-                                                          dtype,
-                                                          chunks=(nr_objects if nr_objects > 0 else 1,),
-                                                          compression=self._hdf5_compression,
-                                                          maxshape=(None,))
+                grp_objects = grp_cur_pos[self.HDF5_GRP_OBJECT]
+                if (combined_region_name in grp_objects and
+                    self._is_reused(grp_objects[combined_region_name])):
                     offset = 0
                 else:
-                    if not "reused" in grp_cur_pos[self.HDF5_GRP_OBJECT][combined_region_name].attrs.keys():
-                        dset_idx_relation = grp_cur_pos[self.HDF5_GRP_OBJECT][combined_region_name]
-                        offset = len(dset_idx_relation)
-                        dset_idx_relation.resize((nr_objects + offset,))
-                    else:
-                        offset = 0
+                    offset = self._object_rows.get(combined_region_name, 0)
+                nr_rows = offset + nr_objects
 
+                dset_idx_relation = self._require_object_table(
+                    grp_objects, combined_region_name, self.HDF5_DTYPE_OBJECT_INDEX,
+                    combined_region_name, nr_rows, nr_objects,
+                    fillvalue=numpy.array((-1, -1), self.HDF5_DTYPE_OBJECT_INDEX))
 
                 # create mapping from primary to secondary, tertiary, etc
                 if channel_name != PrimaryChannel.PREFIX:
                     prim_obj_name = self._convert_region_name(self._region_infos[0][0], self._region_infos[0][2], prefix='')
                     obj_name = self._convert_region_name(channel_name, region_name, prefix='')
                     obj_name = '%s___to___%s' % (prim_obj_name, obj_name)
-                    if obj_name not in grp_cur_pos[self.HDF5_GRP_OBJECT]:
-                        dt = [('idx1', 'int32'),('idx2', 'int32')]
-                        dset_cross_rel = grp_cur_pos[self.HDF5_GRP_OBJECT].create_dataset(obj_name,
-                                                                                      (nr_objects,),
-                                                                                      dt,
-                                                                                      chunks=(nr_objects if nr_objects > 0 else 1,),
-                                                                                      compression=self._hdf5_compression,
-                                                                                      maxshape=(None,))
+                    dset_cross_rel = self._require_object_table(
+                        grp_objects, obj_name, self.HDF5_DTYPE_CROSS_RELATION,
+                        combined_region_name, nr_rows, nr_objects)
 
-                    else:
-                        dset_cross_rel = grp_cur_pos[self.HDF5_GRP_OBJECT][obj_name]
-                        dset_cross_rel.resize((nr_objects + offset,))
-
-                # Create dataset for bounding box
-                if 'bounding_box' not in grp_region_features:
-                    dtype = numpy.dtype([('left', 'int32'),
-                                         ('right', 'int32'),
-                                         ('top', 'int32'),
-                                         ('bottom', 'int32'),
-                                         ])
-
-                    dset_bounding_box = grp_region_features.create_dataset('bounding_box',
-                                                          (nr_objects,),
-                                                          dtype,
-                                                          chunks=(nr_objects if nr_objects > 0 else 1,),
-                                                          compression=self._hdf5_compression,
-                                                          maxshape=(None,))
-                else:
-                    if not "reused" in grp_region_features['bounding_box'].attrs.keys():
-                        dset_bounding_box = grp_region_features['bounding_box']
-                        dset_bounding_box.resize((nr_objects + offset,))
-
-                # Create dataset for orientation
-                if 'orientation' not in grp_region_features:
-                    dtype = numpy.dtype([('angle', 'float'),
-                                         ('eccentricity', 'float'),])
-
-                    dset_orientation = grp_region_features.create_dataset('orientation',
-                                                      (nr_objects,),
-                                                      dtype,
-                                                      chunks=(nr_objects if nr_objects > 0 else 1,),
-                                                      compression=self._hdf5_compression,
-                                                      maxshape=(None,))
-                else:
-                    if not "reused" in grp_region_features['orientation'].attrs.keys():
-                        dset_orientation = grp_region_features['orientation']
-                        dset_orientation.resize((nr_objects + offset,))
-
-                # Create dataset for center
-                if 'center' not in grp_region_features:
-                    dtype = numpy.dtype([('x', 'int32'),
-                                         ('y', 'int32'),])
-
-                    dset_center = grp_region_features.create_dataset('center',
-                                                          (nr_objects,),
-                                                          dtype,
-                                                          chunks=(nr_objects if nr_objects > 0 else 1,),
-                                                          compression=self._hdf5_compression,
-                                                          maxshape=(None,))
-                else:
-                    if not "reused" in grp_region_features['center'].attrs.keys():
-                        dset_center = grp_region_features['center']
-                        dset_center.resize((nr_objects + offset,))
+                dset_bounding_box = self._require_object_table(
+                    grp_region_features, 'bounding_box', self.HDF5_DTYPE_BOUNDING_BOX,
+                    combined_region_name, nr_rows, nr_objects)
+
+                dset_orientation = self._require_object_table(
+                    grp_region_features, 'orientation', self.HDF5_DTYPE_ORIENTATION,
+                    combined_region_name, nr_rows, nr_objects)
+
+                dset_center = self._require_object_table(
+                    grp_region_features, 'center', self.HDF5_DTYPE_CENTER,
+                    combined_region_name, nr_rows, nr_objects)
 
                 if (self._hdf5_include_features or self._hdf5_include_classification):
-                    # Create dataset for center
-                    if 'object_features' not in grp_region_features:
-                        dset_object_features = grp_region_features.create_dataset('object_features',
-                                                          (nr_objects, nr_features),
-                                                          dtype='float',
-                                                          compression=self._hdf5_compression,
-                                                          maxshape=(None, nr_features))
-                    elif nr_objects > 0:
-                        if not "reused" in grp_region_features['object_features'].attrs.keys():
-                            dset_object_features = grp_region_features['object_features']
-                            dset_object_features.resize(nr_objects + offset, axis=0)
-                            # This I do not understand: if you set this to false,
-                            # features are not written for the following frames !
-                            # self._hdf5_include_features = False
+                    dset_object_features = self._require_object_table(
+                        grp_region_features, 'object_features', numpy.dtype('float'),
+                        combined_region_name, nr_rows, nr_objects, ncols=nr_features)
 
                 if self._hdf5_include_crack:
-                    if 'crack_contour' not in grp_region_features:
-                        dt = h5py.new_vlen(str)
-                        dset_crack_contour = grp_region_features.create_dataset('crack_contour',
-                                                (nr_objects, ), dt,
-                                                chunks=(nr_objects if nr_objects > 0 else 1, ),
-                                                maxshape=(None,))
+                    if self._hdf5_crack_format == self.CRACK_FORMAT_BINARY:
+                        dset_crack_index = self._require_object_table(
+                            grp_region_features, 'crack_contour_index',
+                            self.HDF5_DTYPE_CONTOUR_INDEX,
+                            combined_region_name, nr_rows, nr_objects,
+                            filters=self.FILTER_CONTOURS)
+                        if not self._is_reused(dset_crack_index):
+                            crack_coords, crack_index = \
+                                self._crack_contour_arrays(region, combined_region_name)
+                            nr_points = crack_index['stop'][-1] if nr_objects else 0
+                            dset_crack_coords = self._require_object_table(
+                                grp_region_features, 'crack_contour_coordinates',
+                                self._crack_contour_dtype(), combined_region_name,
+                                max(nr_points, self._contour_points.get(combined_region_name, 0)),
+                                len(crack_coords), ncols=2,
+                                filters=self.FILTER_CONTOURS)
                     else:
-                        if not "reused" in grp_region_features['crack_contour'].attrs.keys():
-                            dset_crack_contour = grp_region_features['crack_contour']
-                            dset_crack_contour.resize((nr_objects + offset, ))
+                        dset_crack_contour = self._require_object_table(
+                            grp_region_features, 'crack_contour', h5py.new_vlen(str),
+                            combined_region_name, nr_rows, nr_objects,
+                            filters=self.FILTER_CONTOURS)
 
+                if not self._is_reused(dset_idx_relation):
+                    self._object_rows[combined_region_name] = nr_rows
+                    self._object_frames[combined_region_name] = \
+                        self._object_frames.get(combined_region_name, 0) + 1
 
                 frame_idx = self._frames_to_idx[self._iCurrentT]
-                for idx, obj_id in enumerate(region):
-                    obj = region[obj_id]
-
-                    ### Important: save unified objects and relations lookup into _object_coord_to_id
-                    idx_new = offset + idx
-                    new_obj_id = idx_new + 1
-                    coord = frame_idx, obj_id
-
-                    self._object_coord_to_id[(channel.PREFIX, coord)] = new_obj_id
-                    self._object_coord_to_idx[(channel.PREFIX, coord)] = idx_new
-
-                    if not "reused" in grp_region_features['bounding_box'].attrs.keys():
-                        dset_bounding_box[idx + offset] = obj.oRoi.upperLeft[0], obj.oRoi.lowerRight[0], obj.oRoi.upperLeft[1], obj.oRoi.lowerRight[1]
-                    if not "reused" in grp_region_features['center'].attrs.keys():
-                        dset_center[idx + offset] = obj.oCenterAbs
-
-                    # is case one don't wants nan's written to the hdf5 file
-                    # if np.isnan(obj.orientation.angle)
-                    if not "reused" in grp_region_features['orientation'].attrs.keys():
-                        dset_orientation[idx + offset] = obj.orientation.angle, obj.orientation.eccentricity
-                    if not "reused" in grp_cur_pos[self.HDF5_GRP_OBJECT][combined_region_name].attrs.keys():
-                        dset_idx_relation[idx + offset] = frame_idx, obj_id
-
-                    if self._hdf5_include_features:
-                        if len(obj.aFeatures) > 0:
-                            if not "reused" in grp_region_features['object_features'].attrs.keys():
-                                dset_object_features[idx + offset] = obj.aFeatures
-
-                    if self._hdf5_include_crack:
-                        if not "reused" in grp_region_features['crack_contour'].attrs.keys():
-                            data = ','.join(map(str, numpy.array(obj.crack_contour).flatten()))
-                            dset_crack_contour[idx + offset] = base64.b64encode(zlib.compress(data))
-
-                    if channel_name != PrimaryChannel.PREFIX:
-                        dset_cross_rel[idx + offset] = (idx, idx)
+                ### Important: save unified objects and relations lookup
+                self._object_index.setdefault(channel.PREFIX, ObjectIndex()).add(
+                    frame_idx, region.keys(), offset)
+
+                if nr_objects == 0:
+                    continue
+
+                # one slice assignment per dataset instead of one write per object
+                rows = slice(offset, offset + nr_objects)
+                columns = self._object_columns(region, frame_idx)
+
+                if not self._is_reused(grp_region_features['bounding_box']):
+                    self._hdf5_write(dset_bounding_box, rows, columns['bounding_box'])
+                if not self._is_reused(grp_region_features['center']):
+                    self._hdf5_write(dset_center, rows, columns['center'])
+                if not self._is_reused(grp_region_features['orientation']):
+                    self._hdf5_write(dset_orientation, rows, columns['orientation'])
+                if not self._is_reused(grp_cur_pos[self.HDF5_GRP_OBJECT][combined_region_name]):
+                    self._hdf5_write(dset_idx_relation, rows, columns['object_index'])
+
+                if self._hdf5_include_features and nr_features > 0:
+                    if not self._is_reused(grp_region_features['object_features']):
+                        features, has_features = self._feature_matrix(region, nr_features)
+                        if has_features.all():
+                            self._hdf5_write(dset_object_features, rows, features)
+                        else:
+                            # objects without features keep the fill value
+                            for i in numpy.flatnonzero(has_features):
+                                self._hdf5_write(dset_object_features, offset + i, features[i])
+
+                if self._hdf5_include_crack:
+                    if self._hdf5_crack_format == self.CRACK_FORMAT_BINARY:
+                        if not self._is_reused(dset_crack_index):
+                            points = slice(crack_index['start'][0], crack_index['stop'][-1])
+                            self._hdf5_write(dset_crack_coords, points, crack_coords)
+                            self._hdf5_write(dset_crack_index, rows, crack_index)
+                            self._contour_points[combined_region_name] = points.stop
+                    elif not self._is_reused(grp_region_features['crack_contour']):
+                        self._hdf5_write(dset_crack_contour, rows, self._crack_contour_strings(region))
+
+                if channel_name != PrimaryChannel.PREFIX:
+                    self._hdf5_write(dset_cross_rel, rows, columns['cross_relation'])
+
+    def _estimate_object_rows(self, region_key, nr_rows, nr_allocated=0):
+        """Estimate the number of rows of an object table for the whole position
+        from the mean number of objects of the frames processed so far."""
+        nr_frames = len(self._analysis_frames)
+        frames_done = self._object_frames.get(region_key, 0) + 1
+        return object_table_rows(nr_rows, frames_done, nr_frames, nr_allocated)
+
+    def _require_object_table(self, grp, name, dtype, region_key, nr_rows,
+                              nr_objects, ncols=None, fillvalue=None,
+                              filters=FILTER_FEATURES):
+        """Return the object table grp[name] with at least nr_rows rows.
+
+        New tables are preallocated for the estimated number of objects of the
+        position and grow in large steps. The used number of rows is recorded,
+        unused rows are trimmed in close_all(). filters is the dataset class
+        of the compression filters, None for no compression.
+        """
+        if filters is None:
+            filters = dict(compression=None)
+        else:
+            filters = self._hdf5_filters(filters)
+
+        if name not in grp:
+            tail = tuple() if ncols is None else (ncols, )
+            nr_alloc = self._estimate_object_rows(region_key, nr_rows)
+            if 0 in tail:
+                chunks = None
+            else:
+                row_nbytes = dtype.itemsize*numpy.prod(tail, dtype=int)
+                chunks = (object_chunk_rows(nr_objects, row_nbytes), ) + tail
+            dset = grp.create_dataset(name, (nr_alloc, ) + tail, dtype,
+                                      chunks=chunks,
+                                      fillvalue=fillvalue,
+                                      maxshape=(None, ) + tail,
+                                      **filters)
+        else:
+            dset = grp[name]
+            if self._is_reused(dset):
+                return dset
+            if dset.shape[0] < nr_rows:
+                dset.resize(self._estimate_object_rows(
+                        region_key, nr_rows, dset.shape[0]), axis=0)
+
+        self._object_tables[dset.name] = \
+            max(nr_rows, self._object_tables.get(dset.name, 0))
+        return dset
+
+    def _trim_object_tables(self):
+        """Remove the preallocated but unused rows of the object tables."""
+        for name, nr_rows in self._object_tables.iteritems():
+            dset = self._hdf5_file[name]
+            if dset.shape[0] > nr_rows:
+                dset.resize(nr_rows, axis=0)
+        self._object_tables.clear()
+
+    @staticmethod
+    def _is_reused(dset):
+        """True if the dataset was copied over from a previous cellh5 file."""
+        return "reused" in dset.attrs.keys()
+
+    def _object_columns(self, region, frame_idx):
+        """Collect the per object tables of a region (one frame) as structured
+        arrays with the same dtype as the cellh5 datasets."""
+        nr_objects = len(region)
+        objects = region.values()
+
+        bbox = numpy.array([(o.oRoi.upperLeft[0], o.oRoi.lowerRight[0],
+                             o.oRoi.upperLeft[1], o.oRoi.lowerRight[1])
+                            for o in objects], dtype=self.HDF5_DTYPE_BOUNDING_BOX)
+        center = numpy.array([tuple(o.oCenterAbs) for o in objects],
+                             dtype=self.HDF5_DTYPE_CENTER)
+        orientation = numpy.array([(o.orientation.angle, o.orientation.eccentricity)
+                                   for o in objects], dtype=self.HDF5_DTYPE_ORIENTATION)
+
+        object_index = numpy.empty((nr_objects, ), dtype=self.HDF5_DTYPE_OBJECT_INDEX)
+        object_index['time_idx'] = frame_idx
+        object_index['obj_label_id'] = region.keys()
+
+        cross_relation = numpy.empty((nr_objects, ), dtype=self.HDF5_DTYPE_CROSS_RELATION)
+        cross_relation['idx1'] = numpy.arange(nr_objects)
+        cross_relation['idx2'] = cross_relation['idx1']
+
+        return {'bounding_box': bbox,
+                'center': center,
+                'orientation': orientation,
+                'object_index': object_index,
+                'cross_relation': cross_relation}
+
+    def _feature_matrix(self, region, nr_features):
+        """Return the (n_objects x n_features) matrix of a region and a boolean
+        mask of the objects that have features at all."""
+        features = numpy.zeros((len(region), nr_features), dtype=float)
+        has_features = numpy.zeros((len(region), ), dtype=bool)
+        for i, obj in enumerate(region.itervalues()):
+            if len(obj.aFeatures) > 0:
+                features[i] = obj.aFeatures
+                has_features[i] = True
+        return features, has_features
+
+    def _crack_contour_dtype(self):
+        """Smallest integer type for crack contour coordinates."""
+        if max(self._meta_data.dim_x, self._meta_data.dim_y) < 2**15:
+            return numpy.dtype('int16')
+        return numpy.dtype('int32')
+
+    def _crack_contour_arrays(self, region, region_key):
+        """Return the crack contours of a region as flat (n_points x 2)
+        coordinate array and the start/stop index of each object in the
+        coordinate table of the position."""
+        contours = [numpy.asarray(obj.crack_contour).reshape((-1, 2))
+                    for obj in region.itervalues()]
+        counts = numpy.array([c.shape[0] for c in contours], dtype=int)
+
+        index = numpy.empty((len(region), ), dtype=self.HDF5_DTYPE_CONTOUR_INDEX)
+        index['stop'] = self._contour_points.get(region_key, 0) + numpy.cumsum(counts)
+        index['start'] = index['stop'] - counts
+
+        if contours:
+            coords = numpy.concatenate(contours).astype(self._crack_contour_dtype())
+        else:
+            coords = numpy.empty((0, 2), dtype=self._crack_contour_dtype())
+        return coords, index
+
+    def _crack_contour_strings(self, region):
+        contours = numpy.empty((len(region), ), dtype=object)
+        for i, obj in enumerate(region.itervalues()):
+            data = ','.join(map(str, numpy.array(obj.crack_contour).flatten()))
+            contours[i] = base64.b64encode(zlib.compress(data))
+        return contours
+
+    def _frame_indices(self, frames):
+        """Map an array of frames to frame indices."""
+        frames = numpy.asarray(frames)
+        keys = numpy.array(sorted(self._frames_to_idx.keys()), dtype=int)
+        values = numpy.array([self._frames_to_idx[k] for k in keys], dtype=int)
+        pos = numpy.clip(numpy.searchsorted(keys, frames), 0, max(keys.size-1, 0))
+        if keys.size == 0 or (keys[pos] != frames).any():
+            raise KeyError("Frames not found in position %s" %self.P)
+        return values[pos]
+
+    def _object_indices(self, prefix, nodeids):
+        """Return the object table rows of a sequence of tracking node ids."""
+        frames, labels = Tracker.split_nodeids(nodeids)
+        return self._object_index[prefix].lookup(
+            self._frame_indices(frames), labels)
+
+    def append_tracking(self, heads, tails):
+        """Append edges given by head and tail node ids to the tracking
+        dataset. Used by streaming tracking, which writes the edges frame by
+        frame instead of the whole graph at the end (serialize_tracking)."""
+
+        if not (self._hdf5_create and self._hdf5_include_tracking):
+            return
+
+        grp = self._grp_site[self.HDF5_GRP_OBJECT]
+        if 'tracking' in grp:
+            var_rel = grp['tracking']
+        else:
+            var_rel = grp.create_dataset(
+                'tracking', (0, ), self.HDF5_DTYPE_RELATION,
+                chunks=(object_chunk_rows(
+                    TRACKING_CHUNK_ROWS, self.HDF5_DTYPE_RELATION.itemsize), ),
+                maxshape=(None, ), **self._hdf5_filters(self.FILTER_FEATURES))
+
+        nr_edges = len(heads)
+        if nr_edges > 0:
+            prefix = PrimaryChannel.PREFIX
+            data = numpy.empty((nr_edges, ), dtype=self.HDF5_DTYPE_RELATION)
+            data['obj_idx1'] = self._object_indices(prefix, heads)
+            data['obj_idx2'] = self._object_indices(prefix, tails)
+
+            offset = var_rel.shape[0]
+            var_rel.resize((offset + nr_edges, ))
+            self._hdf5_write(var_rel, slice(offset, offset + nr_edges), data)
 
     def serialize_tracking(self, graph):
 
         # export full graph structure to .dot file
         if self._hdf5_create and self._hdf5_include_tracking:
             grp = self._grp_site[self.HDF5_GRP_OBJECT]
-
-            head_nodes = [node_id for node_id in graph.node_list()
-                          if graph.in_degree(node_id) == 0 and graph.out_degree(node_id) > 0]
             nr_edges = graph.number_of_edges()
-            nr_objects = len(head_nodes)
 
             var_rel = grp.create_dataset('tracking',
                                          (nr_edges, ),
                                          self.HDF5_DTYPE_RELATION,
                                          chunks=(nr_edges if nr_edges > 0 else 1,),
-                                         compression=self._hdf5_compression)
+                                         **self._hdf5_filters(self.FILTER_FEATURES))
 
-            prefix = PrimaryChannel.PREFIX
-            data = []
-            for idx, edge in enumerate(graph.edges.itervalues()):
-                head_id, tail_id = edge[:2]
-                head_frame, head_obj_id = \
-                    Tracker.split_nodeid(head_id)[:2]
-                head_frame_idx = self._frames_to_idx[head_frame]
-                tail_frame, tail_obj_id = \
-                    Tracker.split_nodeid(tail_id)[:2]
-                tail_frame_idx = self._frames_to_idx[tail_frame]
-
-                head_obj_idx_meta = self._object_coord_to_idx[(prefix, (head_frame_idx, head_obj_id))]
-                tail_obj_idx_meta = self._object_coord_to_idx[(prefix, (tail_frame_idx, tail_obj_id))]
-
-                data.append((head_obj_idx_meta,
-                             tail_obj_idx_meta))
-            if len(data) > 0:
-                var_rel[:] = data
+            if nr_edges > 0:
+                prefix = PrimaryChannel.PREFIX
+                heads, tails = graph.edge_arrays()
+                data = numpy.empty((nr_edges, ), dtype=self.HDF5_DTYPE_RELATION)
+                data['obj_idx1'] = self._object_indices(prefix, heads)
+                data['obj_idx2'] = self._object_indices(prefix, tails)
+                self._hdf5_write(var_rel, slice(None), data)
 
     def serialize_events(self, tracker):
         if self._hdf5_create and self._hdf5_include_events:
@@ -1107,55 +1651,42 @@ class TimeHolder(OrderedDict):
                 return
             for events in tracker.visitor_data.itervalues():
                 for start_id, event in events.iteritems():
-                    if start_id[0] != '_':
-                        key = Tracker.split_nodeid(start_id)[:2]
-                        event_lookup.setdefault(key, []).append(event)
+                    # skip '_full_tracks' etc., daughter tracks of a split
+                    # event are keyed by (start_id, branch)
+                    if isinstance(start_id, basestring):
+                        continue
+                    if isinstance(start_id, tuple):
+                        start_id = start_id[0]
+                    event_lookup.setdefault(start_id, []).append(event)
             nr_events = len(event_lookup)
-            nr_edges = 0
-            for events in event_lookup.itervalues():
-                if len(events) == 1:
-                    nr_edges += events[0]['maxLength'] - 1
-                elif len(events) == 2:
-                    splt = events[0]['splitIdx']
-                    nr_edges += events[0]['maxLength'] + events[1]['maxLength'] - splt - 1
-                else:
-                    raise ValueError("More than two daughter cell are not supported.")
 
             object_group = self._grp_site[self.HDF5_GRP_OBJECT]
 
             if nr_events > 0:
-                var_event = object_group.create_dataset('event', (nr_edges,), self.HDF5_DTYPE_EDGE, maxshape=(None,))
-
-                obj_idx = 0
-                rel_idx = 0
-                for events in event_lookup.itervalues():
-                    obj_id = obj_idx
-                    track = events[0]['tracks'][0]
-                    for head_id, tail_id in zip(track, track[1:]):
-                        head_frame, head_obj_id = Tracker.split_nodeid(head_id)[:2]
-                        haed_frame_idx = self._frames_to_idx[head_frame]
-                        head_id_ = self._object_coord_to_idx[('primary', (haed_frame_idx, head_obj_id))]
-
-                        tail_frame, tail_obj_id = Tracker.split_nodeid(tail_id)[:2]
-                        tail_frame_idx = self._frames_to_idx[tail_frame]
-                        tail_id_ = self._object_coord_to_idx[('primary', (tail_frame_idx, tail_obj_id))]
-
-                        var_event[rel_idx] = (obj_id, head_id_, tail_id_)
-                        rel_idx += 1
+                # edge list of all events, the second daughter track starts
+                # at the split
+                obj_ids, heads, tails = [], [], []
+                for obj_id, events in enumerate(event_lookup.itervalues()):
+                    if len(events) > 2:
+                        raise ValueError("More than two daughter cell are not supported.")
+                    tracks = [events[0]['tracks'][0]]
                     if len(events) == 2:
                         splt = events[1]['splitIdx']
-                        track = events[1]['tracks'][0][splt-1:]
-                        for head_id, tail_id in zip(track, track[1:]):
-                            head_frame, head_obj_id = Tracker.split_nodeid(head_id)[:2]
-                            haed_frame_idx = self._frames_to_idx[head_frame]
-                            head_id_ = self._object_coord_to_idx[('primary', (haed_frame_idx, head_obj_id))]
-
-                            tail_frame, tail_obj_id = Tracker.split_nodeid(tail_id)[:2]
-                            tail_frame_idx = self._frames_to_idx[tail_frame]
-                            tail_id_ = self._object_coord_to_idx[('primary', (tail_frame_idx, tail_obj_id))]
-                            var_event[rel_idx] = (obj_id, head_id_, tail_id_)
-                            rel_idx += 1
-                    obj_idx += 1
+                        tracks.append(events[1]['tracks'][0][splt-1:])
+                    for track in tracks:
+                        heads.extend(track[:-1])
+                        tails.extend(track[1:])
+                        obj_ids.extend([obj_id]*(len(track) - 1))
+
+                nr_edges = len(obj_ids)
+                data = numpy.empty((nr_edges, ), dtype=self.HDF5_DTYPE_EDGE)
+                data['obj_id'] = obj_ids
+                data['idx1'] = self._object_indices('primary', heads)
+                data['idx2'] = self._object_indices('primary', tails)
+
+                var_event = object_group.create_dataset('event', (nr_edges,), self.HDF5_DTYPE_EDGE, maxshape=(None,))
+                if nr_edges > 0:
+                    self._hdf5_write(var_event, slice(None), data)
             else:
                 var_event = object_group.create_dataset('event', (0,),
                                                       self.HDF5_DTYPE_EDGE,
@@ -1212,13 +1743,12 @@ class TimeHolder(OrderedDict):
         current_classification_grp = current_classification_grp.require_group('object_classification')
 
         if 'prediction' not in current_classification_grp:
-            dt = numpy.dtype([('label_idx', 'int32')])
             dset_prediction = current_classification_grp.create_dataset(
                 'prediction',
-                (nr_objects, ), dt,
+                (nr_objects, ), self.HDF5_DTYPE_PREDICTION,
                 chunks=(nr_objects if nr_objects > 0 else 1,),
-                compression=self._hdf5_compression,
-                maxshape=(None,))
+                maxshape=(None,),
+                **self._hdf5_filters(self.FILTER_FEATURES))
             offset = 0
         else:
             dset_prediction = current_classification_grp['prediction']
@@ -1231,23 +1761,39 @@ class TimeHolder(OrderedDict):
                 dset_probability = current_classification_grp.create_dataset(var_name, (nr_objects, nr_classes),
                                            'float',
                                            chunks=(nr_objects if nr_objects > 0 else 1, nr_classes),
-                                           compression=self._hdf5_compression,
-                                           maxshape=(None, nr_classes)
-                                           )
+                                           maxshape=(None, nr_classes),
+                                           **self._hdf5_filters(self.FILTER_FEATURES))
             else:
                 dset_probability = current_classification_grp[var_name]
                 dset_probability.resize((offset+nr_objects, nr_classes))
 
-        label2idx = dict([(l, i) for i, l in enumerate(predictor.classdef.names.keys())])
+        if nr_objects == 0:
+            return
+
+        # one write per dataset and frame
+        rows = slice(offset, offset + nr_objects)
+        prediction, probability = self._classification_columns(
+            region, predictor.classdef)
+        self._hdf5_write(dset_prediction, rows, prediction)
+        if predictor.SaveProbs:
+            self._hdf5_write(dset_probability, rows, probability)
+
+    def _classification_columns(self, region, classdef):
+        """Return the label indices and the (n_objects x n_classes) probability
+        matrix of a region. The column order of the probabilities is the order
+        of the class labels in the class definition."""
+        labels = classdef.names.keys()
+        label2idx = dict([(l, i) for i, l in enumerate(labels)])
+
+        prediction = numpy.empty((len(region), ), dtype=self.HDF5_DTYPE_PREDICTION)
+        prediction['label_idx'] = self.UNPREDICTED_LABEL
+        probability = numpy.empty((len(region), len(labels)), dtype=float)
+        probability.fill(self.UNPREDICTED_PROB)
 
         for i, obj in enumerate(region.itervalues()):
-            # replace default for unlabeld object with numerical values
-            if obj.iLabel is None:
-                dset_prediction[i+offset] = (self.UNPREDICTED_LABEL, )
-                probs = [self.UNPREDICTED_PROB]*len(predictor.classdef)
-            else:
-                dset_prediction[i+offset] = (label2idx[obj.iLabel], )
-                probs = obj.dctProb.values()
+            # objects without label keep the defaults for unlabeled objects
+            if obj.iLabel is not None:
+                prediction['label_idx'][i] = label2idx[obj.iLabel]
+                probability[i] = [obj.dctProb[l] for l in labels]
 
-            if predictor.SaveProbs:
-                dset_probability[i+offset] = probs
+        return prediction, probability
@@ -10,19 +10,28 @@ __copyright__ = ('The CellCognition Project'
 __licence__ = 'LGPL'
 __url__ = 'www.cellcognition.org'
 
-__all__ = ['Tracker']
+__all__ = ['Tracker', 'LapTracker', 'sparse_assignment']
 
 import math
+import heapq
+import bisect
+import numpy as np
 from collections import OrderedDict
+from scipy.spatial import cKDTree
 
 from cecog.logging import LoggerObject
-from cecog.extensions.graphLib import Graph
+from cecog.analyzer.object import ObjectStub
+from cecog.analyzer.trackgraph import TrackingGraph
+from cecog.analyzer.trackgraph import GraphView
+from cecog.analyzer.trackgraph import unpack_nodeids
+from cecog.analyzer.trackgraph import LABEL_BITS, LABEL_MASK
 from cecog import ccore
 
 
 class Tracker(LoggerObject):
 
-    __slots__ = ['graph', '_frame_data','max_object_distance',
+    __slots__ = ['graph', '_frame_data', '_frame_index', '_track_layers',
+                 '_layer_params', '_track_buffers', 'max_object_distance',
                  'max_node_degree', 'max_frame_gap']
 
     def __init__(self, max_object_distance=50, max_node_degree=3,
@@ -31,8 +40,14 @@ class Tracker(LoggerObject):
 
         if max_frame_gap < 1 or not isinstance(max_frame_gap, int):
             raise ValueError("max_frame_gap must be a positive integer")
-        self.graph = Graph()
+        self.graph = TrackingGraph()
         self._frame_data = OrderedDict()
+        # sorted frames for the lookup of preceding frames
+        self._frame_index = []
+        # rendered edges of recent frames, see render_tracks
+        self._track_layers = OrderedDict()
+        self._layer_params = None
+        self._track_buffers = None
 
         self.max_frame_gap = max_frame_gap
         self.max_object_distance = max_object_distance
@@ -41,12 +56,12 @@ class Tracker(LoggerObject):
     @property
     def start_frame(self):
         """Return the index of the first frame."""
-        return min(self._frame_data.keys())
+        return self._frame_index[0]
 
     @property
     def end_frame(self):
         """Returns the index of the last frame currently processed."""
-        return max(self._frame_data.keys())
+        return self._frame_index[-1]
 
     # rename function to frames
     @property
@@ -57,14 +72,25 @@ class Tracker(LoggerObject):
 
     @staticmethod
     def node_id(frame, object_label):
-        return '%d_%s' %(frame, object_label)
+        """Return the node id of an object, (frame, label) packed into
+        an integer."""
+        return (int(frame) << LABEL_BITS) | int(object_label)
 
     @staticmethod
     def split_nodeid(nodeid):
-        return tuple([int(i) for i in nodeid.split('_')])
+        return (nodeid >> LABEL_BITS, nodeid & LABEL_MASK)
+
+    @staticmethod
+    def split_nodeids(nodeids):
+        """Return frames and object labels of a sequence of node ids as two
+        integer arrays."""
+        return unpack_nodeids(np.asarray(nodeids, dtype=np.int64).reshape((-1, )))
 
     def track_next_frame(self, frame, samples):
-        self._frame_data.setdefault(frame, [])
+        if frame not in self._frame_data:
+            self._frame_data[frame] = []
+            bisect.insort(self._frame_index, frame)
+
         for label, sample in samples.iteritems():
             node_id = self.node_id(frame, label)
             self.graph.add_node(node_id, sample)
@@ -72,41 +98,65 @@ class Tracker(LoggerObject):
 
         # connect time point only if any object is present
         if len(self._frame_data[frame]) > 0:
+            nedges = self.graph.next_edge_id
             self.connect_nodes(frame)
+            # new out-arcs of older frames invalidate their rendered edges
+            if self._track_layers:
+                heads = self.graph.edges_from(nedges)[0]
+                self._drop_layers(self.split_nodeids(heads)[0].tolist())
+
+    def release_frame(self, frame, samples=None):
+        """Replace the samples of a frame in the graph by ObjectStubs.
+
+        samples defaults to the tracked samples, other samples (e.g. of a
+        different channel) must use the same object labels. A released frame
+        must be out of reach for the frames that are tracked later.
+        """
+        for label in self._frame_data.get(frame, []):
+            nodeid = self.node_id(frame, label)
+            if samples is None:
+                sample = self.graph.node_data(nodeid)
+            else:
+                sample = samples[label]
+            self.graph.update_node_data(nodeid, ObjectStub(sample))
+        self._drop_layers([frame])
+        self._track_layers.pop(frame, None)
 
     def closest_preceding_frame(self, frame):
         """Return the preceding frame or None if the gap between the to frames
         is larget than max_frame_gap."""
 
-        frames = self._frame_data.keys()
-        icurrent = frames.index(frame)
+        icurrent = bisect.bisect_left(self._frame_index, frame)
 
         pre_frame = None
-        if (0 < icurrent < len(frames)):
-            pre_frame = frames[icurrent-1]
+        if icurrent > 0:
+            pre_frame = self._frame_index[icurrent-1]
         if pre_frame is not None and (frame - pre_frame) > self.max_frame_gap:
             pre_frame = None
         return pre_frame
 
     def clone_graph(self, timeholder, channel, region):
-        """Clone the tracking graph with data from a different channel."""
+        """Return a view of the tracking graph with the samples of a
+        different channel and region as node data."""
 
-        ngraph = Graph()
+        def resolve(nodeid):
+            iframe, objid = Tracker.split_nodeid(nodeid)
+            return timeholder[iframe][channel].get_region(region)[objid]
 
-        # add nodes from other segmentation region
-        for nodeid in self.graph.node_list():
-            iframe, objid = Tracker.split_nodeid(nodeid)[:2]
-            sample = timeholder[iframe][channel].get_region(region)[objid]
-            ngraph.add_node(nodeid, sample)
-
-        for edge in self.graph.edges.values():
-            ngraph.add_edge(*edge)
-
-        return ngraph
+        return GraphView(self.graph, resolve)
 
     def render_tracks(self, frame, size, n=5, radius=3, thick=True):
-        img_conn = ccore.Image(*size)
-        img_split = ccore.Image(*size)
+        """Render the edges of the last n frames into two images, one for
+        connections and one for splits.
+
+        The edges that end in a frame are drawn once into a layer, the layers
+        of the last n frames are kept and combined into the result images.
+        """
+        params = (tuple(size), radius, thick)
+        if params != self._layer_params:
+            self._track_layers.clear()
+            self._layer_params = params
+            self._track_buffers = None
 
         if n < 0 or frame-n+1 < self.start_frame:
             current = self.start_frame
@@ -114,42 +164,89 @@ class Tracker(LoggerObject):
         else:
             current = frame-n+1
 
-        found = False
-        for i in range(n):
-            col = int(max(255.*(i+1)/n, 255))
+        # keep the layers of the current window only
+        for key in self._track_layers.keys():
+            if not current <= key <= frame:
+                del self._track_layers[key]
 
-            if current in self._frame_data:
-                preframe = self.closest_preceding_frame(current)
+        found = False
+        layers = []
+        for key in xrange(current, current+n):
+            if key in self._frame_data:
+                if key not in self._track_layers:
+                    self._track_layers[key] = self._render_layer(key, size,
+                                                                 radius, thick)
+                preframe, layer = self._track_layers[key]
                 if preframe is not None:
                     found = True
-                    for objIdP in self._frame_data[preframe]:
-                        nodeIdP = self.node_id(preframe, objIdP)
-                        objP = self.graph.node_data(nodeIdP)
-
-                        if self.graph.out_degree(nodeIdP) > 1:
-                            img = img_split
-                        else:
-                            img = img_conn
-
-                        for edgeId in self.graph.out_arcs(nodeIdP):
-                            nodeIdC = self.graph.tail(edgeId)
-                            objC = self.graph.node_data(nodeIdC)
-                            ccore.drawLine(ccore.Diff2D(*objP.oCenterAbs),
-                                           ccore.Diff2D(*objC.oCenterAbs),
-                                           img, col,
-                                           thick=thick)
-                            ccore.drawFilledCircle(
-                                ccore.Diff2D(*objC.oCenterAbs), radius, img_conn, col)
-            current += 1
+                    layers.append(layer)
 
         if not found and frame in self._frame_data:
+            img_conn = ccore.Image(*size)
             for objId in self._frame_data[frame]:
                 nodeId = self.node_id(frame, objId)
                 obj = self.graph.node_data(nodeId)
                 ccore.drawFilledCircle(ccore.Diff2D(*obj.oCenterAbs),
-                                       radius, img_conn, col)
-
-        return img_conn, img_split
+                                       radius, img_conn, 255)
+            return img_conn, ccore.Image(*size)
+
+        if not layers:
+            return ccore.Image(*size), ccore.Image(*size)
+
+        if self._track_buffers is None:
+            self._track_buffers = (np.empty_like(layers[0][0]),
+                                   np.empty_like(layers[0][1]))
+        conn, split = self._track_buffers
+        np.copyto(conn, layers[0][0])
+        np.copyto(split, layers[0][1])
+        for lconn, lsplit in layers[1:]:
+            np.maximum(conn, lconn, out=conn)
+            np.maximum(split, lsplit, out=split)
+        return ccore.numpy_to_image(conn, True), ccore.numpy_to_image(split, True)
+
+    def _render_layer(self, frame, size, radius, thick):
+        """Draw the out-arcs of the frame preceding frame, returns the
+        preceding frame and the arrays of the connection and split image."""
+        preframe = self.closest_preceding_frame(frame)
+        if preframe is None:
+            return None, None
+
+        # tracks are drawn in full intensity
+        col = 255
+        img_conn = ccore.Image(*size)
+        img_split = ccore.Image(*size)
+        for objIdP in self._frame_data[preframe]:
+            nodeIdP = self.node_id(preframe, objIdP)
+            objP = self.graph.node_data(nodeIdP)
+
+            if self.graph.out_degree(nodeIdP) > 1:
+                img = img_split
+            else:
+                img = img_conn
+
+            for edgeId in self.graph.out_arcs(nodeIdP):
+                nodeIdC = self.graph.tail(edgeId)
+                objC = self.graph.node_data(nodeIdC)
+                ccore.drawLine(ccore.Diff2D(*objP.oCenterAbs),
+                               ccore.Diff2D(*objC.oCenterAbs),
+                               img, col, thick=thick)
+                ccore.drawFilledCircle(
+                    ccore.Diff2D(*objC.oCenterAbs), radius, img_conn, col)
+        return preframe, (img_conn.toArray(True), img_split.toArray(True))
+
+    def _drop_layers(self, preframes):
+        """Remove the rendered layers that show out-arcs of the given frames."""
+        preframes = set(preframes)
+        for key, (preframe, _) in self._track_layers.items():
+            if preframe in preframes:
+                del self._track_layers[key]
+
+    def _centers(self, frame):
+        """Return node ids and a (n, 2) array of the object centers of a frame."""
+        node_ids = [self.node_id(frame, obj_id) for obj_id in self._frame_data[frame]]
+        centers = np.array([self.graph.node_data(node_id).oCenterAbs
+                            for node_id in node_ids], dtype=float)
+        return node_ids, centers.reshape((-1, 2))
 
     def connect_nodes(self, iT):
         max_dist2 = math.pow(self.max_object_distance, 2)
@@ -166,42 +263,51 @@ class Tracker(LoggerObject):
             dctMerges = {}
             dctSplits = {}
 
-            # for all nodes in this layer
-            for iObjIdP in self._frame_data[iPreviousT]:
+            nodes_p, centers_p = self._centers(iPreviousT)
+            nodes_c, centers_c = self._centers(iT)
 
-                strNodeIdP = self.node_id(iPreviousT, iObjIdP)
-                oImageObjectP = self.graph.node_data(strNodeIdP)
+            # candidates of all nodes of the previous frame within
+            # max_object_distance in one query of a kd-tree over the current frame
+            if nodes_p and nodes_c:
+                tree = cKDTree(centers_c)
+                candidates = tree.query_ball_point(centers_p, self.max_object_distance)
+            else:
+                candidates = []
 
-                lstNearest = []
+            # for all nodes in this layer
+            for strNodeIdP, center_p, icands in zip(nodes_p, centers_p, candidates):
 
-                for iObjIdC in self._frame_data[iT]:
-                    strNodeIdC = self.node_id(iT, iObjIdC)
-                    oImageObjectC = self.graph.node_data(strNodeIdC)
-                    dist = oImageObjectC.squaredMagnitude(oImageObjectP)
+                # same order as the objects of the current frame
+                icands = np.sort(np.asarray(icands, dtype=int))
+                dist = ((centers_c[icands] - center_p)**2).sum(axis=1)
 
-                    # take all candidates within a certain distance
-                    if dist < max_dist2:
-                        lstNearest.append((dist, strNodeIdC))
+                # take all candidates within a certain distance
+                inear = dist < max_dist2
 
                 # lstNearest is the list of nodes in the current frame
                 # whose distance to the previous node is smaller than the
                 # fixed threshold.
-                if len(lstNearest) > 0:
-                    # sort ascending by distance (first tuple element)
-                    lstNearest.sort(key=lambda x: x[0])
+                if inear.any():
+                    icands = icands[inear]
+                    dist = dist[inear]
+
+                    # sort ascending by distance (stable as list.sort)
+                    order = np.argsort(dist, kind='mergesort')
 
                     # take only a certain number as merge candidates (the N closest)
                     # and split candidates (this number is identical).
-                    for dist, strNodeIdC in lstNearest[:self.max_node_degree]:
+                    for i in order[:self.max_node_degree]:
+                        strNodeIdC = nodes_c[icands[i]]
+                        dist_c = float(dist[i])
                         try:
-                            dctMerges[strNodeIdC].append((dist, strNodeIdP))
+                            dctMerges[strNodeIdC].append((dist_c, strNodeIdP))
                         except KeyError:
-                            dctMerges[strNodeIdC] = [(dist, strNodeIdP)]
+                            dctMerges[strNodeIdC] = [(dist_c, strNodeIdP)]
 
                         try:
-                            dctSplits[strNodeIdP].append((dist, strNodeIdC))
+                            dctSplits[strNodeIdP].append((dist_c, strNodeIdC))
                         except KeyError:
-                            dctSplits[strNodeIdP] = [(dist, strNodeIdC)]
+                            dctSplits[strNodeIdP] = [(dist_c, strNodeIdC)]
 
             # dctSplits contains for each node the list of potential
             # successors with distance smaller than threshold.
@@ -234,3 +340,174 @@ class Tracker(LoggerObject):
                         self.graph.add_edge(nodes[0][1], id_c)
 
         return iPreviousT, bReturnSuccess
+
+
+def sparse_assignment(rows, cols, costs, nrows, ncols, alternative):
+    """Minimum cost assignment on a sparse bipartite graph.
+
+    rows, cols and costs list the admissible links. Every row and column is
+    linked at most once, leaving a row unlinked costs alternative. The
+    problem is solved by successive shortest augmenting paths (Dijkstra with
+    column potentials), each row has a private dummy column which stands for
+    'no link'. Only the admissible links are visited, i.e. the runtime
+    depends on the number of links and not on nrows*ncols.
+
+    Returns the arrays of linked rows and columns.
+    """
+    adj = [[] for _ in xrange(nrows)]
+    for r, c, w in zip(np.asarray(rows).tolist(), np.asarray(cols).tolist(),
+                       np.asarray(costs, dtype=float).tolist()):
+        adj[r].append((c, w))
+    for r in xrange(nrows):
+        adj[r].append((ncols + r, alternative))
+
+    pot = [0.0]*(ncols + nrows)      # column potentials
+    col_row = [-1]*(ncols + nrows)   # row linked to a column
+    row_col = [-1]*nrows             # column linked to a row
+    row_cost = [0.0]*nrows           # cost of the link of a row
+
+    for cur in xrange(nrows):
+        # only the dummy column, the row stays unlinked
+        if len(adj[cur]) == 1:
+            continue
+
+        dist = dict()
+        pred = dict()
+        heap = []
+        for c, w in adj[cur]:
+            d = w - pot[c]
+            if d < dist.get(c, np.inf):
+                dist[c] = d
+                pred[c] = (cur, w)
+                heap.append((d, c))
+        heapq.heapify(heap)
+
+        scanned = []
+        done = set()
+        while True:
+            d, c = heapq.heappop(heap)
+            if c in done:
+                continue
+            done.add(c)
+            scanned.append(c)
+            row = col_row[c]
+            if row < 0:
+                break
+            # reduced costs of the links of row are >= 0
+            urow = row_cost[row] - pot[c]
+            for k, w in adj[row]:
+                if k in done:
+                    continue
+                nd = d + w - urow - pot[k]
+                if nd < dist.get(k, np.inf):
+                    dist[k] = nd
+                    pred[k] = (row, w)
+                    heapq.heappush(heap, (nd, k))
+
+        for k in scanned:
+            pot[k] += dist[k] - d
+
+        # augment along the shortest path
+        while True:
+            row, w = pred[c]
+            prev = row_col[row]
+            row_col[row] = c
+            col_row[c] = row
+            row_cost[row] = w
+            if row == cur:
+                break
+            c = prev
+
+    row_col = np.array(row_col, dtype=int)
+    linked = np.flatnonzero((row_col >= 0) & (row_col < ncols))
+    return linked, row_col[linked]
+
+
+class LapTracker(Tracker):
+    """Tracker that links objects by global assignment instead of greedy
+    nearest neighbour rules.
+
+    For each frame three linear assignment problems are solved, all
+    restricted to pairs closer than max_object_distance and with the squared
+    distance as cost:
+
+    1) frame-to-frame linking between the closest preceding frame and the
+       current frame,
+    2) gap closing, track ends of up to max_frame_gap frames back are
+       linked to objects that remained unlinked,
+    3) split detection, objects that are still unlinked become daughters of
+       linked objects of the preceding frame (max_node_degree daughters at
+       most).
+
+    Objects are never merged, i.e. the in-degree of a node is at most 1.
+    """
+
+    __slots__ = ['_open_ends']
+
+    def __init__(self, *args, **kw):
+        super(LapTracker, self).__init__(*args, **kw)
+        # track ends, node id -> (frame, center)
+        self._open_ends = OrderedDict()
+
+    def _link(self, centers_a, centers_b):
+        """Solve the assignment problem between two sets of centers."""
+        if not (centers_a.size and centers_b.size):
+            return np.empty((0, ), dtype=int), np.empty((0, ), dtype=int)
+
+        tree_a = cKDTree(centers_a)
+        tree_b = cKDTree(centers_b)
+        pairs = tree_a.sparse_distance_matrix(
+            tree_b, self.max_object_distance, output_type='ndarray')
+        pairs = pairs[pairs['v'] < self.max_object_distance]
+
+        # leaving an object unlinked is never cheaper than a valid link
+        alternative = 1.05*math.pow(self.max_object_distance, 2)
+        return sparse_assignment(pairs['i'], pairs['j'], pairs['v']**2,
+                                 centers_a.shape[0], centers_b.shape[0],
+                                 alternative)
+
+    def connect_nodes(self, iT):
+        iPreviousT = self.closest_preceding_frame(iT)
+        nodes_c, centers_c = self._centers(iT)
+        linked = np.zeros((len(nodes_c), ), dtype=bool)
+
+        # drop track ends that are out of reach
+        for nodeid, (frame, _) in self._open_ends.items():
+            if iT - frame > self.max_frame_gap:
+                del self._open_ends[nodeid]
+
+        if iPreviousT is not None:
+            nodes_p, centers_p = self._centers(iPreviousT)
+
+            # 1) frame to frame linking
+            ip, ic = self._link(centers_p, centers_c)
+            for i, j in zip(ip, ic):
+                self.graph.add_edge(nodes_p[i], nodes_c[j])
+                self._open_ends.pop(nodes_p[i], None)
+            linked[ic] = True
+
+            # 2) gap closing, track ends of frames before the preceding frame
+            ends = [nodeid for nodeid, (frame, _) in self._open_ends.iteritems()
+                    if frame < iPreviousT]
+            free = np.flatnonzero(~linked)
+            if ends and free.size:
+                centers_e = np.array([self._open_ends[nodeid][1]
+                                      for nodeid in ends], dtype=float)
+                ie, jc = self._link(centers_e, centers_c[free])
+                for i, j in zip(ie, free[jc]):
+                    self.graph.add_edge(ends[i], nodes_c[j])
+                    del self._open_ends[ends[i]]
+                linked[free[jc]] = True
+
+            # 3) split detection, each mother appears once per possible daughter
+            free = np.flatnonzero(~linked)
+            if self.max_node_degree > 1 and ip.size and free.size:
+                mothers = np.tile(ip, self.max_node_degree-1)
+                im, jc = self._link(centers_p[mothers], centers_c[free])
+                for i, j in zip(mothers[im], free[jc]):
+                    self.graph.add_edge(nodes_p[i], nodes_c[j])
+
+        for nodeid, center in zip(nodes_c, centers_c):
+            self._open_ends[nodeid] = (iT, center)
+
+        return iPreviousT, iPreviousT is not None
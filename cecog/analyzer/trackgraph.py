@@ -0,0 +1,501 @@
+"""
+trackgraph.py
+
+Array-backed tracking graph. Nodes are keyed by (frame, label) pairs packed
+into one integer, the adjacency is stored in CSR style arrays which allow
+vectorized degree and neighbour queries.
+"""
+
+__copyright__ = ('The CellCognition Project'
+                 'Copyright (c) 2006 - 2016'
+                 'Gerlich Lab, IMBA Vienna, Austria'
+                 'see AUTHORS.txt for contributions')
+__licence__ = 'LGPL'
+__url__ = 'www.cellcognition.org'
+
+__all__ = ('pack_nodeids', 'unpack_nodeids', 'CompactGraph', 'TrackingGraph',
+           'GraphView')
+
+
+import numpy as np
+from collections import Mapping
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+from cecog.extensions.graphLib import Graph
+from cecog.extensions.graphLib import Graph_duplicate_node, Graph_no_edge
+
+
+LABEL_BITS = 32
+LABEL_MASK = (1 << LABEL_BITS) - 1
+
+
+def pack_nodeids(frames, labels):
+    """Pack frames and object labels into int64 node ids."""
+    frames = np.asarray(frames, dtype=np.int64)
+    labels = np.asarray(labels, dtype=np.int64)
+    return (frames << LABEL_BITS) | (labels & LABEL_MASK)
+
+
+def unpack_nodeids(nodeids):
+    """Return frames and object labels of an array of packed node ids."""
+    nodeids = np.asarray(nodeids, dtype=np.int64)
+    return nodeids >> LABEL_BITS, nodeids & LABEL_MASK
+
+
+class CompactGraph(object):
+    """Immutable directed graph in compressed sparse row format.
+
+    Nodes are addressed by their position in the node array, edges by the
+    edge ids passed to the constructor. The out-arcs of node i are
+    out_edges[out_ptr[i]:out_ptr[i+1]], the in-arcs accordingly. Arcs of a
+    node are kept in the order of the edge ids, heads and tails hold the
+    node positions of the edges.
+    """
+
+    def __init__(self, nodeids, heads, tails, edgeids=None):
+        self.nodeids = np.asarray(nodeids, dtype=np.int64)
+        self._order = np.argsort(self.nodeids, kind='mergesort')
+        self._sorted = self.nodeids[self._order]
+        self._index = dict(zip(self.nodeids.tolist(), xrange(self.nodeids.size)))
+
+        heads = self.indices(heads)
+        tails = self.indices(tails)
+        if edgeids is None:
+            edgeids = np.arange(heads.size, dtype=np.int64)
+        self.edgeids = np.asarray(edgeids, dtype=np.int64)
+        self.heads = heads
+        self.tails = tails
+
+        self.out_ptr, self.out_edges = self._csr(heads)
+        self.in_ptr, self.in_edges = self._csr(tails)
+        self.out_deg = np.diff(self.out_ptr)
+        self.in_deg = np.diff(self.in_ptr)
+
+    def _csr(self, rows):
+        order = np.argsort(rows, kind='mergesort')
+        counts = np.bincount(rows, minlength=self.nodeids.size)
+        ptr = np.zeros((self.nodeids.size+1, ), dtype=np.int64)
+        np.cumsum(counts, out=ptr[1:])
+        return ptr, self.edgeids[order]
+
+    def __len__(self):
+        return self.nodeids.size
+
+    @property
+    def number_of_edges(self):
+        return self.edgeids.size
+
+    @property
+    def frames(self):
+        return unpack_nodeids(self.nodeids)[0]
+
+    @property
+    def labels(self):
+        return unpack_nodeids(self.nodeids)[1]
+
+    def index(self, nodeid):
+        """Return the position of a single node, raises KeyError."""
+        return self._index[nodeid]
+
+    def indices(self, nodeids):
+        """Return the positions of an array of node ids. Raises KeyError if
+        any of the nodes is unknown."""
+        nodeids = np.asarray(nodeids, dtype=np.int64)
+        pos = np.searchsorted(self._sorted, nodeids)
+        pos = np.clip(pos, 0, max(self._sorted.size-1, 0))
+        if self._sorted.size == 0:
+            found = np.zeros(nodeids.shape, dtype=bool)
+        else:
+            found = self._sorted[pos] == nodeids
+        if not found.all():
+            raise KeyError(nodeids[~found].ravel()[0])
+        return self._order[pos]
+
+    def out_degree(self, nodeids=None):
+        """Return the out-degrees of all nodes or of an array of node ids."""
+        if nodeids is None:
+            return self.out_deg
+        return self.out_deg[self.indices(nodeids)]
+
+    def in_degree(self, nodeids=None):
+        """Return the in-degrees of all nodes or of an array of node ids."""
+        if nodeids is None:
+            return self.in_deg
+        return self.in_deg[self.indices(nodeids)]
+
+    def out_arcs(self, i):
+        """Edge ids of the out-arcs of the node at position i."""
+        return self.out_edges[self.out_ptr.item(i):self.out_ptr.item(i+1)]
+
+    def in_arcs(self, i):
+        """Edge ids of the in-arcs of the node at position i."""
+        return self.in_edges[self.in_ptr.item(i):self.in_ptr.item(i+1)]
+
+    def components(self):
+        """Return the number of weakly connected components and the
+        component of each node (by position)."""
+        n = self.nodeids.size
+        if n == 0:
+            return 0, np.empty((0, ), dtype=np.int32)
+        adj = coo_matrix((np.ones(self.heads.size, dtype=np.int8),
+                          (self.heads, self.tails)), shape=(n, n))
+        return connected_components(adj, directed=True, connection='weak')
+
+
+class _NodeView(Mapping):
+    """Read-only {node_id: (in_arcs, out_arcs, node_data)} view as used by
+    graphLib.Graph.nodes."""
+
+    def __init__(self, graph):
+        self._graph = graph
+
+    def __getitem__(self, nodeid):
+        return (self._graph.in_arcs(nodeid), self._graph.out_arcs(nodeid),
+                self._graph.node_data(nodeid))
+
+    def __iter__(self):
+        return iter(self._graph._node_data)
+
+    def __len__(self):
+        return len(self._graph._node_data)
+
+    def __contains__(self, nodeid):
+        return nodeid in self._graph._node_data
+
+
+class _EdgeView(Mapping):
+    """Read-only {edge_id: (head_id, tail_id, edge_data)} view as used by
+    graphLib.Graph.edges."""
+
+    def __init__(self, graph, state):
+        self._graph = graph
+        self._state = state
+
+    def __getitem__(self, edgeid):
+        g = self._graph
+        if edgeid < 0 or edgeid >= len(g._estate) or \
+                g._estate[edgeid] != self._state:
+            raise KeyError(edgeid)
+        return (g._heads[edgeid], g._tails[edgeid], g._edata[edgeid])
+
+    def __iter__(self):
+        state = self._state
+        return (i for i, s in enumerate(self._graph._estate) if s == state)
+
+    def __len__(self):
+        return self._graph._nedges[self._state]
+
+    def __contains__(self, edgeid):
+        try:
+            self[edgeid]
+        except (KeyError, TypeError):
+            return False
+        return True
+
+
+class TrackingGraph(Graph):
+    """Tracking graph with the interface of graphLib.Graph.
+
+    Node and edge data are kept in a dict and lists, the structure in flat
+    edge arrays and per node lists of incident edge ids. Queries of single
+    nodes (degrees, arcs) are answered from the incidence lists, i.e. they
+    are cheap while the graph grows. Vectorized and whole-graph queries use
+    a CompactGraph which is rebuilt lazily after the graph has been
+    modified. Edge ids are consecutive integers in the order the edges were
+    added.
+    """
+
+    VISIBLE = 0
+    HIDDEN = 1
+    DELETED = 2
+
+    def __init__(self):
+        # graphLib.Graph.__init__ is not called, nodes and edges are views
+        object.__init__(self)
+        self._node_data = dict()
+        self._hidden_nodes = dict()
+        # edge ids (of any state) by head and by tail node
+        self._out = dict()
+        self._in = dict()
+        self._heads = list()
+        self._tails = list()
+        self._edata = list()
+        self._estate = list()
+        self._nedges = [0, 0, 0]
+        self._compact = None
+
+    @property
+    def next_edge_id(self):
+        return len(self._estate)
+
+    @property
+    def nodes(self):
+        return _NodeView(self)
+
+    @property
+    def edges(self):
+        return _EdgeView(self, self.VISIBLE)
+
+    @property
+    def hidden_edges(self):
+        return _EdgeView(self, self.HIDDEN)
+
+    @property
+    def hidden_nodes(self):
+        return self._hidden_nodes
+
+    def compact(self):
+        """Return the CompactGraph of the visible nodes and edges."""
+        if self._compact is None:
+            state = np.asarray(self._estate, dtype=np.int8)
+            edgeids = np.flatnonzero(state == self.VISIBLE)
+            heads = np.asarray(self._heads, dtype=np.int64)
+            tails = np.asarray(self._tails, dtype=np.int64)
+            self._compact = CompactGraph(
+                np.fromiter(self._node_data, dtype=np.int64,
+                            count=len(self._node_data)),
+                heads[edgeids], tails[edgeids], edgeids)
+        return self._compact
+
+    def _set_state(self, edgeid, state, current):
+        """Move an edge from state current to state, raises KeyError."""
+        if edgeid < 0 or edgeid >= len(self._estate) or \
+                self._estate[edgeid] != current:
+            raise KeyError(edgeid)
+        self._nedges[current] -= 1
+        self._nedges[state] += 1
+        self._estate[edgeid] = state
+        self._compact = None
+
+    def copy(self, G):
+        """Copy nodes and visible edges of G into self, see graphLib.Graph."""
+        self.__init__()
+        for nodeid in G.node_list():
+            self.add_node(nodeid, G.node_data(nodeid))
+        for edgeid in sorted(G.edge_list()):
+            self.add_edge(G.head(edgeid), G.tail(edgeid), G.edge_data(edgeid))
+
+    def add_node(self, node_id, node_data=None):
+        if node_id in self._node_data or node_id in self._hidden_nodes:
+            raise Graph_duplicate_node(node_id)
+        self._node_data[node_id] = node_data
+        self._out[node_id] = list()
+        self._in[node_id] = list()
+        self._compact = None
+
+    def update_node_data(self, node_id, node_data):
+        if node_id not in self._node_data:
+            raise KeyError(node_id)
+        self._node_data[node_id] = node_data
+
+    def delete_node(self, node_id):
+        for edgeid in self.arc_list(node_id):
+            self.delete_edge(edgeid)
+        del self._node_data[node_id]
+        del self._out[node_id]
+        del self._in[node_id]
+        self._compact = None
+
+    def add_edge(self, head_id, tail_id, edge_data=None):
+        if head_id not in self._node_data:
+            raise KeyError(head_id)
+        if tail_id not in self._node_data:
+            raise KeyError(tail_id)
+        edgeid = len(self._estate)
+        self._heads.append(head_id)
+        self._tails.append(tail_id)
+        self._edata.append(edge_data)
+        self._estate.append(self.VISIBLE)
+        self._out[head_id].append(edgeid)
+        self._in[tail_id].append(edgeid)
+        self._nedges[self.VISIBLE] += 1
+        self._compact = None
+        return edgeid
+
+    def add_edges(self, head_ids, tail_ids):
+        """Add edges from two sequences of node ids, returns the edge ids."""
+        head_ids = [int(i) for i in head_ids]
+        tail_ids = [int(i) for i in tail_ids]
+        if len(head_ids) != len(tail_ids):
+            raise ValueError("heads and tails differ in length")
+        for nodeid in set(head_ids).union(tail_ids):
+            if nodeid not in self._node_data:
+                raise KeyError(nodeid)
+        edgeid = len(self._estate)
+        self._heads.extend(head_ids)
+        self._tails.extend(tail_ids)
+        self._edata.extend([None]*len(head_ids))
+        self._estate.extend([self.VISIBLE]*len(head_ids))
+        for i, (head_id, tail_id) in enumerate(zip(head_ids, tail_ids)):
+            self._out[head_id].append(edgeid+i)
+            self._in[tail_id].append(edgeid+i)
+        self._nedges[self.VISIBLE] += len(head_ids)
+        self._compact = None
+        return range(edgeid, edgeid+len(head_ids))
+
+    def delete_edge(self, edge_id):
+        self._set_state(edge_id, self.DELETED, self.VISIBLE)
+
+    def hide_edge(self, edge_id):
+        self._set_state(edge_id, self.HIDDEN, self.VISIBLE)
+
+    def hide_node(self, node_id):
+        degree_list = self.arc_list(node_id)
+        self._hidden_nodes[node_id] = (self._node_data[node_id], degree_list)
+        for edgeid in degree_list:
+            self.hide_edge(edgeid)
+        del self._node_data[node_id]
+        self._compact = None
+
+    def restore_edge(self, edge_id):
+        self._set_state(edge_id, self.VISIBLE, self.HIDDEN)
+
+    def restore_all_edges(self):
+        for edgeid in list(self.hidden_edges):
+            self.restore_edge(edgeid)
+
+    def restore_node(self, node_id):
+        node_data, degree_list = self._hidden_nodes.pop(node_id)
+        self._node_data[node_id] = node_data
+        for edgeid in degree_list:
+            self.restore_edge(edgeid)
+        self._compact = None
+
+    def restore_all_nodes(self):
+        for nodeid in self._hidden_nodes.keys():
+            self.restore_node(nodeid)
+
+    def has_node(self, node_id):
+        return node_id in self._node_data
+
+    def edge(self, head_id, tail_id):
+        for edgeid in self.out_arcs(head_id):
+            if self._tails[edgeid] == tail_id:
+                return edgeid
+        raise Graph_no_edge((head_id, tail_id))
+
+    def number_of_nodes(self):
+        return len(self._node_data)
+
+    def number_of_edges(self):
+        return self._nedges[self.VISIBLE]
+
+    def node_list(self):
+        return self._node_data.keys()
+
+    def edge_list(self):
+        return list(self.edges)
+
+    def number_of_hidden_edges(self):
+        return self._nedges[self.HIDDEN]
+
+    def number_of_hidden_nodes(self):
+        return len(self._hidden_nodes)
+
+    def hidden_node_list(self):
+        return self._hidden_nodes.keys()
+
+    def hidden_edge_list(self):
+        return list(self.hidden_edges)
+
+    def node_data(self, node_id):
+        return self._node_data[node_id]
+
+    def _check_edge(self, edge_id):
+        try:
+            if edge_id >= 0 and self._estate[edge_id] == self.VISIBLE:
+                return
+        except (IndexError, TypeError):
+            pass
+        raise KeyError(edge_id)
+
+    def edge_data(self, edge_id):
+        self._check_edge(edge_id)
+        return self._edata[edge_id]
+
+    def head(self, edge):
+        self._check_edge(edge)
+        return self._heads[edge]
+
+    def tail(self, edge):
+        self._check_edge(edge)
+        return self._tails[edge]
+
+    def edges_from(self, edge_id):
+        """Return head and tail node ids of the visible edges with an edge id
+        >= edge_id, i.e. of the edges added since then."""
+        edgeids = [i for i in xrange(edge_id, len(self._estate))
+                   if self._estate[i] == self.VISIBLE]
+        return ([self._heads[i] for i in edgeids],
+                [self._tails[i] for i in edgeids])
+
+    def edge_arrays(self):
+        """Return head and tail node ids of all visible edges as arrays."""
+        g = self.compact()
+        return g.nodeids[g.heads], g.nodeids[g.tails]
+
+    def _visible_arcs(self, arcs, node_id):
+        if node_id not in self._node_data:
+            raise KeyError(node_id)
+        estate = self._estate
+        return [i for i in arcs[node_id] if estate[i] == self.VISIBLE]
+
+    def out_arcs(self, node_id):
+        return self._visible_arcs(self._out, node_id)
+
+    def in_arcs(self, node_id):
+        return self._visible_arcs(self._in, node_id)
+
+    def out_degree(self, node_id):
+        return len(self.out_arcs(node_id))
+
+    def in_degree(self, node_id):
+        return len(self.in_arcs(node_id))
+
+    def degree(self, node_id):
+        return self.in_degree(node_id) + self.out_degree(node_id)
+
+    def out_degrees(self, node_ids=None):
+        """Vectorized out_degree, for all nodes of node_list() if node_ids
+        is None."""
+        return self.compact().out_degree(node_ids)
+
+    def in_degrees(self, node_ids=None):
+        """Vectorized in_degree, for all nodes of node_list() if node_ids
+        is None."""
+        return self.compact().in_degree(node_ids)
+
+
+class GraphView(object):
+    """Read-only view of a TrackingGraph with different node data.
+
+    The view shares nodes, edges and the CompactGraph of the underlying
+    graph, the node data is looked up by resolver(node_id) on access.
+    """
+
+    # methods of TrackingGraph that modify the graph
+    _MODIFIERS = frozenset(('copy', 'add_node', 'update_node_data',
+                            'delete_node', 'add_edge', 'add_edges',
+                            'delete_edge', 'hide_edge', 'hide_node',
+                            'restore_edge', 'restore_all_edges',
+                            'restore_node', 'restore_all_nodes'))
+
+    def __init__(self, graph, resolver):
+        self._graph = graph
+        self._resolver = resolver
+
+    def __getattr__(self, name):
+        if name in self._MODIFIERS:
+            raise AttributeError("GraphView is read-only, '%s' is not "
+                                 "supported" %name)
+        return getattr(self._graph, name)
+
+    @property
+    def nodes(self):
+        return _NodeView(self)
+
+    def node_data(self, node_id):
+        if not self._graph.has_node(node_id):
+            raise KeyError(node_id)
+        return self._resolver(node_id)
@@ -8,8 +8,14 @@ Changes (Jan Finell):
   - changed the tab size to 4 spaces instead of 8.
   - moved the method documentation into a proper doc string.
 
+Changes (CellCognition):
+  - queue and stack are backed by a deque and a list, node and edge tuples
+    are accessed in place instead of copied.
+
 """
 
+from collections import deque
+
 #-- Error classes --#
 class Graph_duplicate_node(StandardError):
     pass
@@ -23,7 +29,7 @@ class Graph_no_edge(StandardError):
 
 class GraphQueue:
     def __init__(self):
-        self.q=[]
+        self.q=deque()
 
     def empty(self):
         if(len(self.q)>0):
@@ -38,11 +44,10 @@ class GraphQueue:
         self.q.append(item)
 
     def remove(self):
-        item=self.q[0]
-        self.q=self.q[1:]
-        return item
+        return self.q.popleft()
 
 class GraphStack:
+    """Last in, first out, the top of the stack is the end of the list."""
     def __init__(self):
         self.s=[]
 
@@ -56,15 +61,10 @@ class GraphStack:
         return len(self.s)
 
     def push(self, item):
-        ts=[item]
-        for i in self.s:
-            ts.append(i)
-        self.s=ts
+        self.s.append(item)
 
     def pop(self):
-        item=self.s[0]
-        self.s=self.s[1:]
-        return item
+        return self.s.pop()
 
 class Graph(object):
 
@@ -135,12 +135,9 @@ class Graph(object):
         """
         Delets the edge.
         """
-        head_id=self.head(edge_id)
-        tail_id=self.tail(edge_id)
-        head_data=map(None, self.nodes[head_id])
-        tail_data=map(None, self.nodes[tail_id])
-        head_data[1].remove(edge_id)
-        tail_data[0].remove(edge_id)
+        head_id, tail_id, _ = self.edges[edge_id]
+        self.nodes[head_id][1].remove(edge_id)
+        self.nodes[tail_id][0].remove(edge_id)
         del self.edges[edge_id]
 
     def add_edge(self, head_id, tail_id, edge_data=None):
@@ -151,10 +148,8 @@ class Graph(object):
         edge_id = self.next_edge_id
         self.next_edge_id = self.next_edge_id+1
         self.edges[edge_id] = (head_id, tail_id, edge_data)
-        mapped_head_data = map(None, self.nodes[head_id])
-        mapped_head_data[1].append(edge_id)
-        mapped_tail_data = map(None, self.nodes[tail_id])
-        mapped_tail_data[0].append(edge_id)
+        self.nodes[head_id][1].append(edge_id)
+        self.nodes[tail_id][0].append(edge_id)
         return edge_id
 
     def hide_edge(self, edge_id):
@@ -163,15 +158,10 @@ class Graph(object):
         its information.  The edge is held in a separate structure
         and can be unhidden at some later time.
         """
-        self.hidden_edges[edge_id]=self.edges[edge_id]
-        ed=map(None, self.edges[edge_id])
-        head_id=ed[0]
-        tail_id=ed[1]
-        hd=map(None, self.nodes[head_id])
-        td=map(None, self.nodes[tail_id])
-        hd[1].remove(edge_id)
-        td[0].remove(edge_id)
-        del self.edges[edge_id]
+        self.hidden_edges[edge_id]=self.edges.pop(edge_id)
+        head_id, tail_id, _ = self.hidden_edges[edge_id]
+        self.nodes[head_id][1].remove(edge_id)
+        self.nodes[tail_id][0].remove(edge_id)
 
     def hide_node(self, node_id):
         """
@@ -190,21 +180,16 @@ class Graph(object):
         """
         Restores a previously hidden edge back into the graph.
         """
-        self.edges[edge_id]=self.hidden_edges[edge_id]
-        ed=map(None,self.hidden_edges[edge_id])
-        head_id=ed[0]
-        tail_id=ed[1]
-        hd=map(None,self.nodes[head_id])
-        td=map(None,self.nodes[tail_id])
-        hd[1].append(edge_id)
-        td[0].append(edge_id)
-        del self.hidden_edges[edge_id]
+        self.edges[edge_id]=self.hidden_edges.pop(edge_id)
+        head_id, tail_id, _ = self.edges[edge_id]
+        self.nodes[head_id][1].append(edge_id)
+        self.nodes[tail_id][0].append(edge_id)
 
     def restore_all_edges(self):
         """
         Restores all hidden edges.
         """
-        for edge in self.hidden_edges:
+        for edge in self.hidden_edges.keys():
             self.restore_edge(edge)
 
     def restore_node(self, node_id):
@@ -212,20 +197,16 @@ class Graph(object):
         Restores a previously hidden node back into the graph
         and restores all of the hidden incident edges, too.
         """
-        hidden_node_data=map(None,self.hidden_nodes[node_id])
-        self.nodes[node_id]=hidden_node_data[0]
-        degree_list=hidden_node_data[1]
+        self.nodes[node_id], degree_list = self.hidden_nodes.pop(node_id)
         for edge in degree_list:
             self.restore_edge(edge)
-        del self.hidden_nodes[node_id]
 
     def restore_all_nodes(self):
         """
         Restores all hidden nodes.
         """
-        for node in self.nodes:
-            self.nodes[node]=self.hidden_nodes[node]
-            del self.hidden_nodes[node]
+        for node in self.hidden_nodes.keys():
+            self.restore_node(node)
 
     def has_node(self, node_id):
         """
@@ -265,75 +246,58 @@ class Graph(object):
         return len(self.hidden_nodes)
 
     def hidden_node_list(self):
-        hnl=self.hidden_nodes.keys()
-        return hnl[:]
+        return self.hidden_nodes.keys()
 
     def hidden_edge_list(self):
-        hel=self.hidden_edges.keys()
-        return hel[:]
+        return self.hidden_edges.keys()
 
     def node_data(self, node_id):
         """
         Returns a reference to the data attached to a node.
         """
-        mapped_data=map(None, self.nodes[node_id])
-        return mapped_data[2]
+        return self.nodes[node_id][2]
 
     def edge_data(self, edge_id):
         """
         Returns a reference to the data attached to an edge.
         """
-        mapped_data=map(None, self.edges[edge_id])
-        return mapped_data[2]
+        return self.edges[edge_id][2]
 
     def head(self, edge):
         """
         Returns a reference to the head of the edge.
         (A reference to the head id)
         """
-        mapped_data=map(None, self.edges[edge])
-        return mapped_data[0]
+        return self.edges[edge][0]
 
     #--Similar to above.
     def tail(self, edge):
-        mapped_data=map(None, self.edges[edge])
-        return mapped_data[1]
+        return self.edges[edge][1]
 
     def out_arcs(self, node_id):
         """
         Returns a copy of the list of edges of the node's out arcs.
         """
-        mapped_data = map(None, self.nodes[node_id])
-        return mapped_data[1][:]
+        return self.nodes[node_id][1][:]
 
     #--Similar to above.
     def in_arcs(self, node_id):
-        mapped_data=map(None, self.nodes[node_id])
-        return mapped_data[0][:]
+        return self.nodes[node_id][0][:]
 
     #--Returns a list of in and out arcs.
     def arc_list(self, node_id):
-        in_list=self.in_arcs(node_id)
-        out_list=self.out_arcs(node_id)
-        deg_list=[]
-        for arc in in_list:
-            deg_list.append(arc)
-        for arc in out_list:
-            deg_list.append(arc)
-        return deg_list
+        return self.in_arcs(node_id) + self.out_arcs(node_id)
 
 
     def out_degree(self, node_id):
-        mapped_data=map(None, self.nodes[node_id])
-        return len(mapped_data[1])
+        return len(self.nodes[node_id][1])
 
     def in_degree(self, node_id):
-        mapped_data=map(None, self.nodes[node_id])
-        return len(mapped_data[0])
+        return len(self.nodes[node_id][0])
 
     def degree(self, node_id):
-        mapped_data=map(None, self.nodes[node_id])
-        return len(mapped_data[0])+len(mapped_data[1])
+        node=self.nodes[node_id]
+        return len(node[0])+len(node[1])
 
     # --- Traversals ---
     def topological_sort(self):
@@ -414,9 +378,10 @@ class Graph(object):
             dfs_list.append(current_node)
             out_edges=self.out_arcs(current_node)
             for edge in out_edges:
-                if not self.tail(edge) in nodes_already_stacked:
-                    nodes_already_stacked[self.tail(edge)]=0
-                    dfs_stack.push(self.tail(edge))
+                tail=self.tail(edge)
+                if not tail in nodes_already_stacked:
+                    nodes_already_stacked[tail]=0
+                    dfs_stack.push(tail)
         return dfs_list
 
     def dfs_edges(self, source_id):
@@ -435,10 +400,11 @@ class Graph(object):
 
             out_edges=self.out_arcs(current_node)
             for edge in out_edges:
-                if not self.tail(edge) in nodes_already_stacked:
-                    nodes_already_stacked[self.tail(edge)]=0
-                    dfs_stack.push(self.tail(edge))
-                    dfs_list.append((current_node,self.tail(edge)))
+                tail=self.tail(edge)
+                if not tail in nodes_already_stacked:
+                    nodes_already_stacked[tail]=0
+                    dfs_stack.push(tail)
+                    dfs_list.append((current_node,tail))
         return dfs_list
 
     def bfs(self, source_id):
@@ -456,9 +422,10 @@ class Graph(object):
             bfs_list.append(current_node)
             out_edges=self.out_arcs(current_node)
             for edge in out_edges:
-                if not self.tail(edge) in nodes_already_queued:
-                    nodes_already_queued[self.tail(edge)]=0
-                    bfs_queue.add(self.tail(edge))
+                tail=self.tail(edge)
+                if not tail in nodes_already_queued:
+                    nodes_already_queued[tail]=0
+                    bfs_queue.add(tail)
         return bfs_list
 
 
@@ -478,7 +445,8 @@ class Graph(object):
             bfs_list.append(current_node)
             in_edges=self.in_arcs(current_node)
             for edge in in_edges:
-                if not self.head(edge) in nodes_already_queued:
-                    nodes_already_queued[self.head(edge)]=0
-                    bfs_queue.add(self.head(edge))
+                head_id=self.head(edge)
+                if not head_id in nodes_already_queued:
+                    nodes_already_queued[head_id]=0
+                    bfs_queue.add(head_id)
         return bfs_list
@@ -17,6 +17,7 @@ __source__ = '$URL$'
 __all__ = ['OutputFrame']
 
 from cecog.gui.analyzer import BaseFrame
+from cecog.traits.analyzer.output import COMPRESSION_CLASSES
 
 class OutputFrame(BaseFrame):
 
@@ -29,9 +30,18 @@ class OutputFrame(BaseFrame):
                        [('hdf5_include_raw_images', (0,0,1,1)),
                         ('hdf5_include_label_images', (1,0,1,1)),
                         ('hdf5_include_crack', (3,0,1,1)),
+                        ('hdf5_crack_format', (3,1,1,1)),
                         ('hdf5_include_features', (4,0,1,1)),
                         ('hdf5_include_classification', (5,0,1,1)),
                         ('hdf5_include_tracking', (6,0,1,1)),
                         ('hdf5_include_events', (7,0,1,1)),
+                        ('hdf5_write_behind', (8,0,1,1)),
                        ], label="CellH5 options")
+
+        items = []
+        for i, (name, _) in enumerate(COMPRESSION_CLASSES):
+            items.extend([('hdf5_compression_%s' %name, (i,0,1,1)),
+                          ('hdf5_compression_level_%s' %name, (i,1,1,1)),
+                          ('hdf5_shuffle_%s' %name, (i,2,1,1))])
+        self.add_group(None, items, label="CellH5 compression")
         self.add_expanding_spacer()
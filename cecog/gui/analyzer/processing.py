@@ -159,6 +159,10 @@ class ProcessingFrame(BaseProcessorFrame, ExportSettings):
                         ('merged_errorcorrection', (2,0,1,1))],
                         sublinks=False, label='Merged channel')
 
+        self.add_group(None,
+                       [('channel_threads', (0,0,1,1))],
+                        sublinks=False, label='Performance')
+
         self.add_expanding_spacer()
         self._init_control()
 
@@ -39,6 +39,8 @@ class TrackingFrame(BaseProcessorFrame):
                        [('tracking_maxobjectdistance', (0,0,1,1)),
                         ('tracking_maxtrackinggap', (0,1,1,1)),
                         ('tracking_maxsplitobjects', (1,0,1,1)),
+                        ('tracking_method', (1,1,1,1)),
+                        ('tracking_streaming', (2,0,1,1)),
                         ], link='tracking', label='Tracking')
         self.add_expanding_spacer()
 
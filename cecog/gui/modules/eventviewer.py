@@ -20,6 +20,7 @@ from PyQt5.Qt import *
 
 from cecog.gui.imageviewer import QGraphicsPixmapHoverItem
 from cecog.gui.modules.module import CH5BasedModule
+from cecog.io.hdf import readCrackContours
 
 from qimage2ndarray import array2qimage
 import cellh5
@@ -345,6 +346,16 @@ class CellH5EventModule(CH5BasedModule):
     def _on_new_point(self, point, button, modifier):
         pass
 
+    def _gallery_contour(self, pos, index, object_, size):
+        """Crack contour of an object in coordinates of its gallery image.
+        Contours are read in the binary and in the string layout."""
+        group = pos['feature'][object_]
+        crack = readCrackContours(group, [index])[0].astype(numpy.float32)
+        center = group['center'][index]
+        crack[:, 0] -= center['x'] - size/2
+        crack[:, 1] -= center['y'] - size/2
+        return crack.clip(0, size)
+
     def show_tracks(self, res):
         self.browser.image_viewer.clear()
         pos = self.cur_pos
@@ -376,7 +387,7 @@ class CellH5EventModule(CH5BasedModule):
                     if self._cb_segmentation.checkState():
                         contour_item = QGraphicsPolygonItem(
                             QPolygonF(map(lambda x: QPointF(x[0],x[1]),
-                                          self.cur_pos.get_crack_contour(track[i],object_)[0])))
+                                          self._gallery_contour(pos, track[i], object_, size))))
                         contour_item.setPos(x,y)
                         color = Qt.red
                         if self._cb_classification.checkState():
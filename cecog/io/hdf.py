@@ -11,10 +11,12 @@ __licence__ = 'LGPL'
 __url__ = 'www.cellcognition.org'
 
 
-__all__ = ('Ch5File', )
+__all__ = ('Ch5File', 'readCrackContours')
 
 
 import os
+import zlib
+import base64
 import collections
 import filelock
 
@@ -71,6 +73,32 @@ def mergeHdfFiles(target, source_dir, remove_source=True, mode="a"):
     target.close()
 
 
+def readCrackContours(group, index):
+    """Read the crack contours of the objects 'index' from the feature group
+    of a segmentation region. Supports the binary layout (flat coordinate
+    table plus start/stop index) and the base64(zlib(csv)) strings.
+
+    Returns a list of (n, 2) arrays. Objects of a frame are stored in
+    consecutive rows, hence a frame needs a single read per dataset.
+    """
+    index = np.asarray(index, dtype=int)
+    if index.size == 0:
+        return list()
+
+    imin = index.min()
+    rows = index - imin
+
+    if "crack_contour_index" in group:
+        bounds = group["crack_contour_index"][imin:index.max()+1][rows]
+        pmin, pmax = bounds["start"].min(), bounds["stop"].max()
+        coords = group["crack_contour_coordinates"][pmin:pmax]
+        return [coords[start-pmin:stop-pmin] for start, stop in bounds]
+    else:
+        strings = group["crack_contour"][imin:index.max()+1][rows]
+        return [np.array(zlib.decompress(base64.b64decode(s)).split(','),
+                         dtype=np.float32).reshape((-1, 2)) for s in strings]
+
+
 class FileLock(filelock.FileLock):
 
     def release(self, *args, **kw):
@@ -270,6 +298,10 @@ class Ch5File(h5py.File):
             return [cldef["name"][i].decode() if i >= 0 else "Unclassified"
                     for i in prediction]
 
+    def crackContours(self, site, mask, index):
+        """Crack contours of the objects 'index' as list of (n, 2) arrays."""
+        return readCrackContours(self[site.join("feature", mask)], index)
+
     def probabilities(self, site, mask):
         path = site.join("feature", mask, "object_classification", "probability")
         return self[path].value
@@ -0,0 +1,92 @@
+"""
+writebehind.py
+
+Write-behind thread for cellh5 output. Ready-made array blocks are put into
+a bounded queue and written to the hdf5 file by a dedicated thread, so that
+compression and disk I/O overlap with the analysis of the next frame.
+"""
+
+__copyright__ = ('The CellCognition Project'
+                 'Copyright (c) 2006 - 2015'
+                 'Gerlich Lab, IMBA Vienna, Austria'
+                 'see AUTHORS.txt for contributions')
+__licence__ = 'LGPL'
+__url__ = 'www.cellcognition.org'
+
+__all__ = ('WriteBehindWriter', 'WriteBehindError')
+
+
+import sys
+import Queue
+import threading
+import traceback
+
+
+class WriteBehindError(RuntimeError):
+    pass
+
+
+class WriteBehindWriter(threading.Thread):
+    """Consumes write requests (callable, args) from a bounded queue.
+
+    Dataset creation and resizing are expected to happen on the calling
+    thread, the writer only performs the (compressing) data transfer.
+    Errors in the writer thread are stored and re-raised on the calling thread
+    with the next submit(), flush() or close().
+    """
+
+    _STOP = object()
+
+    def __init__(self, maxsize=16):
+        super(WriteBehindWriter, self).__init__(name="cellh5-writer")
+        self.daemon = True
+        self._queue = Queue.Queue(maxsize=maxsize)
+        self._error = None
+        self._closed = False
+        self.start()
+
+    def run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is self._STOP:
+                    return
+                # after an error all pending requests are dropped
+                if self._error is None:
+                    func, args = item
+                    func(*args)
+            except Exception:
+                self._error = "".join(traceback.format_exception(*sys.exc_info()))
+            finally:
+                self._queue.task_done()
+
+    def check(self):
+        """Raise WriteBehindError if the writer thread has failed."""
+        if self._error is not None:
+            raise WriteBehindError("cellh5 writer thread failed:\n%s"
+                                   %self._error)
+
+    def submit(self, func, *args):
+        """Enqueue func(*args). Blocks if the queue is full."""
+        if self._closed:
+            raise WriteBehindError("cellh5 writer is already closed")
+        self.check()
+        self._queue.put((func, args))
+
+    def write(self, dset, key, data):
+        """Enqueue dset[key] = data. The caller must not modify data
+        afterwards."""
+        self.submit(dset.__setitem__, key, data)
+
+    def flush(self):
+        """Block until all pending writes are done."""
+        self._queue.join()
+        self.check()
+
+    def close(self):
+        """Write all pending data and stop the thread."""
+        if not self._closed:
+            self._closed = True
+            self._queue.put(self._STOP)
+            self.join()
+        self.check()
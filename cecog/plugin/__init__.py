@@ -158,6 +158,16 @@ class PluginManager(object):
         """Return the number of plugins that are invoked if run is executed."""
         return len(self._instances)
 
+    def required_managers(self):
+        """Return the names of the plugin managers whose results are
+        required by the plugin instances (REQUIRES)."""
+        names = []
+        for instance in self._instances.itervalues():
+            for name in (instance.REQUIRES or ()):
+                if name not in names:
+                    names.append(name)
+        return names
+
     # FIXME **option is dangerous, what if one calls run(foo=bar)
     @stopwatch(level=logging.INFO)
     def run(self, *args, **options):
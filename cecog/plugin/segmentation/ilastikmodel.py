@@ -0,0 +1,112 @@
+"""
+ilastikmodel.py
+
+Trained ilastik (0.5) pixel classifier, loaded once and applied to many
+images.
+"""
+
+__copyright__ = ('The CellCognition Project'
+                 'Copyright (c) 2006 - 2016'
+                 'Gerlich Lab, IMBA Vienna, Austria'
+                 'see AUTHORS.txt for contributions')
+__licence__ = 'LGPL'
+__url__ = 'www.cellcognition.org'
+
+__all__ = ('IlastikModel', )
+
+
+import os
+import numpy
+import h5py
+
+
+class IlastikModel(object):
+    """Random forests and feature definitions of an ilastik classifier file.
+
+    The file is read once, predict() only computes the features of the
+    images and applies the forests. Use cache_key() to test whether a model
+    is still valid for a (possibly modified) classifier file.
+    """
+
+    def __init__(self, filename):
+        super(IlastikModel, self).__init__()
+        # ilastik is an optional dependency
+        from ilastik.core.dataMgr import DataMgr, DataItemImage
+        from ilastik.core.volume import DataAccessor
+        from ilastik.modules.classification.core.featureMgr import FeatureMgr
+        from ilastik.modules.classification.core.features.featureBase \
+            import FeatureBase
+        from ilastik.modules.classification.core.classifiers.classifierRandomForest \
+            import ClassifierRandomForest
+        from ilastik.modules.classification.core.classificationMgr \
+            import ClassifierPredictThread
+
+        self._DataMgr = DataMgr
+        self._DataItemImage = DataItemImage
+        self._DataAccessor = DataAccessor
+        self._FeatureMgr = FeatureMgr
+        self._ClassifierPredictThread = ClassifierPredictThread
+
+        self.key = self.cache_key(filename)
+        self.filename = filename
+
+        # If the file is not closed this leads to an error in win64 and
+        # mac os x (the random forests are loaded from the file by ilastik)
+        hf = h5py.File(filename, 'r')
+        try:
+            cids = hf['classifiers'].keys()
+            self.feature_items = [FeatureBase.deserialize(fgrp)
+                                  for fgrp in hf['features'].values()]
+        finally:
+            hf.close()
+
+        self.classifiers = [ClassifierRandomForest.loadRFfromFile(
+                filename, str('classifiers/' + cid)) for cid in cids]
+
+    @staticmethod
+    def cache_key(filename):
+        """Key of the current version of the classifier file."""
+        filename = os.path.abspath(filename)
+        return filename, os.path.getmtime(filename)
+
+    def _to_volume(self, image):
+        # ilastik convention
+        # 3D = (time,x,y,z,channel)
+        # 2D = (time,1,x,y,channel)
+        # Note, this works for 2D images right now.
+        image = image.reshape((1, 1) + image.shape)
+        # add singleton dimension if image has no channels
+        if image.ndim == 4:
+            image = image.reshape(image.shape + (1, ))
+        return image
+
+    def predict(self, images, class_index):
+        """Return the probability maps (uint8, 0..255) of the output class
+        for a sequence of 2D images. The features of all images are computed
+        in one go."""
+
+        dataMgr = self._DataMgr()
+        for image in images:
+            di = self._DataItemImage('')
+            di.setDataVol(self._DataAccessor(self._to_volume(image)))
+            dataMgr.append(di, alreadyLoaded=True)
+
+        dataMgr.module["Classification"]["classificationMgr"].classifiers = \
+            self.classifiers
+
+        fm = self._FeatureMgr(dataMgr, self.feature_items)
+        fm.prepareCompute(dataMgr)
+        fm.triggerCompute()
+        fm.joinCompute(dataMgr)
+
+        predict = self._ClassifierPredictThread(dataMgr)
+        predict.start()
+        predict.wait()
+
+        probmaps = []
+        for prediction in predict._prediction:
+            if class_index >= prediction.shape[-1]:
+                raise RuntimeError('ilastik output class not valid...')
+            probmaps.append(
+                (prediction[0, 0, :, :, class_index]*255).astype(numpy.uint8))
+        return probmaps
@@ -0,0 +1,103 @@
+"""
+multiotsu.py
+
+Multi-level Otsu thresholding of grey value histograms.
+"""
+
+__copyright__ = ('The CellCognition Project'
+                 'Copyright (c) 2006 - 2016'
+                 'Gerlich Lab, IMBA Vienna, Austria'
+                 'see AUTHORS.txt for contributions')
+__licence__ = 'LGPL'
+__url__ = 'www.cellcognition.org'
+
+__all__ = ('multi_otsu', )
+
+
+import math
+import numpy
+
+
+# relative score difference below which two splits are equally good
+TIE_TOLERANCE = 1e-12
+
+
+def _class_scores(P, S):
+    """Matrix of the class scores S**2/P of the classes i..j, P and S are the
+    cumulative moments with a leading zero. Empty classes score 0, the
+    entries below the diagonal (no class) -inf."""
+    p = P[numpy.newaxis, 1:] - P[:-1, numpy.newaxis]
+    s = S[numpy.newaxis, 1:] - S[:-1, numpy.newaxis]
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        scores = numpy.where(p > 0, s*s/p, 0.0)
+    scores[numpy.tril_indices(scores.shape[0], -1)] = -numpy.inf
+    return scores
+
+
+def multi_otsu(histo, M, bins=None):
+    """Find M thresholds that split the histogram into M+1 classes with
+    maximal between-class variance.
+
+    Returns the score, i.e. the sum of S**2/P over the classes (P and S are
+    the zeroth and first moment of a class in the relative histogram), and
+    the thresholds, the last grey value of each class but the last one.
+    Thresholds range from 1 to len(histo)-2. Returns (0, ()) if there is no
+    valid split.
+
+    Splits whose scores differ by less than TIE_TOLERANCE (relative to the
+    best score) are ties, e.g. thresholds that move through empty grey
+    levels. Ties are resolved towards the smaller thresholds, the first
+    threshold first. Note that the former exhaustive search resolved ties by
+    floating point rounding, i.e. the thresholds of tied splits may differ
+    from it (the score does not).
+
+    The maximum is found by dynamic programming on the cumulative moments,
+    O(M*L**2) for L grey levels. If bins is given, neighbouring grey levels
+    are merged into at most bins bins and the thresholds are restricted to
+    the borders of these bins, e.g. for 16 bit histograms.
+    """
+    histo = numpy.asarray(histo, dtype=float).ravel()
+    L = histo.size
+    N = histo.sum()
+    if M < 1 or L < M + 2 or N <= 0:
+        return 0, ()
+
+    # last grey value of each bin
+    if bins is None or bins >= L:
+        ends = numpy.arange(L)
+    else:
+        width = int(math.ceil(L/float(max(bins, 1))))
+        ends = numpy.r_[numpy.arange(width-1, L-1, width), L-1]
+
+    hrel = histo/N
+    P = numpy.r_[0.0, numpy.cumsum(hrel)[ends]]
+    S = numpy.r_[0.0, numpy.cumsum(numpy.arange(L)*hrel)[ends]]
+    scores = _class_scores(P, S)
+    n = ends.size
+
+    # bins that can end a class which is not the last one
+    cand = numpy.flatnonzero((ends >= 1) & (numpy.arange(n) < n-1))
+    if cand.size < M:
+        return 0, ()
+
+    # best[m][i]: best score of the bins i..n-1 split by m thresholds, the
+    # score of the n-th bin (no bins left) is -inf
+    best = [numpy.r_[scores[:, n-1], -numpy.inf]]
+    for m in xrange(1, M+1):
+        split = scores[:, cand] + best[m-1][cand+1]
+        best.append(numpy.r_[split.max(axis=1), -numpy.inf])
+
+    if not best[M][0] > 0:
+        return 0, ()
+
+    # backtracking, the first (near) maximum gives the smallest thresholds
+    eps = TIE_TOLERANCE*best[M][0]
+    thresholds = []
+    first = 0
+    for m in xrange(M, 0, -1):
+        split = scores[first, cand] + best[m-1][cand+1]
+        j = cand[numpy.flatnonzero(split >= split.max() - eps)[0]]
+        thresholds.append(int(ends[j]))
+        first = j + 1
+
+    return float(best[M][0]), tuple(thresholds)
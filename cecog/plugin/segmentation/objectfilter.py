@@ -0,0 +1,96 @@
+"""
+objectfilter.py
+
+Object filter of the segmentation plugins, removes objects whose features
+are out of bounds.
+"""
+
+__copyright__ = ('The CellCognition Project'
+                 'Copyright (c) 2006 - 2016'
+                 'Gerlich Lab, IMBA Vienna, Austria'
+                 'see AUTHORS.txt for contributions')
+__licence__ = 'LGPL'
+__url__ = 'www.cellcognition.org'
+
+__all__ = ('ObjectFilter', )
+
+
+import numpy
+from collections import OrderedDict
+
+
+class ObjectFilter(object):
+    """Filter the objects of an ObjectContainer by lower and upper bounds of
+    their features.
+
+    The features of all objects are collected into arrays and all bounds
+    are tested at once. An object is valid if all its features are within
+    their bounds (inclusive).
+    """
+
+    def __init__(self):
+        super(ObjectFilter, self).__init__()
+        self._bounds = OrderedDict()
+        # feature groups that need to be computed (container.applyFeature)
+        self.feature_categories = set()
+
+    @classmethod
+    def from_minmax(cls, roisize_minmax, intensity_minmax, offset=0):
+        """Filter on object size and average intensity (n2_avg) as used by
+        the primary segmentation plugins, a value of -1 disables a bound.
+        The offset is added to the intensity bounds."""
+        ofilter = cls()
+        roisize = [v if v > -1 else None for v in roisize_minmax]
+        intensity = [v + offset if v > -1 else None for v in intensity_minmax]
+        if any(v is not None for v in roisize):
+            ofilter.add_bounds('roisize', 'roisize', *roisize)
+        if any(v is not None for v in intensity):
+            ofilter.add_bounds('normbase2', 'n2_avg', *intensity)
+        return ofilter
+
+    def __len__(self):
+        return len(self._bounds)
+
+    def add_bounds(self, category, feature, minimum=None, maximum=None):
+        """Require minimum <= feature <= maximum, None disables a bound.
+        category is the feature group that provides the feature."""
+        self.feature_categories.add(category)
+        self._bounds[feature] = (minimum, maximum)
+
+    def valid(self, features):
+        """Return a boolean array, features is a sequence of feature dicts."""
+        valid = numpy.ones((len(features), ), dtype=bool)
+        if not features:
+            return valid
+
+        for name, (minimum, maximum) in self._bounds.iteritems():
+            values = numpy.array([f[name] for f in features], dtype=float)
+            # nan is out of bounds
+            with numpy.errstate(invalid='ignore'):
+                if minimum is not None:
+                    valid &= values >= minimum
+                if maximum is not None:
+                    valid &= values <= maximum
+        return valid
+
+    def __call__(self, container, delete_objects=True):
+        """Apply the filter to the objects of the container, rejected objects
+        are deleted from the container if delete_objects is True. Returns
+        the lists of valid and rejected object ids."""
+
+        # FIXME: features are currently kept in the ObjectContainer and used
+        # for classification automatically
+        for feature in self.feature_categories:
+            container.applyFeature(feature)
+
+        objects = container.getObjects()
+        ids = objects.keys()
+        valid = self.valid([objects[i].getFeatures() for i in ids])
+
+        valid_ids = [i for i, v in zip(ids, valid) if v]
+        rejected_ids = [i for i, v in zip(ids, valid) if not v]
+        if delete_objects:
+            for obj_id in rejected_ids:
+                container.delObject(obj_id)
+
+        return valid_ids, rejected_ids
@@ -12,7 +12,6 @@
 import os
 import re
 import numpy
-import itertools
 
 from cecog import ccore
 from cecog.gui.guitraits import (BooleanTrait,
@@ -23,6 +22,9 @@ from cecog.gui.guitraits import (BooleanTrait,
 
 from cecog.plugin import stopwatch
 from cecog.plugin.segmentation.manager import _SegmentationPlugin
+from cecog.plugin.segmentation.multiotsu import multi_otsu
+from cecog.plugin.segmentation.objectfilter import ObjectFilter
+from cecog.plugin.segmentation.ilastikmodel import IlastikModel
 
 
 class SegmentationPluginPrimary(_SegmentationPlugin):
@@ -112,39 +114,9 @@ class SegmentationPluginPrimary(_SegmentationPlugin):
         rejected_ids = []
 
         if is_active:
-            feature_categories = set()
-            conditions = []
-            for idx, (roisize, intensity) in enumerate( \
-                zip(roisize_minmax, intensity_minmax)):
-                cmprt = '>=' if idx == 0 else '<='
-                if roisize > -1:
-                    feature_categories.add('roisize')
-                    conditions.append('roisize %s %d' % (cmprt, roisize))
-                if intensity > -1:
-                    feature_categories.add('normbase2')
-                    conditions.append('n2_avg %s %d' % (cmprt, intensity))
-
-            if len(conditions) > 0:
-                conditions_str = ' and '.join(conditions)
-
-                # extract features needed for the filter
-                # FIXME: features are currently kept in the ObjectContainer and used for classification automatically
-                for feature in feature_categories:
-                    container.applyFeature(feature)
-
-                valid_ids = []
-                rejected_ids = []
-
-                # get a dict copy, because we delete elements from the dict
-                objects = container.getObjects()
-                for obj_id, obj in objects.iteritems():
-                    # eval condition string based on the feature dict (provides values for the features above)
-                    if not eval(conditions_str, obj.getFeatures()):
-                        if delete_objects:
-                            container.delObject(obj_id)
-                        rejected_ids.append(obj_id)
-                    else:
-                        valid_ids.append(obj_id)
+            ofilter = ObjectFilter.from_minmax(roisize_minmax, intensity_minmax)
+            if len(ofilter) > 0:
+                valid_ids, rejected_ids = ofilter(container, delete_objects)
 
         # store valid and rejected object IDs to the container
         container.valid_ids = valid_ids
@@ -295,49 +267,16 @@ class SegmentationPluginPrimary2(_SegmentationPlugin):
         rejected_ids = []
 
         if is_active:
-            feature_categories = set()
-            conditions = []
-            for idx, (roisize, intensity) in enumerate( \
-                zip(roisize_minmax, intensity_minmax)):
-                cmprt = '>=' if idx == 0 else '<='
-                if roisize > -1:
-                    feature_categories.add('roisize')
-                    conditions.append('roisize %s %d' % (cmprt, roisize))
-                if intensity > -1:
-                    feature_categories.add('normbase2')
-                    conditions.append('n2_avg %s %d' % (cmprt, intensity+offset))
-
-            if len(conditions) > 0:
-                conditions_str = ' and '.join(conditions)
-
-                # extract features needed for the filter
-                # FIXME: features are currently kept in the ObjectContainer and used for classification automatically
-                # Features can be removed from the container, but it remains much better a choice
-                # to restrict the feature sets used for classification.
-                for feature in feature_categories:
-                    container.applyFeature(feature)
-
-                valid_ids = []
-                rejected_ids = []
-
-                # get a dict copy, because we delete elements from the dict
-                objects = container.getObjects()
-                for obj_id, obj in objects.iteritems():
-                    # eval condition string based on the feature dict (provides values for the features above)
-                    if not eval(conditions_str, obj.getFeatures()):
-                        if delete_objects:
-                            container.delObject(obj_id)
-                        rejected_ids.append(obj_id)
-                    else:
-                        valid_ids.append(obj_id)
-
-            #pdb.set_trace()
-            #img_v = container.img.
+            # intensity bounds are truncated to integers
+            ofilter = ObjectFilter.from_minmax(roisize_minmax, intensity_minmax,
+                                               int(offset))
+            if len(ofilter) > 0:
+                valid_ids, rejected_ids = ofilter(container, delete_objects)
+
             # delete features that were added by the object filter
             for feature in ['roisize', 'normbase2']:
                 container.deleteFeatureCategory(feature)
 
-
         # store valid and rejected object IDs to the container
         container.valid_ids = valid_ids
         container.rejected_ids = rejected_ids
@@ -512,49 +451,16 @@ class SegmentationPluginPrimary3(_SegmentationPlugin):
         rejected_ids = []
 
         if is_active:
-            feature_categories = set()
-            conditions = []
-            for idx, (roisize, intensity) in enumerate( \
-                zip(roisize_minmax, intensity_minmax)):
-                cmprt = '>=' if idx == 0 else '<='
-                if roisize > -1:
-                    feature_categories.add('roisize')
-                    conditions.append('roisize %s %d' % (cmprt, roisize))
-                if intensity > -1:
-                    feature_categories.add('normbase2')
-                    conditions.append('n2_avg %s %d' % (cmprt, intensity+offset))
-
-            if len(conditions) > 0:
-                conditions_str = ' and '.join(conditions)
-
-                # extract features needed for the filter
-                # FIXME: features are currently kept in the ObjectContainer and used for classification automatically
-                # Features can be removed from the container, but it remains much better a choice
-                # to restrict the feature sets used for classification.
-                for feature in feature_categories:
-                    container.applyFeature(feature)
-
-                valid_ids = []
-                rejected_ids = []
-
-                # get a dict copy, because we delete elements from the dict
-                objects = container.getObjects()
-                for obj_id, obj in objects.iteritems():
-                    # eval condition string based on the feature dict (provides values for the features above)
-                    if not eval(conditions_str, obj.getFeatures()):
-                        if delete_objects:
-                            container.delObject(obj_id)
-                        rejected_ids.append(obj_id)
-                    else:
-                        valid_ids.append(obj_id)
-
-            #pdb.set_trace()
-            #img_v = container.img.
+            # intensity bounds are truncated to integers
+            ofilter = ObjectFilter.from_minmax(roisize_minmax, intensity_minmax,
+                                               int(offset))
+            if len(ofilter) > 0:
+                valid_ids, rejected_ids = ofilter(container, delete_objects)
+
             # delete features that were added by the object filter
             for feature in ['roisize', 'normbase2']:
                 container.deleteFeatureCategory(feature)
 
-
         # store valid and rejected object IDs to the container
         container.valid_ids = valid_ids
         container.rejected_ids = rejected_ids
@@ -763,49 +669,15 @@ class SegmentationPluginPrimary4(_SegmentationPlugin):
         rejected_ids = []
 
         if is_active:
-            feature_categories = set()
-            conditions = []
-            for idx, (roisize, intensity) in enumerate( \
-                zip(roisize_minmax, intensity_minmax)):
-                cmprt = '>=' if idx == 0 else '<='
-                if roisize > -1:
-                    feature_categories.add('roisize')
-                    conditions.append('roisize %s %d' % (cmprt, roisize))
-                if intensity > -1:
-                    feature_categories.add('normbase2')
-                    conditions.append('n2_avg %s %f' % (cmprt, intensity+offset))
-
-            if len(conditions) > 0:
-                conditions_str = ' and '.join(conditions)
-
-                # extract features needed for the filter
-                # FIXME: features are currently kept in the ObjectContainer and used for classification automatically
-                # Features can be removed from the container, but it remains much better a choice 
-                # to restrict the feature sets used for classification.
-                for feature in feature_categories:
-                    container.applyFeature(feature)
-
-                valid_ids = []
-                rejected_ids = []
-
-                # get a dict copy, because we delete elements from the dict
-                objects = container.getObjects()
-                for obj_id, obj in objects.iteritems():
-                    # eval condition string based on the feature dict (provides values for the features above)
-                    if not eval(conditions_str, obj.getFeatures()):
-                        if delete_objects:
-                            container.delObject(obj_id)
-                        rejected_ids.append(obj_id)
-                    else:
-                        valid_ids.append(obj_id)
-
-            #pdb.set_trace()
-            #img_v = container.img.
+            ofilter = ObjectFilter.from_minmax(roisize_minmax, intensity_minmax,
+                                               offset)
+            if len(ofilter) > 0:
+                valid_ids, rejected_ids = ofilter(container, delete_objects)
+
             # delete features that were added by the object filter
             for feature in ['roisize', 'normbase2']:
                 container.deleteFeatureCategory(feature)
 
-                
         # store valid and rejected object IDs to the container
         container.valid_ids = valid_ids
         container.rejected_ids = rejected_ids
@@ -983,45 +855,7 @@ class SegmentationPluginPrimaryMultiOtsu(_SegmentationPlugin):
     # histo : a histogram
     # M: the number of free thresholds (M >= 1)
     def _find_multi_otsu(self, histo, M):
-
-        # number of pixels
-        N = numpy.sum(histo)
-    
-        # number of grey levels
-        L = len(histo)
-    
-        # relative histogram
-        hrel = histo / numpy.float(N)
-        
-        A = numpy.tile(numpy.array(hrel), (L, 1))
-        B = numpy.triu(A)
-        P = numpy.cumsum(B, axis=1)
-    
-        C = numpy.tile(numpy.arange(L), (L, 1))
-        D = C * B
-        S = numpy.cumsum(D, axis=1)
-    
-        P[P==0.0] = 1.0
-        scores = S * S / P
-    
-        #pdb.set_trace()
-        
-        grey_values = numpy.arange(1, L-1)
-        best_score = 0 
-        best_combination = ()
-        for thresholds in itertools.combinations(grey_values, M):
-            all_thresholds = list(thresholds) + [L-1]
-            #pdb.set_trace()
-            #current_score = np.sum([scores[i, i+1] for i in all_thresholds[:-1]])
-    
-            current_score = scores[0,all_thresholds[0]]
-            current_score += numpy.sum([scores[all_thresholds[i] + 1, all_thresholds[i+1]] for i in range(len(all_thresholds)-1)])
-            #print all_thresholds, current_score
-            if current_score > best_score:
-                best_combination = thresholds
-                best_score = current_score
-                #print ' *** updated best_score: ', best_combination, best_score
-        return best_score, best_combination
+        return multi_otsu(histo, M)
 
         
     @stopwatch()
@@ -1104,49 +938,15 @@ class SegmentationPluginPrimaryMultiOtsu(_SegmentationPlugin):
         rejected_ids = []
 
         if is_active:
-            feature_categories = set()
-            conditions = []
-            for idx, (roisize, intensity) in enumerate( \
-                zip(roisize_minmax, intensity_minmax)):
-                cmprt = '>=' if idx == 0 else '<='
-                if roisize > -1:
-                    feature_categories.add('roisize')
-                    conditions.append('roisize %s %d' % (cmprt, roisize))
-                if intensity > -1:
-                    feature_categories.add('normbase2')
-                    conditions.append('n2_avg %s %f' % (cmprt, intensity+offset))
-
-            if len(conditions) > 0:
-                conditions_str = ' and '.join(conditions)
-
-                # extract features needed for the filter
-                # FIXME: features are currently kept in the ObjectContainer and used for classification automatically
-                # Features can be removed from the container, but it remains much better a choice 
-                # to restrict the feature sets used for classification.
-                for feature in feature_categories:
-                    container.applyFeature(feature)
-
-                valid_ids = []
-                rejected_ids = []
-
-                # get a dict copy, because we delete elements from the dict
-                objects = container.getObjects()
-                for obj_id, obj in objects.iteritems():
-                    # eval condition string based on the feature dict (provides values for the features above)
-                    if not eval(conditions_str, obj.getFeatures()):
-                        if delete_objects:
-                            container.delObject(obj_id)
-                        rejected_ids.append(obj_id)
-                    else:
-                        valid_ids.append(obj_id)
-
-            #pdb.set_trace()
-            #img_v = container.img.
+            ofilter = ObjectFilter.from_minmax(roisize_minmax, intensity_minmax,
+                                               offset)
+            if len(ofilter) > 0:
+                valid_ids, rejected_ids = ofilter(container, delete_objects)
+
             # delete features that were added by the object filter
             for feature in ['roisize', 'normbase2']:
                 container.deleteFeatureCategory(feature)
 
-                
         # store valid and rejected object IDs to the container
         container.valid_ids = valid_ids
         container.rejected_ids = rejected_ids
@@ -1333,6 +1133,10 @@ class SegmentationPluginIlastik(SegmentationPluginPrimary):
     # the : at the beginning indicates a QRC link with alias 'plugins/segmentation/local_adaptive_threshold'
     DOC = ':local_adaptive_threshold'
 
+    def __init__(self, *args, **kw):
+        super(SegmentationPluginIlastik, self).__init__(*args, **kw)
+        self._ilastik_cache = None
+
     @stopwatch()
     def prefilter(self, img_in):
         img = SegmentationPluginPrimary.prefilter(self, img_in)
@@ -1350,85 +1154,25 @@ class SegmentationPluginIlastik(SegmentationPluginPrimary):
                                ], label='ilastik')
         SegmentationPluginPrimary.render_to_gui(self, panel)
 
-    def _predict_image_with_ilastik(self, image_):
-        import ilastik
-        from ilastik.core.dataMgr import DataMgr, DataItemImage
-        from ilastik.modules.classification.core.featureMgr import FeatureMgr
-        from ilastik.modules.classification.core.classificationMgr import ClassificationMgr
-        from ilastik.modules.classification.core.features.featureBase import FeatureBase
-        from ilastik.modules.classification.core.classifiers.classifierRandomForest import ClassifierRandomForest
-        from ilastik.modules.classification.core.classificationMgr import ClassifierPredictThread
-        from ilastik.core.volume import DataAccessor
-        import numpy, h5py
-
-        dataMgr = DataMgr()
-
-        # Transform input image to ilastik convention s
-        # 3D = (time,x,y,z,channel)
-        # 2D = (time,1,x,y,channel)
-        # Note, this work for 2D images right now. Is there a need for 3D
-        image_.shape = (1,1) + image_.shape
-
-        # Check if image_ has channels, if not add singelton dimension
-        if len(image_.shape) == 4:
-            image_.shape = image_.shape + (1,)
-
-        # Add data item di to dataMgr
-        di = DataItemImage('')
-        di.setDataVol(DataAccessor(image_))
-        dataMgr.append(di, alreadyLoaded=True)
-
-        fileName = self.params["ilastik_classifier"]
-        ilastik_class = self.params["ilastik_class_selector"]
-
-        hf = h5py.File(fileName,'r')
-        temp = hf['classifiers'].keys()
-        # If hf is not closed this leads to an error in win64 and mac os x
-        hf.close()
-        del hf
-
-        classifiers = []
-        for cid in temp:
-            cidpath = 'classifiers/' + cid
-            classifiers.append(ClassifierRandomForest.loadRFfromFile(fileName, str(cidpath)))
-
-        dataMgr.module["Classification"]["classificationMgr"].classifiers = classifiers
-
-        # Restore user selection of feature items from hdf5
-        featureItems = []
-        f = h5py.File(fileName,'r')
-        for fgrp in f['features'].values():
-            featureItems.append(FeatureBase.deserialize(fgrp))
-        f.close()
-        del f
-        fm = FeatureMgr(dataMgr, featureItems)
-
-
-
-        # Create FeatureMgr
-
-
-        # Compute features
-
-        fm.prepareCompute(dataMgr)
-        fm.triggerCompute()
-        fm.joinCompute(dataMgr)
-
-        # Predict with loaded classifier
-
-        classificationPredict = ClassifierPredictThread(dataMgr)
-        classificationPredict.start()
-        classificationPredict.wait()
-
-        if ilastik_class >= classificationPredict._prediction[0].shape[-1]:
-            raise RuntimeError('ilastik output class not valid...')
-
-        # Produce output image and select the probability map
-        probMap = (classificationPredict._prediction[0][0,0,:,:, ilastik_class] * 255).astype(numpy.uint8)
-        img_out = ccore.numpy_to_image(probMap, True)
-        return img_out
-
+    def _ilastik_model(self):
+        """Return the classifier, it is loaded only once per classifier file
+        (and reloaded if the file has been modified)."""
+        filename = self.params["ilastik_classifier"]
+        model = self._ilastik_cache
+        if model is None or model.key != IlastikModel.cache_key(filename):
+            self._ilastik_cache = None
+            model = self._ilastik_cache = IlastikModel(filename)
+        return model
+
+    def predict_images_with_ilastik(self, images):
+        """Return the probability maps of a batch of images (numpy arrays)
+        as ccore images."""
+        model = self._ilastik_model()
+        probmaps = model.predict(images, self.params["ilastik_class_selector"])
+        return [ccore.numpy_to_image(pm, True) for pm in probmaps]
 
+    def _predict_image_with_ilastik(self, image_):
+        return self.predict_images_with_ilastik([image_])[0]
 
 
 class SegmentationPluginExpanded(_SegmentationPlugin):
@@ -1626,45 +1370,7 @@ class SegmentationPluginWatershedAndMultiThreshold(_SegmentationPlugin):
     # histo : a histogram
     # M: the number of free thresholds (M >= 1)
     def _find_multi_otsu(self, histo, M):
-
-        # number of pixels
-        N = numpy.sum(histo)
-    
-        # number of grey levels
-        L = len(histo)
-    
-        # relative histogram
-        hrel = histo / numpy.float(N)
-        
-        A = numpy.tile(numpy.array(hrel), (L, 1))
-        B = numpy.triu(A)
-        P = numpy.cumsum(B, axis=1)
-    
-        C = numpy.tile(numpy.arange(L), (L, 1))
-        D = C * B
-        S = numpy.cumsum(D, axis=1)
-    
-        P[P==0.0] = 1.0
-        scores = S * S / P
-    
-        #pdb.set_trace()
-        
-        grey_values = numpy.arange(1, L-1)
-        best_score = 0 
-        best_combination = ()
-        for thresholds in itertools.combinations(grey_values, M):
-            all_thresholds = list(thresholds) + [L-1]
-            #pdb.set_trace()
-            #current_score = np.sum([scores[i, i+1] for i in all_thresholds[:-1]])
-    
-            current_score = scores[0,all_thresholds[0]]
-            current_score += numpy.sum([scores[all_thresholds[i] + 1, all_thresholds[i+1]] for i in range(len(all_thresholds)-1)])
-            #print all_thresholds, current_score
-            if current_score > best_score:
-                best_combination = thresholds
-                best_score = current_score
-                #print ' *** updated best_score: ', best_combination, best_score
-        return best_score, best_combination
+        return multi_otsu(histo, M)
 
     @stopwatch()
     def _run(self, meta_image, container):
@@ -17,10 +17,33 @@ __source__ = '$URL$'
 __all__ = ['SectionOutput']
 
 from cecog.traits.analyzer.section_core import SectionCore
-from cecog.gui.guitraits import BooleanTrait, IntTrait
+from cecog.gui.guitraits import BooleanTrait, IntTrait, SelectionTrait
 
 SECTION_NAME_OUTPUT = 'Output'
 
+CRACK_CONTOUR_FORMATS = ('string', 'binary')
+COMPRESSION_FILTERS = ('gzip', 'lzf', 'none')
+# dataset classes with individual compression settings
+COMPRESSION_CLASSES = (('raw_images', 'raw images'),
+                       ('label_images', 'label images'),
+                       ('features', 'features'),
+                       ('contours', 'contours'))
+
+
+def _compression_options():
+    options = []
+    for name, label in COMPRESSION_CLASSES:
+        options.extend(
+            [('hdf5_compression_%s' %name,
+              SelectionTrait(COMPRESSION_FILTERS[0], COMPRESSION_FILTERS,
+                             label='Compression %s' %label)),
+             ('hdf5_compression_level_%s' %name,
+              IntTrait(4, 0, 9, label='Level')),
+             ('hdf5_shuffle_%s' %name,
+              BooleanTrait(False, label='Shuffle'))])
+    return options
+
+
 class SectionOutput(SectionCore):
 
     SECTION_NAME = SECTION_NAME_OUTPUT
@@ -34,6 +57,9 @@ class SectionOutput(SectionCore):
            BooleanTrait(False, label='Include segmentation images')),
           ('hdf5_include_crack',
            BooleanTrait(False, label='Include crack contours')),
+          ('hdf5_crack_format',
+           SelectionTrait(CRACK_CONTOUR_FORMATS[0], CRACK_CONTOUR_FORMATS,
+                          label='Crack contour format')),
           ('hdf5_include_features',
            BooleanTrait(False, label='Include features')),
           ('hdf5_include_classification',
@@ -42,5 +68,7 @@ class SectionOutput(SectionCore):
            BooleanTrait(False, label='Include tracking')),
           ('hdf5_include_events',
            BooleanTrait(False, label='Include events')),
-      ]),
+          ('hdf5_write_behind',
+           BooleanTrait(False, label='Write in background thread')),
+      ] + _compression_options()),
      ]
@@ -18,7 +18,7 @@ __all__ = ['SectionProcessing']
 
 
 from cecog.traits.analyzer.section_core import SectionCore
-from cecog.gui.guitraits import BooleanTrait
+from cecog.gui.guitraits import BooleanTrait, IntTrait
 
 
 SECTION_NAME_PROCESSING = 'Processing'
@@ -63,6 +63,8 @@ class SectionProcessing(SectionCore):
              BooleanTrait(False, label='Classification')),
             ('merged_errorcorrection',
              BooleanTrait(False, label='Error correction')),
+            ('channel_threads',
+             IntTrait(1, 1, 64, label='Threads per position')),
             ]
           )
          ]
@@ -17,11 +17,15 @@ __source__ = '$URL$'
 __all__ = ['SectionTracking']
 
 from cecog.traits.analyzer.section_core import SectionCore
-from cecog.gui.guitraits import IntTrait, BooleanTrait, SelectionTrait2
+from cecog.gui.guitraits import IntTrait, BooleanTrait, SelectionTrait, \
+    SelectionTrait2
 
 
 SECTION_NAME_TRACKING = 'Tracking'
 
+# greedy nearest neighbour linking (Tracker) or linear assignment (LapTracker)
+TRACKING_METHODS = ('nearest neighbor', 'global assignment')
+
 
 class SectionTracking(SectionCore):
 
@@ -31,11 +35,16 @@ class SectionTracking(SectionCore):
         ('tracking',
          [('region',
            SelectionTrait2(None, [], label='Region name')),
+          ('tracking_method',
+           SelectionTrait(TRACKING_METHODS[0], TRACKING_METHODS,
+                          label='Tracking method')),
           ('tracking_maxobjectdistance',
            IntTrait(0, 0, 4000, label='Max object x-y distance')),
           ('tracking_maxtrackinggap',
            IntTrait(0, 0, 4000, label='Max time-point gap')),
           ('tracking_maxsplitobjects',
            IntTrait(0, 0, 4000, label='Max split events')),
+          ('tracking_streaming',
+           BooleanTrait(False, label='Streaming (bounded memory)')),
           ]),
         ]
@@ -28,6 +28,7 @@
 #include <boost/python/args.hpp>
 
 #include "cecog/containers.hxx"
+#include "vigra/python_utility.hxx"
 
 using namespace boost::python;
 
@@ -35,7 +36,6 @@ namespace cecog
 {
   namespace python
   {
-    BOOST_PYTHON_MEMBER_FUNCTION_OVERLOADS(apply_feature_overloads, applyFeature, 1, 2)
     BOOST_PYTHON_MEMBER_FUNCTION_OVERLOADS(export_rgb_overloads, exportRGB, 1, 3)
     BOOST_PYTHON_MEMBER_FUNCTION_OVERLOADS(draw_ellipse_overloads, drawEllipse, 4, 6)
     BOOST_PYTHON_MEMBER_FUNCTION_OVERLOADS(connect_objects_overloads, connectObjects, 2, 4)
@@ -48,6 +48,16 @@ namespace cecog
     BOOST_PYTHON_MEMBER_FUNCTION_OVERLOADS(threshold_overloads, threshold, 1, 2)
     BOOST_PYTHON_MEMBER_FUNCTION_OVERLOADS(draw_contours_byids_overloads, drawContoursByIds, 3, 5)
 
+    // the features are computed on the container only, other threads can
+    // run python code in the meantime
+    int pyApplyFeature(cecog::ObjectContainerBase<8> &c, std::string name,
+                       bool force=false)
+    {
+      vigra::PyAllowThreads _pythread;
+      return c.applyFeature(name, force);
+    }
+    BOOST_PYTHON_FUNCTION_OVERLOADS(apply_feature_overloads, pyApplyFeature, 2, 3)
+
     template <class OBJECT_CONTAINER>
     dict object_wrapper(OBJECT_CONTAINER &c)
     {
@@ -81,7 +91,7 @@ void wrap_containers()
   void (_ObjectContainerBase::*fx2)(cecog::RGBValue, bool, bool, bool, bool) = &_ObjectContainerBase::markObjects;
 
   class_< _ObjectContainerBase >("ObjectContainerBase")
-    .def("applyFeature", &_ObjectContainerBase::applyFeature,
+    .def("applyFeature", &pyApplyFeature,
          apply_feature_overloads())
     .def("deleteFeature", &_ObjectContainerBase::deleteFeature)
     .def("deleteFeatureCategory", &_ObjectContainerBase::deleteFeatureCategory)
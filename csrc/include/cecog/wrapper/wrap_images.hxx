@@ -55,6 +55,7 @@
 #include "cecog/readout.hxx"
 #include "cecog/inspectors.hxx"
 #include "cecog/transforms.hxx"
+#include "cecog/wrapper/wrap_threads.hxx"
 #include "cecog/polygon.hxx"
 
 #include "cecog/seededregion.hxx"
@@ -804,6 +805,7 @@ PyObject * pyFlatfieldCorrection(Image1 const & imgIn, Image2 const & imgBack, f
                           srcImage(imgBack2),
                           destImage(*imgPtr),
                           Arg1() / Arg2() * Param(normV) + Param(offset));
+  cecog::python::PyAcquireGIL _pygil;
   return incref(object(imgPtr).ptr());
 }
 
@@ -815,6 +817,7 @@ PyObject * pyLinearTransform(Image1 const &imgIn, double ratio, typename Image1:
    std::auto_ptr< Image2 > imgPtr(new Image2(imgIn.size()));
    vigra::transformImage(srcImageRange(imgIn), destImage(*imgPtr),
                          vigra::linearIntensityTransform(ratio, offset));
+   cecog::python::PyAcquireGIL _pygil;
    return incref(object(imgPtr).ptr());
 }
 
@@ -825,6 +828,7 @@ PyObject * pyLinearTransform2(Image1 const &imgIn, typename Image1::value_type s
    std::auto_ptr< Image2 > imgPtr(new Image2(imgIn.size()));
    vigra::transformImage(srcImageRange(imgIn), destImage(*imgPtr),
                          cecog::ImageLinearTransform<typename Image1::value_type, typename Image2::value_type>(srcMin, srcMax, destMin, destMax, minV, maxV));
+   cecog::python::PyAcquireGIL _pygil;
    return incref(object(imgPtr).ptr());
 }
 
@@ -864,6 +868,7 @@ PyObject * pyImageMinmax(IMAGE const & imin)
    vigra::PyAllowThreads _pythread;
    vigra::FindMinMax<typename IMAGE::value_type> minmax;
    inspectImage(srcImageRange(imin), minmax);
+   cecog::python::PyAcquireGIL _pygil;
    return incref(make_tuple(minmax.min, minmax.max).ptr());
 }
 
@@ -874,6 +879,7 @@ list pyImageHistogram(IMAGE1 const &imin, unsigned int valueCount)
    cecog::FindHistogram<typename IMAGE1::value_type> hist(valueCount);
    inspectImage(srcImageRange(imin), hist);
    std::vector<double> p(hist.probabilities());
+   cecog::python::PyAcquireGIL _pygil;
    list h;
    for (unsigned i = 0; i < p.size(); i++) {
      h.append(p[i]);
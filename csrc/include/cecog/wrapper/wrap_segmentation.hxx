@@ -26,6 +26,7 @@
 #include "cecog/segmentation.hxx"
 #include "cecog/thresholds.hxx"
 #include "vigra/python_utility.hxx"
+#include "cecog/wrapper/wrap_threads.hxx"
 
 using namespace boost::python;
 
@@ -41,6 +42,7 @@ namespace cecog
                                        int neighborhood,
                                        int dist_mode)
     {
+      vigra::PyAllowThreads _pythread;
       std::auto_ptr< IMAGE > imgPtr(new IMAGE(imgIn.size()));
       using namespace cecog::morpho;
 
@@ -53,6 +55,7 @@ namespace cecog
         cecog::watershedDynamicSplit(imgIn, *imgPtr, dyn_thresh, nb, dist_mode);
       }
 
+      cecog::python::PyAcquireGIL _pygil;
       return incref(object(imgPtr).ptr());
     }
 
@@ -69,6 +72,7 @@ namespace cecog
       vigra::PyAllowThreads _pythread;
       std::auto_ptr< IMAGE2 > imgPtr(new IMAGE2(imgIn.size()));
       vigra::discMedian(srcImageRange(imgIn), destImage(*imgPtr), radius);
+      cecog::python::PyAcquireGIL _pygil;
       return incref(object(imgPtr).ptr());
     }
 
@@ -85,6 +89,7 @@ namespace cecog
                             vigra::Threshold<typename IMAGE1::PixelType,
                                              typename IMAGE2::PixelType>
                             (lower, higher, noresult, yesresult));
+      cecog::python::PyAcquireGIL _pygil;
       return incref(object(imgPtr).ptr());
     }
 
@@ -96,6 +101,7 @@ namespace cecog
       using namespace cecog::morpho;
       structuringElement2D se(WITHCENTER8, size);
       ImFastToggleMapping(srcImageRange(imgIn), destImage(*imgPtr), se);
+      cecog::python::PyAcquireGIL _pygil;
       return incref(object(imgPtr).ptr());
     }
 
@@ -130,6 +136,7 @@ namespace cecog
 	  vigra::PyAllowThreads _pythread;
       std::auto_ptr< Image2 > imgPtr(new Image2(imgIn.size()));
       cecog::windowAverageThreshold(imgIn, *imgPtr, size, contrastLimit, lower, higher);
+      cecog::python::PyAcquireGIL _pygil;
       return incref(object(imgPtr).ptr());
     }
 
@@ -142,6 +149,7 @@ namespace cecog
 	  vigra::PyAllowThreads _pythread;
       std::auto_ptr< Image2 > imgPtr(new Image2(imgIn.size()));
       cecog::windowStdThreshold(imgIn, *imgPtr, size, threshold, contrastLimit);
+      cecog::python::PyAcquireGIL _pygil;
       return incref(object(imgPtr).ptr());
     }
 
@@ -165,6 +173,7 @@ namespace cecog
                                   costThreshold,
                                   expansionRounds,
                                   sepExpandRounds);
+      cecog::python::PyAcquireGIL _pygil;
       return incref(object(imgPtr).ptr());
     }
 
@@ -182,6 +191,7 @@ namespace cecog
                                   destImage(*imgPtr),
                                   stats,
                                   shrinkingRounds);
+      cecog::python::PyAcquireGIL _pygil;
       return incref(object(imgPtr).ptr());
     }
 
@@ -198,6 +208,7 @@ namespace cecog
         cecog::segmentationPropagate(imgIn, imgInBinary,
                                      imgLabelsIn, *imgPtr,
                                      lambda, deltaWidth, srgType);
+        cecog::python::PyAcquireGIL _pygil;
         return incref(object(imgPtr).ptr());
     }
 
@@ -212,6 +223,7 @@ namespace cecog
       cecog::segmentationCorrection(imgIn, binIn, *imgPtr,
                                     rSize, gaussSize, maximaSize, iMinMergeSize,
                                     ShapeBasedSegmentation);
+      cecog::python::PyAcquireGIL _pygil;
       return incref(object(imgPtr).ptr());
     }
 
@@ -226,6 +238,7 @@ namespace cecog
       cecog::segmentationCorrection(imgIn, binIn, *imgPtr,
                                     rSize, gaussSize, maximaSize, iMinMergeSize,
                                     IntensityBasedSegmentation);
+      cecog::python::PyAcquireGIL _pygil;
       return incref(object(imgPtr).ptr());
     }
 
@@ -0,0 +1,50 @@
+/*******************************************************************************
+
+                           The CellCognition Project
+                   Copyright (c) 2006 - 2016 Gerlich Lab, IMBA Vienna
+                              www.cellcognition.org
+
+              CellCognition is distributed under the LGPL License.
+                        See trunk/LICENSE.txt for details.
+                 See trunk/AUTHORS.txt for author contributions.
+
+*******************************************************************************/
+
+#ifndef CECOG_PYTHON_WRAP_THREADS_HXX_
+#define CECOG_PYTHON_WRAP_THREADS_HXX_
+
+#include "Python.h"
+#include "vigra/python_utility.hxx"
+
+namespace cecog
+{
+  namespace python
+  {
+    /**
+     * Re-acquires the GIL in a scope where it was released by
+     * vigra::PyAllowThreads, e.g. to convert the result of a computation
+     * to a python object. Declare it after the PyAllowThreads instance,
+     * the GIL is released again at the end of the scope.
+     */
+    class PyAcquireGIL
+    {
+    public:
+      PyAcquireGIL()
+        : state_(PyGILState_Ensure())
+      {}
+
+      ~PyAcquireGIL()
+      {
+        PyGILState_Release(state_);
+      }
+
+    private:
+      PyAcquireGIL(PyAcquireGIL const &);
+      PyAcquireGIL & operator=(PyAcquireGIL const &);
+
+      PyGILState_STATE state_;
+    };
+  }
+}
+
+#endif // CECOG_PYTHON_WRAP_THREADS_HXX_
@@ -0,0 +1,136 @@
+"""
+bench_compression.py
+
+Run one position with each compression preset of the cellh5 output and
+report write time, file size and the time to read gallery images with
+Ch5File.galleryImage. The position is processed into the output directory
+of the settings file, the cellh5 file of each preset is moved to OUTDIR.
+
+usage: python bench_compression.py -s SETTINGS [-P POSITION] [-o OUTDIR]
+"""
+
+__copyright__ = ('The CellCognition Project'
+                 'Copyright (c) 2006 - 2016'
+                 'Gerlich Lab, IMBA Vienna, Austria'
+                 'see AUTHORS.txt for contributions')
+__licence__ = 'LGPL'
+__url__ = 'www.cellcognition.org'
+
+
+import os
+import sys
+import glob
+import shutil
+import argparse
+import tempfile
+from collections import OrderedDict
+
+from matplotlib import use
+use('Agg')
+
+try:
+    import cecog
+except ImportError:
+    sys.path.append(os.pardir)
+    import cecog
+
+from cecog.version import version
+from cecog.traits.config import ConfigSettings
+from cecog.traits.analyzer.output import COMPRESSION_CLASSES
+from cecog.environment import CecogEnvironment
+from cecog.io.imagecontainer import ImageContainer
+from cecog.analyzer.plate import PlateAnalyzer
+from cecog.util.stopwatch import StopWatch
+from cecog.io.hdf import Ch5File
+
+
+# compression, level, shuffle for all dataset classes
+PRESETS = OrderedDict((('gzip', ('gzip', 4, False)),
+                       ('lzf', ('lzf', 4, True)),
+                       ('gzip-9', ('gzip', 9, True)),
+                       ('none', ('none', 4, False))))
+
+
+def apply_preset(settings, preset):
+    compression, level, shuffle = PRESETS[preset]
+    for name, _ in COMPRESSION_CLASSES:
+        settings.set('Output', 'hdf5_compression_%s' %name, compression)
+        settings.set('Output', 'hdf5_compression_level_%s' %name, level)
+        settings.set('Output', 'hdf5_shuffle_%s' %name, shuffle)
+
+
+def read_galleries(filename, nobjects, size=60):
+    """Read gallery images of the first nobjects of each object mask."""
+    nimages = 0
+    with Ch5File(filename, mode='r') as ch5:
+        for site in ch5.iterSites():
+            features = ch5[site.join('feature')]
+            masks = [m for m in features if 'center' in features[m]]
+            for mask in masks:
+                n = min(nobjects, features[mask]['center'].shape[0])
+                for i in xrange(n):
+                    ch5.galleryImage(i, site, mask, size)
+                nimages += n
+    return nimages
+
+
+def main(args):
+    environ = CecogEnvironment(version, redirect=False, debug=False)
+
+    settings = ConfigSettings()
+    settings.read(os.path.abspath(args.settings))
+
+    imagecontainer = ImageContainer()
+    imagecontainer.import_from_settings(settings)
+    plate = imagecontainer.plates[0]
+    imagecontainer.set_plate(plate)
+
+    position = args.position
+    if position is None:
+        position = sorted(imagecontainer.get_meta_data().positions)[0]
+
+    settings.set('General', 'constrain_positions', True)
+    settings.set('General', 'positions', position)
+    settings.set('General', 'skip_finished', False)
+    for option in ('hdf5_create_file', 'hdf5_include_raw_images',
+                   'hdf5_include_label_images', 'hdf5_include_crack',
+                   'hdf5_include_features'):
+        settings.set('Output', option, True)
+
+    print "plate %s, position %s" %(plate, position)
+    print "%-8s %10s %10s %10s" %("preset", "write (s)", "size (MB)", "read (s)")
+
+    for preset in args.presets:
+        apply_preset(settings, preset)
+        sw = StopWatch(start=True)
+        analyzer = PlateAnalyzer(plate, settings, imagecontainer, mode="w")
+        analyzer()
+        twrite = sw.stop()
+
+        # keep the file of each preset, the next run overwrites cellh5/
+        filename = os.path.join(args.outdir, "bench_%s.ch5" %preset)
+        shutil.move(glob.glob(os.path.join(analyzer.ch5dir, "*.ch5"))[0],
+                    filename)
+        size = os.path.getsize(filename)/2.0**20
+
+        sw = StopWatch(start=True)
+        read_galleries(filename, args.objects)
+        tread = sw.stop()
+
+        print "%-8s %10.3f %10.2f %10.3f" %(preset, twrite, size, tread)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description='Benchmark compression presets of the cellh5 output')
+    parser.add_argument('-s', '--settings', required=True,
+                        help='CecogAnalyzer settings file')
+    parser.add_argument('-P', '--position', default=None,
+                        help='Position to process (default: first position)')
+    parser.add_argument('-n', '--objects', type=int, default=500,
+                        help='Number of gallery images read per object mask')
+    parser.add_argument('-p', '--presets', nargs='+', default=PRESETS.keys(),
+                        choices=PRESETS.keys())
+    parser.add_argument('-o', '--outdir', default=tempfile.gettempdir())
+    main(parser.parse_args())
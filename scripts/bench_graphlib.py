@@ -0,0 +1,137 @@
+"""
+bench_graphlib.py
+
+Time the traversals of graphLib.Graph (topological sorts, bfs, dfs) on
+tracking-like graphs, i.e. parallel tracks with a common root node. The
+queue and stack of graphLib are compared with the legacy list-slicing
+implementation, which is quadratic in the length of the queue and is run
+only on the smaller graphs.
+
+usage: python bench_graphlib.py [-n NODES [NODES ...]] [-l FRAMES]
+"""
+
+__copyright__ = ('The CellCognition Project'
+                 'Copyright (c) 2006 - 2016'
+                 'Gerlich Lab, IMBA Vienna, Austria'
+                 'see AUTHORS.txt for contributions')
+__licence__ = 'LGPL'
+__url__ = 'www.cellcognition.org'
+
+
+import os
+import sys
+import argparse
+
+try:
+    import cecog
+except ImportError:
+    sys.path.append(os.pardir)
+    import cecog
+
+from cecog.util.stopwatch import StopWatch
+from cecog.extensions import graphLib
+
+
+class LegacyQueue:
+
+    def __init__(self):
+        self.q=[]
+
+    def empty(self):
+        return int(len(self.q) == 0)
+
+    def add(self, item):
+        self.q.append(item)
+
+    def remove(self):
+        item=self.q[0]
+        self.q=self.q[1:]
+        return item
+
+
+class LegacyStack:
+
+    def __init__(self):
+        self.s=[]
+
+    def empty(self):
+        return int(len(self.s) == 0)
+
+    def push(self, item):
+        ts=[item]
+        for i in self.s:
+            ts.append(i)
+        self.s=ts
+
+    def pop(self):
+        item=self.s[0]
+        self.s=self.s[1:]
+        return item
+
+
+def track_graph(nnodes, nframes):
+    """Tracks of nframes nodes, all tracks start at the root node 0."""
+    graph = graphLib.Graph()
+    graph.add_node(0)
+    ntracks = max(1, (nnodes-1)//nframes)
+    for track in xrange(ntracks):
+        previous = 0
+        for frame in xrange(nframes):
+            node = 1 + track*nframes + frame
+            graph.add_node(node)
+            graph.add_edge(previous, node)
+            previous = node
+    return graph
+
+
+def traversals(graph):
+    return (('topological_sort', graph.topological_sort),
+            ('reverse_topological_sort', graph.reverse_topological_sort),
+            ('bfs', lambda: graph.bfs(0)),
+            ('dfs', lambda: graph.dfs(0)),
+            ('dfs_edges', lambda: graph.dfs_edges(0)))
+
+
+def run(graph, queue, stack):
+    """Time all traversals with the given queue and stack classes."""
+    saved = graphLib.GraphQueue, graphLib.GraphStack
+    graphLib.GraphQueue, graphLib.GraphStack = queue, stack
+    try:
+        times = []
+        for name, traverse in traversals(graph):
+            sw = StopWatch(start=True)
+            traverse()
+            times.append(sw.stop())
+        return times
+    finally:
+        graphLib.GraphQueue, graphLib.GraphStack = saved
+
+
+def main(args):
+    print "%d frames per track" %args.frames
+    print "%-10s %-26s %10s %10s" %("nodes", "traversal", "legacy (s)", "deque (s)")
+
+    for nnodes in args.nodes:
+        graph = track_graph(nnodes, args.frames)
+        current = run(graph, graphLib.GraphQueue, graphLib.GraphStack)
+        if nnodes <= args.legacy_max:
+            legacy = run(graph, LegacyQueue, LegacyStack)
+        else:
+            legacy = [None]*len(current)
+
+        for (name, _), tl, tc in zip(traversals(graph), legacy, current):
+            tl = "-" if tl is None else "%.3f" %tl
+            print "%-10d %-26s %10s %10.3f" %(graph.number_of_nodes(), name, tl, tc)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description='Benchmark the traversals of graphLib.Graph')
+    parser.add_argument('-n', '--nodes', type=int, nargs='+',
+                        default=[10**4, 10**5, 10**6])
+    parser.add_argument('-l', '--frames', type=int, default=200,
+                        help='Length of the tracks')
+    parser.add_argument('--legacy-max', type=int, default=10**5,
+                        help='Largest graph for the legacy queue and stack')
+    main(parser.parse_args())
@@ -0,0 +1,148 @@
+"""
+bench_object_tables.py
+
+Compare write and read times of cellh5 object tables for the legacy layout
+(chunks sized by the first frame, resize every frame) and the preallocated,
+frame-aware layout used by TimeHolder.
+
+usage: python bench_object_tables.py [-f FRAMES] [-n OBJECTS] [-o OUTDIR]
+"""
+
+__copyright__ = ('The CellCognition Project'
+                 'Copyright (c) 2006 - 2016'
+                 'Gerlich Lab, IMBA Vienna, Austria'
+                 'see AUTHORS.txt for contributions')
+__licence__ = 'LGPL'
+__url__ = 'www.cellcognition.org'
+
+
+import os
+import sys
+import argparse
+import tempfile
+
+import h5py
+import numpy as np
+
+try:
+    import cecog
+except ImportError:
+    sys.path.append(os.pardir)
+    import cecog
+
+from cecog.util.stopwatch import StopWatch
+from cecog.analyzer.timeholder import TimeHolder
+from cecog.analyzer.timeholder import object_chunk_rows, object_table_rows
+
+
+def frame_data(nframes, nobjects, nfeatures, seed=42):
+    """Random object tables (index, features) for each frame."""
+    rs = np.random.RandomState(seed)
+    for frame_idx in xrange(nframes):
+        n = max(0, int(rs.normal(nobjects, 0.1*nobjects)))
+        index = np.empty((n, ), dtype=TimeHolder.HDF5_DTYPE_OBJECT_INDEX)
+        index['time_idx'] = frame_idx
+        index['obj_label_id'] = np.arange(1, n+1)
+        yield index, rs.rand(n, nfeatures)
+
+
+def write_legacy(filename, nframes, nobjects, nfeatures, compression):
+    with h5py.File(filename, 'w') as fp:
+        dindex = dfeatures = None
+        for index, features in frame_data(nframes, nobjects, nfeatures):
+            n = index.size
+            if dindex is None:
+                dindex = fp.create_dataset(
+                    'index', (n, ), index.dtype, chunks=(max(n, 1), ),
+                    compression=compression, maxshape=(None, ))
+                dfeatures = fp.create_dataset(
+                    'features', (n, nfeatures), 'float',
+                    compression=compression, maxshape=(None, nfeatures))
+                offset = 0
+            else:
+                offset = dindex.shape[0]
+                dindex.resize((offset + n, ))
+                dfeatures.resize(offset + n, axis=0)
+            dindex[offset:offset+n] = index
+            dfeatures[offset:offset+n] = features
+
+
+def write_preallocated(filename, nframes, nobjects, nfeatures, compression):
+
+    with h5py.File(filename, 'w') as fp:
+        dindex = dfeatures = None
+        nrows = 0
+        for i, (index, features) in enumerate(
+            frame_data(nframes, nobjects, nfeatures)):
+            n = index.size
+            if dindex is None:
+                nalloc = object_table_rows(n, 1, nframes)
+                fill = np.array((-1, -1), index.dtype)
+                dindex = fp.create_dataset(
+                    'index', (nalloc, ), index.dtype,
+                    chunks=(object_chunk_rows(n, index.dtype.itemsize), ),
+                    compression=compression, maxshape=(None, ),
+                    fillvalue=fill)
+                dfeatures = fp.create_dataset(
+                    'features', (nalloc, nfeatures), 'float',
+                    chunks=(object_chunk_rows(n, 8*nfeatures), nfeatures),
+                    compression=compression, maxshape=(None, nfeatures))
+            elif dindex.shape[0] < nrows + n:
+                nalloc = object_table_rows(nrows + n, i+1, nframes,
+                                           dindex.shape[0])
+                dindex.resize((nalloc, ))
+                dfeatures.resize(nalloc, axis=0)
+
+            dindex[nrows:nrows+n] = index
+            dfeatures[nrows:nrows+n] = features
+            nrows += n
+
+        dindex.resize((nrows, ))
+        dfeatures.resize(nrows, axis=0)
+
+
+def read_frames(filename, nframes):
+    """Read pattern of cellh5: object rows of a frame, then their features."""
+    with h5py.File(filename, 'r') as fp:
+        time_idx = fp['index']['time_idx']
+        dfeatures = fp['features']
+        for frame_idx in xrange(nframes):
+            rows = np.flatnonzero(time_idx == frame_idx)
+            if rows.size:
+                dfeatures[rows[0]:rows[-1]+1]
+
+
+def main(args):
+    methods = (('legacy', write_legacy),
+               ('preallocated', write_preallocated))
+
+    print "%d frames, ~%d objects/frame, %d features, compression=%s" \
+        %(args.frames, args.objects, args.features, args.compression)
+    print "%-14s %10s %10s %10s" %("layout", "write (s)", "read (s)", "size (MB)")
+
+    for name, write in methods:
+        filename = os.path.join(args.outdir, "bench_%s.h5" %name)
+        sw = StopWatch(start=True)
+        write(filename, args.frames, args.objects, args.features,
+              args.compression)
+        twrite = sw.stop()
+
+        sw = StopWatch(start=True)
+        read_frames(filename, args.frames)
+        tread = sw.stop()
+
+        size = os.path.getsize(filename)/2.0**20
+        print "%-14s %10.3f %10.3f %10.2f" %(name, twrite, tread, size)
+        os.remove(filename)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description='Benchmark cellh5 object table layouts')
+    parser.add_argument('-f', '--frames', type=int, default=200)
+    parser.add_argument('-n', '--objects', type=int, default=2000)
+    parser.add_argument('--features', type=int, default=200)
+    parser.add_argument('-c', '--compression', default='gzip')
+    parser.add_argument('-o', '--outdir', default=tempfile.gettempdir())
+    main(parser.parse_args())
@@ -0,0 +1,464 @@
+"""
+test_eventselection.py
+
+Compares the iterative track linearization and checks of EventSelection
+with the former recursive implementation, the vectorized event search
+on label arrays with the former scan of each node, and the search in worker
+processes with the sequential search.
+"""
+
+__copyright__ = ('The CellCognition Project'
+                 'Copyright (c) 2006 - 2016'
+                 'Gerlich Lab, IMBA Vienna, Austria'
+                 'see AUTHORS.txt for contributions')
+__licence__ = 'LGPL'
+__url__ = 'www.cellcognition.org'
+
+
+import sys
+import unittest
+
+import numpy
+
+from cecog.analyzer.trackgraph import TrackingGraph, pack_nodeids
+
+try:
+    from cecog.analyzer import eventselection
+    from cecog.analyzer.eventselection import EventSelection
+except ImportError:
+    # cecog.ccore is not built
+    EventSelection = None
+
+
+class Sample(object):
+
+    def __init__(self, label):
+        self.iLabel = label
+        self.iId = 1
+        self.oCenterAbs = (0, 0)
+
+
+def node_id(frame, label):
+    return int(pack_nodeids(frame, label))
+
+
+def random_graph(rs, nframes=20, nobjects=8, pnolabel=0.1):
+    """Tracking graph with splits and merges. Labels are inherited
+    from the predecessor with a probability of 0.7, unclassified samples
+    have the label None."""
+    graph = TrackingGraph()
+    previous = []
+    for frame in xrange(nframes):
+        current = []
+        for label in xrange(1, rs.randint(1, nobjects+1)):
+            nodeid = node_id(frame, label)
+            heads = list()
+            if previous and rs.rand() < 0.85:
+                heads.append(previous[rs.randint(len(previous))])
+                # a second predecessor, i.e. a merge
+                if rs.rand() < 0.1:
+                    head = previous[rs.randint(len(previous))]
+                    if head not in heads:
+                        heads.append(head)
+
+            if rs.rand() < pnolabel:
+                class_label = None
+            elif heads and rs.rand() < 0.7:
+                class_label = graph.node_data(heads[0]).iLabel
+            else:
+                class_label = int(rs.randint(1, 4))
+            graph.add_node(nodeid, Sample(class_label))
+            for head in heads:
+                graph.add_edge(head, nodeid)
+            current.append(nodeid)
+        previous = current
+    return graph
+
+
+def random_options(rs, open_ranges=True):
+    """Random selection options, open_ranges includes ranges of -1 (up to
+    the start or end of the track)."""
+    ranges = [-1] if open_ranges else []
+    return dict(transitions=[(1, 2), (2, 3)],
+                forward_range=int(rs.choice(ranges + [1, 2, 4])),
+                backward_range=int(rs.choice(ranges + [1, 2, 3])),
+                forward_labels=rs.choice([1, 2, 3], 2).tolist(),
+                backward_labels=rs.choice([1, 2, 3], 2).tolist(),
+                max_in_degree=int(rs.choice([1, 2])),
+                max_out_degree=int(rs.choice([1, 2, 3])),
+                forward_check=int(rs.randint(0, 3)),
+                backward_check=int(rs.randint(0, 4)),
+                forward_range_min=int(rs.choice([-1, 0, 1])),
+                backward_range_min=int(rs.choice([-1, 0, 1])),
+                allow_one_daughter_cell=bool(rs.randint(2)))
+
+
+def long_track(nframes):
+    """A single track, the class label changes from 1 to 2 in the middle."""
+    graph = TrackingGraph()
+    previous = None
+    for frame in xrange(nframes):
+        nodeid = node_id(frame, 1)
+        graph.add_node(nodeid, Sample(1 if frame < nframes//2 else 2))
+        if previous is not None:
+            graph.add_edge(previous, nodeid)
+        previous = nodeid
+    return graph
+
+
+if EventSelection is not None:
+
+    class RecursiveSelection(EventSelection):
+        """The former recursive linearization and checks."""
+
+        def _linearize(self, nodeid, results, visited_nodes, level=0):
+            base = results['_current_branch']
+            results['_full_tracks'][base].append(nodeid)
+            depth = len(results['_full_tracks'][base])
+            for i, out_edgeid in enumerate(self.graph.out_arcs(nodeid)):
+                tailid = self.graph.tail(out_edgeid)
+                if not visited_nodes[tailid]:
+                    visited_nodes[tailid] = True
+                    if i > 0:
+                        results['_full_tracks'].append(
+                            results['_full_tracks'][base][:depth])
+                        results['_current_branch'] += 1
+                    self._linearize(tailid, results, visited_nodes,
+                                    level=level+1)
+
+        def _backward_check(self, nodeid, nodeids, level=1):
+            nodeids.append(nodeid)
+            if ((self.backward_range == -1 and self.graph.in_degree(nodeid) == 0) or
+                (self.backward_range_min and level >= self.backward_range and
+                 self.graph.in_degree(nodeid) == 0) or
+                (not self.backward_range_min and level >= self.backward_range)):
+                return True
+
+            if self.graph.out_degree(nodeid) != 1:
+                return False
+            if self.graph.in_degree(nodeid) != 1:
+                return False
+
+            sample = self.graph.node_data(nodeid)
+            if level > 1 and level-1 <= self.backward_check and not \
+                    sample.iLabel in self.backward_labels:
+                return False
+
+            edgeid = self.graph.in_arcs(nodeid)[0]
+            headid = self.graph.head(edgeid)
+            return self._backward_check(headid, nodeids, level=level+1)
+
+        def _forward_check(self, nodeid, nodeids, level=1, found_splitid=None):
+            nodeids.append(nodeid)
+            if ((self.forward_range == -1 and self.graph.out_degree(nodeid) == 0) or
+                (self.forward_range_min and level >= self.forward_range and
+                 self.graph.out_degree(nodeid) == 0) or
+                (not self.forward_range_min and level >= self.forward_range)):
+                return True
+
+            if self.graph.in_degree(nodeid) > self.max_in_degree:
+                return False
+            if self.graph.out_degree(nodeid) > self.max_out_degree or \
+                    self.graph.out_degree(nodeid) == 0:
+                return False
+
+            sample = self.graph.node_data(nodeid)
+            if level <= self.forward_check and \
+                    not sample.iLabel in self.forward_labels:
+                return False
+
+            if (found_splitid is None and
+                self.graph.out_degree(nodeid) > 1 and
+                self.graph.out_degree(nodeid) <= self.max_out_degree):
+                found_splitid = nodeid
+                new_nodeids = []
+                result = not self.allow_one_daughter_cell
+                for edgeid in self.graph.out_arcs(nodeid):
+                    new_nodeids.append([])
+                    tailid = self.graph.tail(edgeid)
+                    daughter = self._forward_check(
+                        tailid, new_nodeids[-1], level=level+1,
+                        found_splitid=found_splitid)
+                    if self.allow_one_daughter_cell:
+                        result |= daughter
+                    else:
+                        result &= daughter
+                nodeids.append(new_nodeids)
+                return result
+            else:
+                out_edgeid = self.graph.out_arcs(nodeid)[0]
+                tailid = self.graph.tail(out_edgeid)
+                return self._forward_check(tailid, nodeids, level=level+1,
+                                           found_splitid=found_splitid)
+
+    class ScanSelection(RecursiveSelection):
+        """The former event search, which tests each node of a branch for a
+        transition and runs the recursive checks on the graph."""
+
+        def _extract_events_from_linearized_tracks(self, tracks, graph=None,
+                                                   labels=None):
+            for each_branch in tracks['_full_tracks']:
+                t_idx = 0
+                while t_idx < len(each_branch):
+                    nodeid = each_branch[t_idx]
+                    degrees = (self.graph.out_degree(nodeid),
+                               self.graph.in_degree(nodeid))
+                    if degrees in ((1, 1), (1, 0)):
+                        sample = self.graph.node_data(nodeid)
+                        tailid = self.graph.tail(self.graph.out_arcs(nodeid)[0])
+                        successor = self.graph.node_data(tailid)
+
+                        if self._is_transition(sample, successor):
+                            backward_nodes = []
+                            is_candidate = self._backward_check(
+                                nodeid, backward_nodes)
+                            if is_candidate:
+                                forward_nodes = []
+                                is_candidate = self._forward_check(
+                                    tailid, forward_nodes)
+
+                            if is_candidate:
+                                track_length = self.track_length
+                                backward_nodes.reverse()
+                                startid = backward_nodes[0]
+                                splits = self._split_nodes(forward_nodes)
+                                if len(splits) > 0:
+                                    first_split = splits[0]
+                                    tracks_ = []
+                                    for split in forward_nodes[first_split]:
+                                        track_nodes = backward_nodes + \
+                                            forward_nodes[:first_split] + split
+                                        if len(track_nodes) == track_length:
+                                            tracks_.append(track_nodes)
+
+                                    for i, track in enumerate(tracks_):
+                                        tracks[(startid, i+1)] = {
+                                            'splitId': forward_nodes[first_split-1],
+                                            'eventId': nodeid,
+                                            'maxLength': track_length,
+                                            'tracks': [track],
+                                            'splitIdx': first_split + len(backward_nodes)}
+                                        t_idx += track_length-1
+                                else:
+                                    tracks[startid] = {
+                                        'splitId': None,
+                                        'eventId': nodeid,
+                                        'maxLength': track_length,
+                                        'tracks': [backward_nodes + forward_nodes]}
+                                    t_idx += track_length - 1
+                    t_idx += 1
+
+    class CountingSelection(EventSelection):
+        """Counts the forward checks on the graph, i.e. the forward windows
+        that leave the branch."""
+
+        def __init__(self, *args, **kw):
+            super(CountingSelection, self).__init__(*args, **kw)
+            self.fallbacks = 0
+
+        def _forward_check(self, *args, **kw):
+            self.fallbacks += 1
+            return super(CountingSelection, self)._forward_check(*args, **kw)
+
+
+class RecursionLimit(object):
+
+    def __init__(self, limit):
+        self.limit = limit
+
+    def __enter__(self):
+        self._limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(self.limit)
+
+    def __exit__(self, *args):
+        sys.setrecursionlimit(self._limit)
+
+
+@unittest.skipIf(EventSelection is None, "cecog.ccore is not available")
+class TestLinearization(unittest.TestCase):
+
+    def linearize(self, cls, graph, options):
+        selection = cls(graph, **options)
+        selection._linearize_all(selection.start_nodes())
+        return selection.visitor_data
+
+    def checks(self, cls, graph, options):
+        """Results and visited nodes of the checks of all nodes."""
+        selection = cls(graph, **options)
+        results = list()
+        for nodeid in sorted(graph.node_list()):
+            backward = list()
+            forward = list()
+            results.append((selection._backward_check(nodeid, backward),
+                            backward,
+                            selection._forward_check(nodeid, forward),
+                            forward))
+        return results
+
+    def test_random(self):
+        rs = numpy.random.RandomState(0)
+        for trial in xrange(200):
+            graph = random_graph(rs)
+            options = random_options(rs)
+            self.assertEqual(
+                self.linearize(EventSelection, graph, options),
+                self.linearize(RecursiveSelection, graph, options))
+            self.assertEqual(self.checks(EventSelection, graph, options),
+                             self.checks(RecursiveSelection, graph, options))
+
+    def test_long_track(self):
+        # more nodes than the default recursion limit of 1000 frames
+        graph = long_track(3000)
+        options = dict(transitions=[(1, 2)], forward_range=-1,
+                       backward_range=-1, forward_labels=[1, 2],
+                       backward_labels=[1, 2], forward_check=3000,
+                       backward_check=3000)
+        startid = node_id(0, 1)
+        endid = node_id(2999, 1)
+
+        with RecursionLimit(1000):
+            visitor_data = self.linearize(EventSelection, graph, options)
+            checks = [self._check_ends(EventSelection, graph, options,
+                                       startid, endid)]
+        self.assertEqual(
+            [len(t) for t in visitor_data[startid]['_full_tracks']], [3000])
+
+        with RecursionLimit(1000):
+            self.assertRaises(RuntimeError, self.linearize,
+                              RecursiveSelection, graph, options)
+
+        with RecursionLimit(10000):
+            self.assertEqual(
+                visitor_data,
+                self.linearize(RecursiveSelection, graph, options))
+            checks.append(self._check_ends(RecursiveSelection, graph,
+                                           options, startid, endid))
+        self.assertEqual(checks[0], checks[1])
+
+    def _check_ends(self, cls, graph, options, startid, endid):
+        selection = cls(graph, **options)
+        backward = list()
+        forward = list()
+        return (selection._backward_check(endid, backward), backward,
+                selection._forward_check(startid, forward), forward)
+
+
+@unittest.skipIf(EventSelection is None, "cecog.ccore is not available")
+class TestEventSearch(unittest.TestCase):
+
+    def find_events(self, cls, graph, options):
+        selection = cls(graph, **options)
+        selection.find_events()
+        return selection
+
+    def test_random(self):
+        rs = numpy.random.RandomState(1)
+        nevents = fallbacks = 0
+        for trial in xrange(300):
+            graph = random_graph(rs, pnolabel=rs.choice([0.0, 0.1, 0.3]))
+            # the former scan does not terminate for a negative track length
+            options = random_options(rs, open_ranges=False)
+            selection = self.find_events(CountingSelection, graph, options)
+            self.assertEqual(
+                selection.visitor_data,
+                self.find_events(ScanSelection, graph, options).visitor_data)
+            nevents += sum(1 for _ in selection.iterevents())
+            fallbacks += selection.fallbacks
+        # the comparison is not void
+        self.assertTrue(nevents > 0)
+        self.assertTrue(fallbacks > 0)
+
+    def test_unclassified(self):
+        # unclassified samples are no transitions and fail the label checks
+        graph = long_track(6)
+        graph.node_data(node_id(1, 1)).iLabel = None
+        graph.node_data(node_id(4, 1)).iLabel = None
+        options = dict(transitions=[(1, 2)], forward_range=3,
+                       backward_range=3, forward_labels=[2],
+                       backward_labels=[1], forward_check=3,
+                       backward_check=3)
+        selection = self.find_events(EventSelection, graph, options)
+        self.assertEqual(
+            selection.visitor_data,
+            self.find_events(ScanSelection, graph, options).visitor_data)
+        self.assertEqual(
+            [startid for startid, _ in selection.iterevents()
+             if not isinstance(startid, str)], [])
+
+        graph.node_data(node_id(1, 1)).iLabel = 1
+        graph.node_data(node_id(4, 1)).iLabel = 2
+        selection = self.find_events(EventSelection, graph, options)
+        self.assertEqual(
+            [startid for startid, _ in selection.iterevents()
+             if not isinstance(startid, str)], [node_id(0, 1)])
+
+    def test_window_leaves_branch(self):
+        # track b merges into track a, its branch ends before the forward
+        # range, i.e. the forward check continues on the graph
+        graph = TrackingGraph()
+        track_a = [node_id(frame, 1) for frame in xrange(5)]
+        track_b = [node_id(frame, 2) for frame in xrange(1, 3)]
+        for nodeid in track_a:
+            graph.add_node(nodeid, Sample(2))
+        graph.add_node(track_b[0], Sample(1))
+        graph.add_node(track_b[1], Sample(2))
+        for head, tail in zip(track_a[:-1], track_a[1:]):
+            graph.add_edge(head, tail)
+        graph.add_edge(track_b[0], track_b[1])
+        graph.add_edge(track_b[1], track_a[3])
+
+        options = dict(transitions=[(1, 2)], forward_range=3,
+                       backward_range=1, forward_labels=[2],
+                       backward_labels=[1], forward_check=3,
+                       max_in_degree=2)
+        selection = self.find_events(CountingSelection, graph, options)
+        self.assertEqual(selection.fallbacks, 1)
+        self.assertEqual(
+            selection.visitor_data,
+            self.find_events(ScanSelection, graph, options).visitor_data)
+        self.assertEqual(
+            selection.visitor_data[track_b[0]][track_b[0]]['tracks'],
+            [track_b + track_a[3:]])
+
+
+@unittest.skipIf(EventSelection is None, "cecog.ccore is not available")
+class TestWorkerProcesses(unittest.TestCase):
+
+    def setUp(self):
+        self._min_nodes = eventselection.PARALLEL_MIN_NODES
+        eventselection.PARALLEL_MIN_NODES = 0
+
+    def tearDown(self):
+        eventselection.PARALLEL_MIN_NODES = self._min_nodes
+
+    def test_sequential_by_default(self):
+        selection = EventSelection(TrackingGraph(), [(1, 2)], 1, 1, [2], [1])
+        self.assertEqual(selection.processes, 1)
+        self.assertEqual(selection._nprocesses(10**6), 1)
+
+    @unittest.skipIf(sys.platform.startswith('win'), "workers need fork")
+    def test_same_results(self):
+        rs = numpy.random.RandomState(2)
+        for trial in xrange(5):
+            graph = random_graph(rs, nframes=40, nobjects=20)
+            options = random_options(rs, open_ranges=False)
+            results = list()
+            for processes in (1, 4):
+                selection = EventSelection(graph, processes=processes,
+                                           **options)
+                self.assertEqual(selection._nprocesses(len(graph.nodes)),
+                                 processes)
+                selection.find_events()
+                results.append(selection.visitor_data)
+
+            sequential, parallel = results
+            self.assertEqual(sequential, parallel)
+            # same order of start nodes and events
+            self.assertEqual(sequential.keys(), parallel.keys())
+            for start_id in sequential:
+                self.assertEqual(sequential[start_id].keys(),
+                                 parallel[start_id].keys())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+"""
+test_multiotsu.py
+
+Compares multi_otsu with an exhaustive search over all threshold
+combinations on 8 bit and small histograms.
+"""
+
+__copyright__ = ('The CellCognition Project'
+                 'Copyright (c) 2006 - 2016'
+                 'Gerlich Lab, IMBA Vienna, Austria'
+                 'see AUTHORS.txt for contributions')
+__licence__ = 'LGPL'
+__url__ = 'www.cellcognition.org'
+
+
+import itertools
+import unittest
+
+import numpy
+
+from cecog.plugin.segmentation.multiotsu import multi_otsu, TIE_TOLERANCE
+
+
+def brute_force(histo, M):
+    """Scores of all combinations of M thresholds in lexicographic order."""
+    histo = numpy.asarray(histo, dtype=float)
+    L = histo.size
+    hrel = histo/histo.sum()
+    P = numpy.r_[0.0, numpy.cumsum(hrel)]
+    S = numpy.r_[0.0, numpy.cumsum(numpy.arange(L)*hrel)]
+
+    combinations = numpy.array(
+        list(itertools.combinations(xrange(1, L-1), M)), dtype=int)
+    starts = numpy.c_[numpy.zeros(len(combinations), dtype=int),
+                      combinations + 1]
+    stops = numpy.c_[combinations + 1,
+                     numpy.zeros(len(combinations), dtype=int) + L]
+    p = P[stops] - P[starts]
+    s = S[stops] - S[starts]
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        scores = numpy.where(p > 0, s*s/p, 0.0).sum(axis=1)
+    return combinations, scores
+
+
+class TestMultiOtsu(unittest.TestCase):
+
+    def assertOptimal(self, histo, M):
+        combinations, scores = brute_force(histo, M)
+        score, thresholds = multi_otsu(histo, M)
+        best = scores.max()
+        if not best > 0:
+            self.assertEqual((score, thresholds), (0, ()))
+            return
+
+        eps = 1e-9*best
+        self.assertAlmostEqual(score, best, delta=eps)
+        # the first combination with the best score (within the tolerance)
+        first = numpy.flatnonzero(scores >= best - eps)[0]
+        self.assertEqual(thresholds, tuple(combinations[first]))
+
+    def test_random_8bit(self):
+        rs = numpy.random.RandomState(0)
+        for trial in xrange(40):
+            M = 1 + trial % 2
+            kind = trial % 4
+            if kind == 0:
+                histo = rs.randint(0, 100, 256)
+            elif kind == 1:
+                values = numpy.r_[rs.normal(50, 12, 3000),
+                                  rs.normal(130, 25, 1000),
+                                  rs.normal(200, 12, 500)]
+                histo = numpy.bincount(
+                    numpy.clip(values, 0, 255).astype(int), minlength=256)
+            elif kind == 2:
+                histo = numpy.zeros(256, dtype=int)
+                idx = rs.choice(256, rs.randint(1, 6), replace=False)
+                histo[idx] = rs.randint(1, 50, idx.size)
+            else:
+                histo = (rs.rand(256) < 0.3)*rs.randint(0, 1000, 256)
+            self.assertOptimal(histo, M)
+
+    def test_random_small(self):
+        rs = numpy.random.RandomState(1)
+        for trial in xrange(300):
+            L = rs.choice([3, 4, 5, 8, 16, 40])
+            M = rs.randint(1, min(4, L-1))
+            histo = (rs.rand(L) < 0.5)*rs.randint(0, 20, L)
+            histo[rs.randint(L)] += 1
+            self.assertOptimal(histo, M)
+
+    def test_ties(self):
+        # the former exhaustive search returned (2, ), (2, 3, 4) and (2, )
+        histo = numpy.zeros(16)
+        histo[[2, 5, 8]] = 5
+        self.assertEqual(multi_otsu(histo, 1)[1], (2, ))
+        self.assertEqual(multi_otsu([0, 0, 5, 5, 0, 5, 0, 0], 3)[1], (1, 2, 3))
+        self.assertEqual(multi_otsu([5, 5, 5, 5, 5], 1)[1], (1, ))
+
+    def test_tie_tolerance(self):
+        # a tiny grey level between two peaks, the larger thresholds put it
+        # into the closer class, i.e. score a little better
+        for weight, thresholds in ((10*TIE_TOLERANCE, (1, )),
+                                   (1000*TIE_TOLERANCE, (2, ))):
+            histo = [10, 0, weight, 0, 0, 10]
+            combinations, scores = brute_force(histo, 1)
+            self.assertTrue((scores[1:] > scores[0]).all())
+
+            # within the tolerance the smaller threshold wins
+            difference = (scores[1] - scores[0])/scores[1]
+            self.assertEqual(difference < TIE_TOLERANCE,
+                             thresholds == (1, ))
+            self.assertEqual(multi_otsu(histo, 1)[1], thresholds)
+
+    def test_no_split(self):
+        self.assertEqual(multi_otsu([1, 2], 1), (0, ()))
+        self.assertEqual(multi_otsu([0, 0, 0, 0], 1), (0, ()))
+
+    def test_bins(self):
+        rs = numpy.random.RandomState(2)
+        values = numpy.clip(rs.normal(30000, 8000, 100000), 0, 65535)
+        histo = numpy.bincount(values.astype(int), minlength=65536)
+        score, thresholds = multi_otsu(histo, 2, bins=256)
+        self.assertEqual(len(thresholds), 2)
+        # thresholds are the last grey value of a bin
+        for t in thresholds:
+            self.assertEqual(t % 256, 255)
+
+
+if __name__ == '__main__':
+    unittest.main()
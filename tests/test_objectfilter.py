@@ -0,0 +1,211 @@
+"""
+test_objectfilter.py
+
+Compares the ObjectFilter of the segmentation plugins with the former
+filter, which evaluated a condition string for each object.
+"""
+
+__copyright__ = ('The CellCognition Project'
+                 'Copyright (c) 2006 - 2016'
+                 'Gerlich Lab, IMBA Vienna, Austria'
+                 'see AUTHORS.txt for contributions')
+__licence__ = 'LGPL'
+__url__ = 'www.cellcognition.org'
+
+
+import unittest
+
+import numpy
+
+from cecog.plugin.segmentation.objectfilter import ObjectFilter
+
+try:
+    from cecog.plugin.segmentation.strategies import \
+        SegmentationPluginPrimary2, SegmentationPluginPrimary3
+except ImportError:
+    # cecog.ccore or PyQt5 is not available
+    SegmentationPluginPrimary2 = SegmentationPluginPrimary3 = None
+
+
+class FakeObject(object):
+
+    def __init__(self, features):
+        self._features = features
+
+    def getFeatures(self):
+        return dict(self._features)
+
+
+class FakeContainer(object):
+    """Object container with precomputed features, getObjects returns a
+    copy like the ccore container."""
+
+    def __init__(self, features):
+        self._objects = dict((i, FakeObject(f))
+                             for i, f in enumerate(features, 1))
+        self.applied = set()
+        self.deleted = list()
+
+    def applyFeature(self, category):
+        self.applied.add(category)
+
+    def deleteFeatureCategory(self, category):
+        pass
+
+    def getObjects(self):
+        return dict(self._objects)
+
+    def delObject(self, obj_id):
+        self.deleted.append(obj_id)
+        del self._objects[obj_id]
+
+
+def eval_filter(container, roisize_minmax, intensity_minmax,
+                delete_objects=True, offset=0):
+    """Former postprocessing of the primary segmentation plugins."""
+    conditions = []
+    for idx, (roisize, intensity) in enumerate(
+        zip(roisize_minmax, intensity_minmax)):
+        cmprt = '>=' if idx == 0 else '<='
+        if roisize > -1:
+            conditions.append('roisize %s %d' % (cmprt, roisize))
+        if intensity > -1:
+            conditions.append('n2_avg %s %d' % (cmprt, intensity+offset))
+
+    objects = container.getObjects()
+    if not conditions:
+        return objects.keys(), []
+
+    conditions_str = ' and '.join(conditions)
+    valid_ids = []
+    rejected_ids = []
+    for obj_id, obj in objects.iteritems():
+        if not eval(conditions_str, obj.getFeatures()):
+            if delete_objects:
+                container.delObject(obj_id)
+            rejected_ids.append(obj_id)
+        else:
+            valid_ids.append(obj_id)
+    return valid_ids, rejected_ids
+
+
+def random_features(rs, nobjects):
+    return [dict(roisize=rs.randint(0, 200), n2_avg=rs.rand()*100)
+            for i in xrange(nobjects)]
+
+
+def random_minmax(rs):
+    return [rs.choice([-1, rs.randint(0, 200)]) for i in xrange(2)], \
+        [rs.choice([-1, rs.randint(0, 100)]) for i in xrange(2)]
+
+
+class TestObjectFilter(unittest.TestCase):
+
+    def apply(self, features, roisize_minmax, intensity_minmax,
+              delete_objects=True, offset=0):
+        container = FakeContainer(features)
+        ofilter = ObjectFilter.from_minmax(roisize_minmax, intensity_minmax,
+                                           offset)
+        valid_ids, rejected_ids = ofilter(container, delete_objects)
+        self.assertEqual(container.applied, ofilter.feature_categories)
+        self.assertEqual(sorted(container.deleted),
+                         sorted(rejected_ids) if delete_objects else [])
+        return valid_ids, rejected_ids
+
+    def test_disabled_bounds(self):
+        features = [dict(roisize=10, n2_avg=5.0),
+                    dict(roisize=1000, n2_avg=250.0)]
+        ofilter = ObjectFilter.from_minmax((-1, -1), (-1, -1))
+        self.assertEqual(len(ofilter), 0)
+        self.assertEqual(ofilter.valid(features).tolist(), [True, True])
+
+        # only the upper bound of the size
+        self.assertEqual(self.apply(features, (-1, 500), (-1, -1)),
+                         ([1], [2]))
+        # only the lower bound of the intensity
+        self.assertEqual(self.apply(features, (-1, -1), (100, -1)),
+                         ([2], [1]))
+
+    def test_inclusive_bounds(self):
+        features = [dict(roisize=v, n2_avg=float(v)) for v in (9, 10, 20, 21)]
+        self.assertEqual(self.apply(features, (10, 20), (-1, -1)),
+                         ([2, 3], [1, 4]))
+        self.assertEqual(self.apply(features, (-1, -1), (10, 20)),
+                         ([2, 3], [1, 4]))
+
+    def test_nan(self):
+        features = [dict(roisize=10, n2_avg=numpy.nan),
+                    dict(roisize=10, n2_avg=50.0)]
+        self.assertEqual(self.apply(features, (-1, -1), (0, -1)),
+                         ([2], [1]))
+        self.assertEqual(self.apply(features, (-1, -1), (-1, 100)),
+                         ([2], [1]))
+
+    def test_keep_objects(self):
+        features = [dict(roisize=v, n2_avg=1.0) for v in (5, 50, 500)]
+        container = FakeContainer(features)
+        ofilter = ObjectFilter.from_minmax((10, 100), (-1, -1))
+        self.assertEqual(ofilter(container, delete_objects=False),
+                         ([2], [1, 3]))
+        self.assertEqual(sorted(container.getObjects().keys()), [1, 2, 3])
+
+    def test_empty_container(self):
+        self.assertEqual(self.apply([], (10, 100), (1, 50)), ([], []))
+
+    def test_random(self):
+        rs = numpy.random.RandomState(0)
+        for trial in xrange(200):
+            features = random_features(rs, rs.randint(0, 30))
+            roisize_minmax, intensity_minmax = random_minmax(rs)
+            delete_objects = bool(rs.randint(2))
+            offset = rs.randint(0, 20)
+
+            reference = FakeContainer(features)
+            expected = eval_filter(reference, roisize_minmax,
+                                   intensity_minmax, delete_objects, offset)
+            found = self.apply(features, roisize_minmax, intensity_minmax,
+                               delete_objects, offset)
+            self.assertEqual(found, expected)
+
+
+@unittest.skipIf(SegmentationPluginPrimary2 is None,
+                 "cecog.ccore is not available")
+class TestPluginPostprocessing(unittest.TestCase):
+
+    def postprocessing(self, cls, features, roisize_minmax, intensity_minmax,
+                       offset):
+        plugin = cls.__new__(cls)
+        plugin.name = cls.NAME
+        container = FakeContainer(features)
+        plugin.postprocessing(container, True, roisize_minmax,
+                              intensity_minmax, offset=offset)
+        return container.valid_ids, container.rejected_ids
+
+    def test_offset_truncation(self):
+        # the background offset is a float, the intensity bounds are
+        # truncated to integers (formerly formatted with %d)
+        features = [dict(roisize=50, n2_avg=v)
+                    for v in (29.5, 30.0, 30.5, 60.0, 60.5, 61.0)]
+        for cls in (SegmentationPluginPrimary2, SegmentationPluginPrimary3):
+            self.assertEqual(
+                self.postprocessing(cls, features, (-1, -1), (20, 50), 10.7),
+                ([2, 3, 4], [1, 5, 6]))
+
+    def test_random(self):
+        rs = numpy.random.RandomState(1)
+        for cls in (SegmentationPluginPrimary2, SegmentationPluginPrimary3):
+            for trial in xrange(50):
+                features = random_features(rs, rs.randint(0, 30))
+                roisize_minmax, intensity_minmax = random_minmax(rs)
+                offset = rs.rand()*20
+                expected = eval_filter(FakeContainer(features),
+                                       roisize_minmax, intensity_minmax,
+                                       offset=offset)
+                self.assertEqual(
+                    self.postprocessing(cls, features, roisize_minmax,
+                                        intensity_minmax, offset),
+                    expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
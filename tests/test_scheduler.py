@@ -0,0 +1,287 @@
+"""
+test_scheduler.py
+
+Execution order and error handling of the StageScheduler and the stage
+graph of the CellAnalyzer.
+"""
+
+__copyright__ = ('The CellCognition Project'
+                 'Copyright (c) 2006 - 2016'
+                 'Gerlich Lab, IMBA Vienna, Austria'
+                 'see AUTHORS.txt for contributions')
+__licence__ = 'LGPL'
+__url__ = 'www.cellcognition.org'
+
+
+import time
+import threading
+import unittest
+from collections import OrderedDict
+
+import numpy
+
+from cecog.analyzer.scheduler import Stage, StageScheduler
+
+try:
+    from cecog.analyzer.analyzer import CellAnalyzer
+    from cecog.analyzer.channel import PrimaryChannel, SecondaryChannel, \
+        TertiaryChannel, MergedChannel
+except ImportError:
+    # cecog.ccore is not built
+    CellAnalyzer = None
+
+
+class Recorder(object):
+    """Thread safe log of the start and the end of the stages."""
+
+    def __init__(self):
+        super(Recorder, self).__init__()
+        self._lock = threading.Lock()
+        self.events = list()
+        self.threads = dict()
+
+    def stage(self, name, requires=(), delay=0.0, error=None):
+        def func():
+            with self._lock:
+                self.events.append(("start", name))
+                self.threads[name] = threading.current_thread()
+            time.sleep(delay)
+            if error is not None:
+                raise error
+            with self._lock:
+                self.events.append(("end", name))
+        return Stage(name, func, requires)
+
+    @property
+    def started(self):
+        return [name for event, name in self.events if event == "start"]
+
+
+def random_dag(rs, nstages):
+    """Stages in random order with random dependencies to earlier ones."""
+    requires = dict()
+    for i in xrange(nstages):
+        nreq = rs.randint(0, min(i, 3) + 1)
+        requires["s%d" %i] = ["s%d" %j
+                              for j in rs.choice(i, nreq, replace=False)]
+    names = ["s%d" %i for i in rs.permutation(nstages)]
+    return names, requires
+
+
+class TestStageScheduler(unittest.TestCase):
+
+    def assertDependencyOrder(self, recorder, stages):
+        position = dict((e, i) for i, e in enumerate(recorder.events))
+        for stage in stages:
+            self.assertIn(("end", stage.name), position)
+            for name in stage.requires:
+                self.assertLess(position[("end", name)],
+                                position[("start", stage.name)])
+
+    def test_sequential_order(self):
+        # given order as far as the dependencies allow
+        recorder = Recorder()
+        stages = [recorder.stage("c", ["a"]),
+                  recorder.stage("a"),
+                  recorder.stage("b"),
+                  recorder.stage("d", ["c", "b"])]
+        scheduler = StageScheduler(nthreads=1)
+        self.assertEqual([s.name for s in scheduler.sort(stages)],
+                         ["a", "c", "b", "d"])
+
+        scheduler.run(stages)
+        self.assertEqual(recorder.events,
+                         [(e, n) for n in "acbd" for e in ("start", "end")])
+        self.assertTrue(all(t is threading.current_thread()
+                            for t in recorder.threads.itervalues()))
+        self.assertEqual(scheduler.timings.keys(), list("acbd"))
+
+    def test_dependency_order(self):
+        rs = numpy.random.RandomState(0)
+        for nthreads in (1, 2, 4):
+            for trial in xrange(20):
+                recorder = Recorder()
+                names, requires = random_dag(rs, rs.randint(1, 12))
+                stages = [recorder.stage(n, requires[n], rs.rand()*0.002)
+                          for n in names]
+                scheduler = StageScheduler(nthreads)
+                scheduler.run(stages)
+                self.assertDependencyOrder(recorder, stages)
+                self.assertEqual(sorted(scheduler.timings.keys()),
+                                 sorted(names))
+
+    def test_concurrent(self):
+        # independent stages overlap
+        recorder = Recorder()
+        stages = [recorder.stage(n, delay=0.05) for n in "abc"]
+        StageScheduler(nthreads=3).run(stages)
+        self.assertEqual([e for e, n in recorder.events[:3]],
+                         ["start"]*3)
+
+    def test_unknown_stage(self):
+        stages = [Stage("a", None), Stage("b", None, ["a", "x"])]
+        self.assertRaisesRegexp(ValueError, "unknown stage",
+                                StageScheduler(2).run, stages)
+
+    def test_duplicate_name(self):
+        stages = [Stage("a", None), Stage("a", None)]
+        self.assertRaises(ValueError, StageScheduler.sort, stages)
+
+    def test_cycle(self):
+        recorder = Recorder()
+        stages = [recorder.stage("a"),
+                  recorder.stage("b", ["a", "d"]),
+                  recorder.stage("c", ["b"]),
+                  recorder.stage("d", ["c"])]
+        for nthreads in (1, 4):
+            self.assertRaisesRegexp(ValueError, "Cyclic",
+                                    StageScheduler(nthreads).run, stages)
+        # nothing runs
+        self.assertEqual(recorder.events, [])
+
+    def test_error_sequential(self):
+        recorder = Recorder()
+        stages = [recorder.stage("a"),
+                  recorder.stage("b", error=KeyError("b")),
+                  recorder.stage("c")]
+        self.assertRaises(KeyError, StageScheduler(1).run, stages)
+        self.assertEqual(recorder.started, ["a", "b"])
+
+    def test_error_threaded(self):
+        # b is still running when a fails, c (after b) is not started
+        recorder = Recorder()
+        stages = [recorder.stage("a", error=KeyError("a")),
+                  recorder.stage("b", delay=0.2),
+                  recorder.stage("c", ["b"]),
+                  recorder.stage("d", ["a"])]
+        with self.assertRaises(KeyError) as ctx:
+            StageScheduler(4).run(stages)
+        self.assertEqual(ctx.exception.args, ("a", ))
+        self.assertEqual(sorted(recorder.started), ["a", "b"])
+        # the running stage has finished before the error is raised
+        self.assertIn(("end", "b"), recorder.events)
+
+
+class FakePluginManager(object):
+
+    def __init__(self, name, requires):
+        super(FakePluginManager, self).__init__()
+        self.name = name
+        self._requires = requires
+
+    def required_managers(self):
+        return list(self._requires)
+
+
+class FakeTimeHolder(object):
+
+    def __init__(self):
+        super(FakeTimeHolder, self).__init__()
+        self.calls = list()
+
+    def prepare_raw_image(self, channel):
+        self.calls.append(("prepare", channel.NAME))
+
+    def apply_segmentation(self, channel, *args):
+        self.calls.append(("segment", channel.NAME))
+
+    def apply_features(self, channel):
+        self.calls.append(("features", channel.NAME))
+
+
+def fake_channel(cls, requires=(), merge_regions=None):
+    """Channel with a plugin manager whose plugins require the segmentation
+    of other channels, bypasses the plugin lookup of the constructor."""
+    channel = cls.__new__(cls)
+    channel.plugin_mgr = FakePluginManager(cls.NAME.lower(), requires)
+    channel.meta_image = None
+    if merge_regions is not None:
+        channel._merge_regions = OrderedDict(merge_regions)
+    return channel
+
+
+@unittest.skipIf(CellAnalyzer is None, "cecog.ccore is not available")
+class TestCellAnalyzerStages(unittest.TestCase):
+
+    def analyzer(self, channels, detect_objects=True):
+        analyzer = CellAnalyzer(FakeTimeHolder(), "0037", False, 1,
+                                detect_objects)
+        for channel in channels:
+            analyzer.register_channel(channel)
+        return analyzer
+
+    def graph(self, analyzer, extract_features=True):
+        return OrderedDict((s.name, sorted(s.requires))
+                           for s in analyzer.stages(extract_features))
+
+    def test_channels(self):
+        # registration order does not matter, plugins of the secondary and
+        # tertiary channel use the primary (and secondary) segmentation
+        channels = [
+            fake_channel(MergedChannel,
+                         merge_regions=[("Primary", "primary"),
+                                        ("Secondary", "expanded")]),
+            fake_channel(TertiaryChannel, ["primary", "secondary"]),
+            fake_channel(SecondaryChannel, ["primary"]),
+            fake_channel(PrimaryChannel)]
+        graph = self.graph(self.analyzer(channels))
+
+        self.assertEqual(graph, OrderedDict([
+            ("prepare:Primary", []),
+            ("segment:Primary", ["prepare:Primary"]),
+            ("features:Primary", ["segment:Primary"]),
+            ("prepare:Secondary", []),
+            ("segment:Secondary", ["prepare:Secondary", "segment:Primary"]),
+            ("features:Secondary", ["segment:Secondary"]),
+            ("prepare:Tertiary", []),
+            ("segment:Tertiary", ["prepare:Tertiary", "segment:Primary",
+                                  "segment:Secondary"]),
+            ("features:Tertiary", ["segment:Tertiary"]),
+            ("prepare:Merged", []),
+            ("segment:Merged", ["prepare:Merged", "prepare:Primary",
+                                "segment:Primary"]),
+            ("features:Merged", ["features:Primary", "features:Secondary",
+                                 "segment:Merged"])]))
+
+    def test_independent_channels(self):
+        # plugins without requirements, e.g. a secondary channel segmented
+        # on its own
+        channels = [fake_channel(PrimaryChannel),
+                    fake_channel(SecondaryChannel)]
+        graph = self.graph(self.analyzer(channels), extract_features=False)
+        self.assertEqual(graph, OrderedDict([
+            ("prepare:Primary", []),
+            ("segment:Primary", ["prepare:Primary"]),
+            ("prepare:Secondary", []),
+            ("segment:Secondary", ["prepare:Secondary"])]))
+
+    def test_no_detection(self):
+        channels = [fake_channel(PrimaryChannel),
+                    fake_channel(SecondaryChannel, ["primary"])]
+        graph = self.graph(self.analyzer(channels, detect_objects=False))
+        self.assertEqual(graph.keys(), ["prepare:Primary",
+                                        "prepare:Secondary"])
+
+    def test_tertiary_requires_secondary(self):
+        channels = [fake_channel(PrimaryChannel),
+                    fake_channel(TertiaryChannel, ["primary"])]
+        self.assertRaises(RuntimeError, self.analyzer(channels).stages)
+
+    def test_process(self):
+        channels = [fake_channel(SecondaryChannel, ["primary"]),
+                    fake_channel(PrimaryChannel)]
+        for nthreads in (1, 4):
+            analyzer = self.analyzer(channels)
+            analyzer.scheduler = StageScheduler(nthreads)
+            analyzer.scheduler.run(analyzer.stages())
+            calls = analyzer.timeholder.calls
+            self.assertEqual(sorted(calls), sorted(
+                    (stage, name) for stage in ("prepare", "segment",
+                                                "features")
+                    for name in ("Primary", "Secondary")))
+            self.assertLess(calls.index(("segment", "Primary")),
+                            calls.index(("segment", "Secondary")))
+
+
+if __name__ == '__main__':
+    unittest.main()
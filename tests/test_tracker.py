@@ -0,0 +1,183 @@
+"""
+test_tracker.py
+
+Compares the kd-tree candidate search of Tracker.connect_nodes with the
+former exhaustive search and sparse_assignment with a dense solution of
+the linear assignment problem.
+"""
+
+__copyright__ = ('The CellCognition Project'
+                 'Copyright (c) 2006 - 2016'
+                 'Gerlich Lab, IMBA Vienna, Austria'
+                 'see AUTHORS.txt for contributions')
+__licence__ = 'LGPL'
+__url__ = 'www.cellcognition.org'
+
+
+import unittest
+
+import numpy
+from scipy.optimize import linear_sum_assignment
+
+try:
+    from cecog.analyzer.tracker import Tracker, sparse_assignment
+except ImportError:
+    # cecog.ccore is not built
+    Tracker = sparse_assignment = None
+
+
+class Sample(object):
+
+    def __init__(self, center):
+        self.oCenterAbs = center
+
+
+def exhaustive_links(centers_p, centers_c, max_object_distance,
+                     max_node_degree):
+    """Edges (index in previous frame, index in current frame) of the former
+    connect_nodes, which compared all pairs of objects."""
+    max_dist2 = max_object_distance**2
+    merges = dict()
+    splits = dict()
+    for ip, (xp, yp) in enumerate(centers_p):
+        nearest = list()
+        for ic, (xc, yc) in enumerate(centers_c):
+            dist = float(xp - xc)**2 + float(yp - yc)**2
+            if dist < max_dist2:
+                nearest.append((dist, ic))
+        nearest.sort(key=lambda x: x[0])
+        for dist, ic in nearest[:max_node_degree]:
+            merges.setdefault(ic, []).append((dist, ip))
+            splits.setdefault(ip, []).append((dist, ic))
+
+    edges = set()
+    for ic, nodes in merges.iteritems():
+        found = False
+        if len(nodes) == 1:
+            edges.add((nodes[0][1], ic))
+            found = True
+        else:
+            for dist, ip in nodes:
+                if len(splits[ip]) == 1:
+                    edges.add((ip, ic))
+                    found = True
+        if not found:
+            edges.add((nodes[0][1], ic))
+    return edges
+
+
+@unittest.skipIf(Tracker is None, "cecog.ccore is not available")
+class TestConnectNodes(unittest.TestCase):
+
+    def links(self, centers_p, centers_c, max_object_distance=10,
+              max_node_degree=3):
+        tracker = Tracker(max_object_distance, max_node_degree, 1)
+        for frame, centers in enumerate((centers_p, centers_c)):
+            tracker.track_next_frame(frame, dict(
+                    (label, Sample(tuple(center)))
+                    for label, center in enumerate(centers, 1)))
+
+        edges = set()
+        for edgeid in tracker.graph.edge_list():
+            head = tracker.split_nodeid(tracker.graph.head(edgeid))
+            tail = tracker.split_nodeid(tracker.graph.tail(edgeid))
+            self.assertEqual((head[0], tail[0]), (0, 1))
+            edges.add((head[1]-1, tail[1]-1))
+        return edges
+
+    def assertSameLinks(self, centers_p, centers_c, max_object_distance=10,
+                        max_node_degree=3):
+        self.assertEqual(
+            self.links(centers_p, centers_c, max_object_distance,
+                       max_node_degree),
+            exhaustive_links(centers_p, centers_c, max_object_distance,
+                             max_node_degree))
+
+    def test_merge(self):
+        # two objects move onto one
+        centers_p = [(10, 10), (16, 10), (60, 60)]
+        centers_c = [(13, 10), (61, 60)]
+        edges = self.links(centers_p, centers_c)
+        self.assertEqual(edges, set([(0, 0), (1, 0), (2, 1)]))
+        self.assertSameLinks(centers_p, centers_c)
+
+    def test_split(self):
+        # one object divides
+        centers_p = [(30, 30), (80, 10)]
+        centers_c = [(27, 30), (33, 30), (80, 12)]
+        edges = self.links(centers_p, centers_c)
+        self.assertEqual(edges, set([(0, 0), (0, 1), (1, 2)]))
+        self.assertSameLinks(centers_p, centers_c)
+
+    def test_distance_limit(self):
+        # candidates at exactly max_object_distance are not linked
+        self.assertEqual(self.links([(0, 0)], [(10, 0)]), set())
+        self.assertEqual(self.links([(0, 0)], [(6, 8)]), set())
+        self.assertEqual(self.links([(0, 0)], [(9, 0)]), set([(0, 0)]))
+
+    def test_empty_frame(self):
+        self.assertEqual(self.links([(0, 0)], []), set())
+
+    def test_random(self):
+        rs = numpy.random.RandomState(0)
+        for trial in xrange(30):
+            n = rs.randint(1, 80)
+            # dense objects with integer centers, i.e. many merge and split
+            # candidates and ties of the distance
+            centers_p = rs.randint(0, 100, (n, 2))
+            centers_c = numpy.r_[centers_p[rs.rand(n) < 0.9],
+                                 centers_p[rs.rand(n) < 0.2],
+                                 rs.randint(0, 100, (3, 2))]
+            centers_c += rs.randint(-6, 7, centers_c.shape)
+            self.assertSameLinks(centers_p.tolist(), centers_c.tolist(),
+                                 max_object_distance=rs.choice([5, 10, 20]),
+                                 max_node_degree=rs.choice([1, 2, 3]))
+
+
+@unittest.skipIf(sparse_assignment is None, "cecog.ccore is not available")
+class TestSparseAssignment(unittest.TestCase):
+
+    def assertOptimal(self, admissible, costs, alternative):
+        nrows, ncols = costs.shape
+        rows, cols = numpy.nonzero(admissible)
+        linked_rows, linked_cols = sparse_assignment(
+            rows, cols, costs[rows, cols], nrows, ncols, alternative)
+
+        # a valid assignment of admissible links
+        self.assertEqual(len(set(linked_rows)), len(linked_rows))
+        self.assertEqual(len(set(linked_cols)), len(linked_cols))
+        self.assertTrue(admissible[linked_rows, linked_cols].all())
+        cost = costs[linked_rows, linked_cols].sum() + \
+            alternative*(nrows - linked_rows.size)
+
+        # dense problem, each row has a private column for 'no link'
+        dense = numpy.empty((nrows, ncols + nrows))
+        dense.fill(1e6)
+        dense[:, :ncols][admissible] = costs[admissible]
+        dense[numpy.arange(nrows), ncols + numpy.arange(nrows)] = alternative
+        i, j = linear_sum_assignment(dense)
+        self.assertAlmostEqual(cost, dense[i, j].sum(), places=9)
+
+    def test_random(self):
+        rs = numpy.random.RandomState(3)
+        for trial in xrange(300):
+            shape = rs.randint(1, 12, 2)
+            admissible = rs.rand(*shape) < rs.choice([0.2, 0.5, 1.0])
+            costs = rs.rand(*shape)
+            self.assertOptimal(admissible, costs, rs.choice([0.3, 0.8, 2.0]))
+
+    def test_no_links(self):
+        rows, cols = sparse_assignment([], [], [], 3, 2, 1.0)
+        self.assertEqual((rows.size, cols.size), (0, 0))
+
+    def test_alternative(self):
+        # a link is cheaper than leaving a row unlinked, but the second row
+        # takes the column at a lower total cost
+        costs = numpy.array([[0.5], [0.1]])
+        rows, cols = sparse_assignment([0, 1], [0, 0], [0.5, 0.1], 2, 1, 1.0)
+        self.assertEqual(rows.tolist(), [1])
+        self.assertOptimal(numpy.ones((2, 1), dtype=bool), costs, 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()